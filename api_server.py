@@ -0,0 +1,422 @@
+# Financial Document Analyzer - Local HTTP API
+# Purpose: Serve the static dashboard and run real analyses behind it: streamed ZIP uploads,
+#          background jobs, per-file progress over Server-Sent Events, cancellation, JSON results
+#          and Excel reports
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from archive_limits import ArchiveLimits, ArchiveRejected, check_archive
+from cost_estimator import CostModel, estimate_members, format_seconds
+from financial_document_analyzer import (AnalysisCancelled, CancellationToken, FinancialDocumentAnalyzer,
+                                         generate_excel_report)
+from metrics import CONTENT_TYPE, REGISTRY
+from page_columns import results_to_dict
+from results_store import save_results
+
+logger = logging.getLogger("financial_analyzer.api")
+
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+DEFAULT_MAX_UPLOAD_BYTES = 2 * 1024 ** 3
+MAX_RETAINED_JOBS = 100
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class AnalysisJob:
+    """State of one uploaded bundle: lifecycle status, progress events and results"""
+
+    def __init__(self, filename: str, upload_path: str, client: Optional[str] = None, period: Optional[str] = None,
+                 estimate: Optional[Dict] = None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.upload_path = upload_path
+        self.client = client
+        self.period = period
+        self.estimate = estimate
+        self.bundle_id: Optional[int] = None
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.events: List[Dict] = []
+        self.results: Optional[Dict] = None
+        self.report: Optional[bytes] = None
+        self.error: Optional[str] = None
+        self.cancel_token = CancellationToken()
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def publish(self, event: Dict):
+        """Record an event and wake every SSE subscriber (must run on the event loop)"""
+        self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self, seen: int):
+        """Wait until more than `seen` events exist or the job has finished"""
+        while len(self.events) <= seen and not self.finished:
+            await self._changed.wait()
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'created_at': self.created_at,
+            'progress': self.events[-1] if self.events else None,
+            'estimated_pages': self.estimate['total_pages'] if self.estimate else None,
+            'estimated_seconds': self.estimate['seconds'] if self.estimate else None,
+            'bundle_id': self.bundle_id,
+            'error': self.error
+        }
+
+
+class JobManager:
+    """Run analysis pipelines on threads of their own, parsing PDFs on one shared supervised process pool
+
+    Each pipeline runs its own event loop on an analysis thread, so its aggregation (summaries,
+    rules, checkpoint and text index writes) never holds up the server's loop, which only relays
+    the pipeline's progress events to SSE subscribers.
+    """
+
+    def __init__(self, max_concurrent: int = 2, parse_workers: Optional[int] = None,
+                 memory_budget_mb: Optional[int] = None, max_files_per_worker: Optional[int] = None,
+                 results_db: Optional[str] = None, max_estimated_seconds: Optional[float] = None):
+        self.jobs: Dict[str, AnalysisJob] = {}
+        self.results_db = results_db
+        self.archive_limits = ArchiveLimits.from_env()
+        self.cost_model = CostModel.load(os.environ.get('FDA_COST_MODEL') or None)
+        # Admission: bundles estimated to take longer than this are refused at upload
+        self.max_estimated_seconds = max_estimated_seconds
+        self.max_concurrent = max_concurrent
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.pool = FinancialDocumentAnalyzer(max_workers=self.parse_workers, memory_budget_mb=memory_budget_mb,
+                                              max_files_per_worker=max_files_per_worker).create_worker_pool()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="report")
+        self.analysis_executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="analysis")
+        # Page-tree estimates decompress whole bundles; they get a thread of their own, not the report threads
+        self.preflight_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preflight")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    def add(self, job: AnalysisJob):
+        self.jobs[job.id] = job
+        # Drop the oldest finished jobs once the retention limit is reached
+        finished = [j for j in self.jobs.values() if j.finished]
+        for old in sorted(finished, key=lambda j: j.created_at)[:max(0, len(self.jobs) - MAX_RETAINED_JOBS)]:
+            del self.jobs[old.id]
+
+    def start(self, job: AnalysisJob):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        task = job.task = asyncio.ensure_future(self._run(job))
+        # Hold a reference so the task is not garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: AnalysisJob):
+        analyzer = FinancialDocumentAnalyzer(max_workers=self.parse_workers, executor=self.pool,
+                                             archive_limits=self.archive_limits, cost_model=self.cost_model)
+        try:
+            # Counted while the job waits for a slot; replaces the central-directory estimate it was admitted on
+            loop = asyncio.get_running_loop()
+            job.estimate = await loop.run_in_executor(self.preflight_executor, analyzer.preflight, job.upload_path)
+            async with self._slots:
+                job.status = 'running'
+                # Events come from the analysis thread; publish() belongs to this loop
+                publish = lambda event: loop.call_soon_threadsafe(job.publish, event)
+                job.results = await loop.run_in_executor(self.analysis_executor, functools.partial(
+                    analyzer.analyze_zip_file, job.upload_path, progress_callback=publish,
+                    cancel_token=job.cancel_token, estimate=job.estimate))
+            if self.results_db:
+                job.bundle_id = await loop.run_in_executor(self.executor, save_results, self.results_db, job.results,
+                                                           job.client, job.period, job.filename)
+            job.status = 'completed'
+            job.publish({'event': 'completed'})
+        except (AnalysisCancelled, asyncio.CancelledError):
+            shutting_down = not job.cancel_token.cancelled
+            # The analysis thread is not stopped by cancelling this task; the token stops it
+            job.cancel_token.cancel()
+            job.status = 'cancelled'
+            job.publish({'event': 'cancelled'})
+            if shutting_down:
+                # Server shutdown rather than a cancel request
+                raise
+        except Exception as e:
+            logger.exception("Analysis of %s failed", job.filename)
+            job.status = 'failed'
+            job.error = str(e)
+            job.publish({'event': 'failed', 'error': job.error})
+        finally:
+            try:
+                os.unlink(job.upload_path)
+            except OSError:
+                pass
+
+    def admission_estimate(self, members: List[zipfile.ZipInfo]) -> Dict:
+        """Estimate of an upload from its central directory alone, cheap enough for the upload request"""
+        return estimate_members(members, self.cost_model, self.parse_workers)
+
+    def admission_error(self, estimate: Dict) -> Optional[str]:
+        """Why a bundle with this estimate is refused, or None to queue it"""
+        if self.max_estimated_seconds is not None and estimate['seconds'] > self.max_estimated_seconds:
+            return (f"Estimated to take {format_seconds(estimate['seconds'])} for {estimate['total_pages']} pages "
+                    f"(limit {format_seconds(self.max_estimated_seconds)})")
+        return None
+
+    def cancel(self, job: AnalysisJob) -> bool:
+        """Stop a queued or running job; its parse workers go straight back to the other jobs"""
+        if job.finished:
+            return False
+        job.cancel_token.cancel()
+        if job.status == 'queued' and job.task is not None:
+            # Still waiting for a slot: leave the queue now rather than when a slot frees up
+            job.task.cancel()
+        return True
+
+    async def report(self, job: AnalysisJob) -> bytes:
+        """Build the Excel report once, off the event loop, and cache it on the job"""
+        if job.report is None:
+            loop = asyncio.get_running_loop()
+            job.report = await loop.run_in_executor(self.executor, generate_excel_report, job.results)
+        return job.report
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.analysis_executor.shutdown(wait=False, cancel_futures=True)
+        self.preflight_executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _get_job(request: web.Request) -> AnalysisJob:
+    job = request.app['jobs'].jobs.get(request.match_info['job_id'])
+    if job is None:
+        raise web.HTTPNotFound(text="Unknown job")
+    return job
+
+
+async def _stream_upload(request: web.Request, destination: str) -> str:
+    """Copy the request body to disk chunk by chunk and return the client's filename"""
+    max_bytes = request.app['max_upload_bytes']
+    filename = request.query.get('filename', 'upload.zip')
+
+    if request.content_type.startswith('multipart/'):
+        reader = await request.multipart()
+        part = await reader.next()
+        while part is not None and part.filename is None:
+            part = await reader.next()
+        if part is None:
+            raise web.HTTPBadRequest(text="No file part in upload")
+        filename = part.filename
+        read_chunk = lambda: part.read_chunk(UPLOAD_CHUNK_SIZE)
+    else:
+        read_chunk = lambda: request.content.read(UPLOAD_CHUNK_SIZE)
+
+    written = 0
+    with open(destination, 'wb') as f:
+        while True:
+            chunk = await read_chunk()
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise web.HTTPRequestEntityTooLarge(max_size=max_bytes, actual_size=written)
+            f.write(chunk)
+
+    if written == 0:
+        raise web.HTTPBadRequest(text="Empty upload")
+    return os.path.basename(filename)
+
+
+async def create_job(request: web.Request) -> web.Response:
+    """POST /api/jobs - stream a ZIP to disk and start analyzing it (optional ?client=&period= for the history)"""
+    fd, upload_path = tempfile.mkstemp(suffix='.zip', dir=request.app['upload_dir'])
+    os.close(fd)
+
+    try:
+        filename = await _stream_upload(request, upload_path)
+    except BaseException:
+        os.unlink(upload_path)
+        raise
+
+    if not filename.lower().endswith('.zip'):
+        os.unlink(upload_path)
+        raise web.HTTPBadRequest(text="Only ZIP files are accepted")
+
+    manager: JobManager = request.app['jobs']
+    try:
+        # Central directory only: a zip bomb is turned away before it is queued
+        members = check_archive(upload_path, manager.archive_limits)
+    except ArchiveRejected as e:
+        os.unlink(upload_path)
+        raise web.HTTPUnprocessableEntity(text=f"Archive rejected: {e}")
+    # Pages guessed from member sizes; the job counts them from the page trees before it runs
+    estimate = manager.admission_estimate(members)
+    refused = manager.admission_error(estimate)
+    if refused:
+        os.unlink(upload_path)
+        raise web.HTTPUnprocessableEntity(text=f"Bundle refused: {refused}")
+
+    job = AnalysisJob(filename, upload_path, request.query.get('client'), request.query.get('period'), estimate)
+    manager.add(job)
+    manager.start(job)
+    return web.json_response(job.to_dict(), status=202)
+
+
+async def get_job(request: web.Request) -> web.Response:
+    """GET /api/jobs/{id} - job status, with the analysis results once completed"""
+    job = _get_job(request)
+    body = job.to_dict()
+    if job.status == 'completed':
+        body['results'] = results_to_dict(job.results)
+    return web.json_response(body)
+
+
+async def job_events(request: web.Request) -> web.StreamResponse:
+    """GET /api/jobs/{id}/events - replay and follow progress events as Server-Sent Events"""
+    job = _get_job(request)
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    await response.prepare(request)
+
+    sent = 0
+    while True:
+        while sent < len(job.events):
+            event = job.events[sent]
+            payload = f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            await response.write(payload.encode('utf-8'))
+            sent += 1
+        if job.finished:
+            break
+        await job.wait_for_change(sent)
+
+    return response
+
+
+async def cancel_job(request: web.Request) -> web.Response:
+    """POST /api/jobs/{id}/cancel - stop a queued or running analysis"""
+    job = _get_job(request)
+    if not request.app['jobs'].cancel(job):
+        raise web.HTTPConflict(text=f"Job is {job.status}")
+    return web.json_response(job.to_dict(), status=202)
+
+
+async def job_report(request: web.Request) -> web.Response:
+    """GET /api/jobs/{id}/report - Excel report for a completed job"""
+    job = _get_job(request)
+    if job.status != 'completed':
+        raise web.HTTPConflict(text=f"Job is {job.status}")
+
+    report = await request.app['jobs'].report(job)
+    stem, _ = os.path.splitext(job.filename)
+    return web.Response(body=report, content_type=EXCEL_MIME, headers={
+        'Content-Disposition': f'attachment; filename="{stem}_analysis_report.xlsx"'
+    })
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """GET /metrics - analyzer metrics in the Prometheus text exposition format"""
+    return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+def _static(name: str):
+    async def handler(request: web.Request) -> web.FileResponse:
+        return web.FileResponse(os.path.join(STATIC_DIR, name))
+    return handler
+
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler):
+    origin = request.app['cors_origin']
+    if request.method == 'OPTIONS' and origin:
+        response = web.Response()
+    else:
+        response = await handler(request)
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    return response
+
+
+def create_app(upload_dir: Optional[str] = None, max_concurrent: int = 2,
+               parse_workers: Optional[int] = None,
+               max_upload_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+               cors_origin: Optional[str] = None, memory_budget_mb: Optional[int] = None,
+               max_files_per_worker: Optional[int] = None, results_db: Optional[str] = None,
+               max_estimated_seconds: Optional[float] = None) -> web.Application:
+    app = web.Application(middlewares=[cors_middleware])
+    app['upload_dir'] = upload_dir or tempfile.gettempdir()
+    app['max_upload_bytes'] = max_upload_bytes
+    app['cors_origin'] = cors_origin
+    app['jobs'] = JobManager(max_concurrent, parse_workers, memory_budget_mb, max_files_per_worker, results_db,
+                             max_estimated_seconds)
+
+    app.router.add_post('/api/jobs', create_job)
+    app.router.add_get('/api/jobs/{job_id}', get_job)
+    app.router.add_get('/api/jobs/{job_id}/events', job_events)
+    app.router.add_post('/api/jobs/{job_id}/cancel', cancel_job)
+    app.router.add_get('/api/jobs/{job_id}/report', job_report)
+    app.router.add_get('/metrics', metrics_endpoint)
+
+    app.router.add_get('/', _static('index.html'))
+    for name in ('index.html', 'app.js', 'style.css'):
+        app.router.add_get(f'/{name}', _static(name))
+
+    async def on_cleanup(app: web.Application):
+        app['jobs'].shutdown()
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local HTTP API for the Financial Document Analyzer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="Analyses run concurrently")
+    parser.add_argument("--parse-workers", type=int, default=None,
+                        help="Processes shared by all jobs for PDF parsing (default: CPU count)")
+    parser.add_argument("--upload-dir", default=None, help="Where uploads are spooled (default: system temp)")
+    parser.add_argument("--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD_BYTES // 1024 ** 2)
+    parser.add_argument("--cors-origin", default=None,
+                        help="Allowed origin when the dashboard is hosted elsewhere")
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help="Skip a PDF whose parse worker grows past this RSS (default: FDA_MEMORY_BUDGET_MB)")
+    parser.add_argument("--max-files-per-worker", type=int, default=None,
+                        help="Replace each parse worker after this many PDFs (default: FDA_MAX_FILES_PER_WORKER)")
+    parser.add_argument("--results-db", default=os.environ.get('FDA_RESULTS_DB'),
+                        help="Store every completed analysis in this results database (default: FDA_RESULTS_DB)")
+    parser.add_argument("--max-estimated-minutes", type=float,
+                        default=float(os.environ.get('FDA_MAX_ESTIMATED_MINUTES') or 0),
+                        help="Refuse bundles estimated to take longer than this at upload; 0 accepts all "
+                             "(default: FDA_MAX_ESTIMATED_MINUTES)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    app = create_app(upload_dir=args.upload_dir, max_concurrent=args.workers,
+                     parse_workers=args.parse_workers, max_upload_bytes=args.max_upload_mb * 1024 ** 2, cors_origin=args.cors_origin,
+                     memory_budget_mb=args.memory_budget_mb, max_files_per_worker=args.max_files_per_worker,
+                     results_db=args.results_db, max_estimated_seconds=args.max_estimated_minutes * 60 or None)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
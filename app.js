@@ -1,6 +1,11 @@
 // Application state
 let analysisData = null;
 let currentFile = null;
+let currentJobId = null;
+let jobEvents = null;
+
+// Analyzer API (served by api_server.py); override when the dashboard is hosted elsewhere
+const API_BASE = window.ANALYZER_API_BASE || '';
 
 // Sample data for simulation
 const sampleData = {
@@ -84,6 +89,7 @@ const fileInput = document.getElementById('fileInput');
 const selectFileBtn = document.getElementById('selectFileBtn');
 const uploadStatus = document.getElementById('uploadStatus');
 const resetBtn = document.getElementById('resetBtn');
+const cancelBtn = document.getElementById('cancelBtn');
 const progressFill = document.getElementById('progressFill');
 const progressText = document.getElementById('progressText');
 const generateReportBtn = document.getElementById('generateReportBtn');
@@ -168,6 +174,7 @@ function initializeFileUpload() {
     
     // Reset button
     resetBtn.addEventListener('click', resetUpload);
+    cancelBtn.addEventListener('click', cancelAnalysis);
 }
 
 function handleDragOver(e) {
@@ -227,7 +234,11 @@ function processFile(file, isDemoMode = false) {
     uploadArea.style.display = 'none';
     uploadStatus.classList.remove('hidden');
     
-    startAnalysis();
+    if (isDemoMode) {
+        startAnalysis();
+    } else {
+        uploadAndAnalyze(file);
+    }
 }
 
 function formatFileSize(bytes) {
@@ -253,8 +264,140 @@ function startAnalysis() {
     }, 200);
 }
 
-function completeAnalysis() {
-    analysisData = sampleData;
+// Real analysis: stream the ZIP to the API, then follow per-file progress events
+async function uploadAndAnalyze(file) {
+    setProgress(0, 'Uploading...');
+    
+    try {
+        const response = await fetch(`${API_BASE}/api/jobs?filename=${encodeURIComponent(file.name)}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/zip' },
+            body: file
+        });
+        if (!response.ok) {
+            throw new Error(await response.text());
+        }
+        const job = await response.json();
+        currentJobId = job.job_id;
+        cancelBtn.classList.remove('hidden');
+        followJobEvents(job.job_id);
+    } catch (error) {
+        showAlert(`Upload failed: ${error.message}`, 'error');
+        setProgress(0, 'Failed');
+    }
+}
+
+function followJobEvents(jobId) {
+    jobEvents = new EventSource(`${API_BASE}/api/jobs/${jobId}/events`);
+    
+    jobEvents.addEventListener('started', event => {
+        const data = JSON.parse(event.data);
+        const estimate = data.estimated_seconds != null ? `, about ${formatDuration(data.estimated_seconds)}` : '';
+        setProgress(0, `0 / ${data.total_files} files${estimate}`);
+    });
+    
+    jobEvents.addEventListener('file', event => {
+        const data = JSON.parse(event.data);
+        const percent = data.total_files ? (data.index / data.total_files) * 100 : 100;
+        const eta = data.eta_seconds != null && data.index < data.total_files
+            ? `, about ${formatDuration(data.eta_seconds)} left` : '';
+        setProgress(percent, `${Math.round(percent)}% (${data.index} / ${data.total_files} files${eta})`);
+    });
+    
+    jobEvents.addEventListener('completed', async () => {
+        closeJobEvents();
+        try {
+            const response = await fetch(`${API_BASE}/api/jobs/${jobId}`);
+            const job = await response.json();
+            setProgress(100, '100%');
+            completeAnalysis(normalizeResults(job.results));
+        } catch (error) {
+            showAlert(`Could not load results: ${error.message}`, 'error');
+        }
+    });
+    
+    jobEvents.addEventListener('failed', event => {
+        closeJobEvents();
+        const data = JSON.parse(event.data);
+        showAlert(`Analysis failed: ${data.error}`, 'error');
+        setProgress(0, 'Failed');
+    });
+    
+    jobEvents.addEventListener('cancelled', () => {
+        closeJobEvents();
+        showAlert('Analysis cancelled', 'info');
+        setProgress(0, 'Cancelled');
+    });
+}
+
+// '45s', '12 min' or '2.5 h', as the cost estimator prints them
+function formatDuration(seconds) {
+    if (seconds < 90) return `${Math.round(seconds)}s`;
+    if (seconds < 90 * 60) return `${Math.round(seconds / 60)} min`;
+    return `${(seconds / 3600).toFixed(1)} h`;
+}
+
+// Ask the API to stop the running job; the 'cancelled' event confirms it
+async function cancelAnalysis() {
+    if (!currentJobId) return;
+    cancelBtn.disabled = true;
+    try {
+        const response = await fetch(`${API_BASE}/api/jobs/${currentJobId}/cancel`, { method: 'POST' });
+        if (!response.ok && response.status !== 409) {
+            throw new Error(await response.text());
+        }
+    } catch (error) {
+        showAlert(`Could not cancel: ${error.message}`, 'error');
+        cancelBtn.disabled = false;
+    }
+}
+
+function closeJobEvents() {
+    if (jobEvents) {
+        jobEvents.close();
+        jobEvents = null;
+    }
+    cancelBtn.classList.add('hidden');
+    cancelBtn.disabled = false;
+}
+
+function setProgress(percent, label) {
+    progressFill.style.width = percent + '%';
+    progressText.textContent = label;
+}
+
+// Fill in the display fields the dashboard expects but the analyzer does not return
+function normalizeResults(results) {
+    const rpv = results.receipt_payment_verification;
+    const tbv = results.trial_balance_verification;
+    
+    return {
+        ...results,
+        // Files the analyzer skipped (e.g. "skipped: memory budget") are flagged as issues
+        file_analysis: results.file_analysis.map(file => ({
+            ...file,
+            analysis_status: file.status,
+            status: file.status && file.status !== 'analyzed' ? 'Issues' : 'Complete'
+        })),
+        receipt_payment_verification: {
+            receipt_total: 0,
+            payment_total: 0,
+            difference: 0,
+            ...rpv,
+            status: rpv.status || (rpv.equal ? 'Balanced' : 'Unbalanced')
+        },
+        trial_balance_verification: {
+            file1_total: 0,
+            file2_total: 0,
+            difference: 0,
+            ...tbv,
+            status: tbv.status || (tbv.consistent ? 'Consistent' : 'Inconsistent')
+        }
+    };
+}
+
+function completeAnalysis(data = sampleData) {
+    analysisData = data;
     updateDashboard();
     updateMissingFiles();
     updateValidation();
@@ -272,7 +415,13 @@ function completeAnalysis() {
 function resetUpload() {
     uploadArea.style.display = 'block';
     uploadStatus.classList.add('hidden');
+    if (jobEvents) {
+        // Still running: stop it rather than leave it parsing in the background
+        cancelAnalysis();
+    }
+    closeJobEvents();
     currentFile = null;
+    currentJobId = null;
     analysisData = null;
     fileInput.value = '';
     progressFill.style.width = '0%';
@@ -531,11 +680,21 @@ function generateReport() {
 }
 
 function completeReportGeneration() {
-    // Simulate Excel file download
-    const reportData = generateReportData();
     const filename = `Financial_Analysis_Report_${new Date().toISOString().split('T')[0]}.xlsx`;
     
-    // Create a simulated download experience
+    if (currentJobId) {
+        // Download the Excel report built by the analyzer
+        const link = document.createElement('a');
+        link.href = `${API_BASE}/api/jobs/${currentJobId}/report`;
+        link.download = filename;
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+    } else {
+        // Demo mode: simulate the download
+        generateReportData();
+    }
+    
     showAlert(`📊 Report generated successfully! Filename: ${filename}`, 'success');
     
     // Reset progress after delay
@@ -0,0 +1,177 @@
+# Financial Document Analyzer - Archive Limits
+# Purpose: Refuse hostile or accidental archives before any work is scheduled. The ZIP central
+#          directory is checked against member count, uncompressed size and compression ratio
+#          limits and for unsafe paths, symlinks and encryption; the same limits are enforced again
+#          while members are decompressed, since the directory's sizes are only the archive's claim
+
+import os
+import posixpath
+import stat
+import zipfile
+import zlib
+from typing import BinaryIO, List, Optional
+
+from metrics import REGISTRY
+
+ARCHIVES_REJECTED = REGISTRY.counter('fda_archives_rejected_total', 'ZIP archives refused by the ingestion limits',
+                                     ['reason'])
+
+DEFAULT_MAX_MEMBERS = 10000
+DEFAULT_MAX_MB = 8 * 1024
+DEFAULT_MAX_RATIO = 100
+DEFAULT_MAX_PAGES = 10000
+# Members smaller than this are not held to the ratio limit: a few kilobytes of a blank form
+# compress far beyond any bomb threshold without doing harm
+RATIO_MIN_BYTES = 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class ArchiveRejected(ValueError):
+    """An archive broke an ingestion limit; reason is a short label ('members', 'size', 'ratio',
+    'path', 'symlink', 'encrypted', 'corrupt') and the message says which member and limit"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+    def __reduce__(self):
+        return type(self), (self.reason, str(self))
+
+
+class PageLimitExceeded(Exception):
+    """A PDF has more pages than the per-file page limit"""
+
+    def __init__(self, pages: int, limit: int):
+        super().__init__(f"{pages} pages (limit {limit})")
+        self.pages = pages
+        self.limit = limit
+
+    def __reduce__(self):
+        return type(self), (self.pages, self.limit)
+
+
+def _env_limit(name: str, default: int) -> Optional[int]:
+    """A limit from the environment; 0 turns it off"""
+    value = os.environ.get(name, '').strip()
+    limit = int(value) if value else default
+    return limit or None
+
+
+class ArchiveLimits:
+    """Ingestion limits for one archive; None turns a limit off
+
+    max_members: entries in the central directory, folders included
+    max_bytes: uncompressed size of all members together
+    max_ratio: uncompressed to compressed size of one member (members under 1 MB are exempt)
+    max_pages: pages of one PDF; a longer PDF is skipped, not the whole archive
+    """
+
+    def __init__(self, max_members: Optional[int] = DEFAULT_MAX_MEMBERS,
+                 max_bytes: Optional[int] = DEFAULT_MAX_MB * 1024 ** 2,
+                 max_ratio: Optional[float] = DEFAULT_MAX_RATIO, max_pages: Optional[int] = DEFAULT_MAX_PAGES):
+        self.max_members = max_members
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self.max_pages = max_pages
+
+    @classmethod
+    def from_env(cls) -> 'ArchiveLimits':
+        """Limits from FDA_ZIP_MAX_MEMBERS, FDA_ZIP_MAX_MB, FDA_ZIP_MAX_RATIO and FDA_PDF_MAX_PAGES"""
+        max_mb = _env_limit('FDA_ZIP_MAX_MB', DEFAULT_MAX_MB)
+        return cls(max_members=_env_limit('FDA_ZIP_MAX_MEMBERS', DEFAULT_MAX_MEMBERS),
+                   max_bytes=max_mb * 1024 ** 2 if max_mb else None,
+                   max_ratio=_env_limit('FDA_ZIP_MAX_RATIO', DEFAULT_MAX_RATIO),
+                   max_pages=_env_limit('FDA_PDF_MAX_PAGES', DEFAULT_MAX_PAGES))
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def _reject(reason: str, message: str) -> ArchiveRejected:
+    ARCHIVES_REJECTED.labels(reason=reason).inc()
+    return ArchiveRejected(reason, message)
+
+
+def is_unsafe_path(name: str) -> bool:
+    """Absolute paths, drive letters and '..' components could write outside the extraction folder"""
+    name = name.replace('\\', '/')
+    return name.startswith('/') or (len(name) > 1 and name[1] == ':') or '..' in posixpath.normpath(name).split('/')
+
+
+def is_symlink(info: zipfile.ZipInfo) -> bool:
+    return info.create_system == 3 and stat.S_ISLNK(info.external_attr >> 16)
+
+
+def check_members(members: List[zipfile.ZipInfo], limits: ArchiveLimits):
+    """Check a central directory against the limits; raises ArchiveRejected on the first breach"""
+    if limits.max_members is not None and len(members) > limits.max_members:
+        raise _reject('members', f"{len(members)} archive members (limit {limits.max_members})")
+    total = 0
+    for info in members:
+        if is_unsafe_path(info.filename):
+            raise _reject('path', f"{info.filename}: path leaves the archive folder")
+        if is_symlink(info):
+            raise _reject('symlink', f"{info.filename}: symbolic link")
+        if info.flag_bits & 0x1:
+            raise _reject('encrypted', f"{info.filename}: encrypted member")
+        if (limits.max_ratio is not None and info.file_size >= RATIO_MIN_BYTES
+                and info.file_size > limits.max_ratio * max(info.compress_size, 1)):
+            raise _reject('ratio', f"{info.filename}: expands {info.file_size / max(info.compress_size, 1):.0f}x "
+                                   f"(limit {limits.max_ratio:g}x)")
+        total += info.file_size
+        if limits.max_bytes is not None and total > limits.max_bytes:
+            raise _reject('size', f"more than {limits.max_bytes / 1024 ** 2:.0f} MB uncompressed "
+                                  f"(limit reached at {info.filename})")
+
+
+def open_archive(zip_path: str) -> zipfile.ZipFile:
+    """ZipFile for zip_path (which reads its central directory); raises ArchiveRejected if there is none"""
+    try:
+        return zipfile.ZipFile(zip_path, 'r')
+    except zipfile.BadZipFile as e:
+        raise _reject('corrupt', f"not a readable ZIP archive ({e})") from None
+
+
+def check_archive(zip_path: str, limits: ArchiveLimits) -> List[zipfile.ZipInfo]:
+    """Read only the central directory of zip_path, check it and return its members"""
+    with open_archive(zip_path) as zip_ref:
+        members = zip_ref.infolist()
+    check_members(members, limits)
+    return members
+
+
+def copy_member(zip_ref: zipfile.ZipFile, info: zipfile.ZipInfo, target: BinaryIO):
+    """Decompress one member into target, stopping as soon as it writes more than the central
+    directory declared for it (the size check_members() held to the limits)"""
+    written = 0
+    try:
+        with zip_ref.open(info) as source:
+            while True:
+                chunk = source.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > info.file_size:
+                    raise _reject('size', f"{info.filename}: decompresses past its declared {info.file_size} bytes")
+                target.write(chunk)
+    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+        raise _reject('corrupt', f"{info.filename}: {e}") from None
+
+
+def safe_extract(zip_path: str, extract_to: str, limits: ArchiveLimits):
+    """extractall() for archives that pass the limits, checked before anything is written"""
+    with open_archive(zip_path) as zip_ref:
+        members = zip_ref.infolist()
+        check_members(members, limits)
+        for info in members:
+            path = os.path.join(extract_to, *info.filename.replace('\\', '/').split('/'))
+            if info.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                with open(path, 'wb') as target:
+                    copy_member(zip_ref, info, target)
+            except ArchiveRejected:
+                os.unlink(path)
+                raise
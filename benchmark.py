@@ -0,0 +1,400 @@
+# Financial Document Analyzer - Benchmarks
+# Purpose: End-to-end benchmark of bundle analysis and report generation on synthetic bundles:
+#          wall time, pages/sec, peak memory and report size, saved as JSON for comparing runs,
+#          and a scaling sweep over worker counts and bundle shapes for sizing hardware
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from synthetic_bundles import PRESETS, BundleSpec, build_bundle
+
+# Columns of the scaling summary, in order
+SCALING_COLUMNS = ['shape', 'files', 'pages', 'workers', 'wall_seconds', 'pages_per_sec', 'speedup',
+                   'efficiency', 'serial_fraction', 'peak_rss_bytes', 'worker_peak_rss_bytes',
+                   'estimated_total_rss_bytes']
+# Worker counts the fitted serial fraction is projected to
+PROJECTED_WORKERS = (8, 16, 32, 64)
+
+# Figures compared between saved runs; True where higher is better
+COMPARED_METRICS = {
+    'wall_seconds': False,
+    'analysis_seconds': False,
+    'report_seconds': False,
+    'pages_per_sec': True,
+    'peak_rss_bytes': False,
+    'worker_peak_rss_bytes': False,
+    'report_bytes': False,
+}
+
+
+def _peak_rss_bytes(children: bool = False) -> int:
+    """Peak RSS of this process, or of its largest finished child process"""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def environment() -> Dict:
+    """Where a result was measured, so runs from different machines are not mistaken for regressions"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit or None,
+    }
+
+
+def check_against_manifest(results: Dict, manifest: Dict) -> List[str]:
+    """Differences between what the analyzer found and what the generator put in the bundle"""
+    problems = []
+    if results['missing_files'] != manifest['expected_missing']:
+        problems.append("missing files differ from the manifest")
+    for expected, found in zip(manifest['files'], results['file_analysis']):
+        details = found['page_details']
+        blank_pages = details.column('page_number')[details.column('is_blank')].tolist()
+        if blank_pages != expected['blank_pages']:
+            problems.append(f"{found['filename']}: blank pages {blank_pages}, expected {expected['blank_pages']}")
+        if found['financial_tables'] != expected['financial_tables']:
+            problems.append(f"{found['filename']}: {found['financial_tables']} financial tables, "
+                            f"expected {expected['financial_tables']}")
+    if len(results['file_analysis']) != len(manifest['files']):
+        problems.append(f"{len(results['file_analysis'])} files analyzed, expected {len(manifest['files'])}")
+    return problems
+
+
+def run_once(zip_path: str, workers: Optional[int], manifest: Optional[Dict] = None) -> Dict:
+    """Analyze one bundle and build its report (meant to run in a fresh process for clean peak memory)"""
+    from financial_document_analyzer import ExcelReportWriter, FinancialDocumentAnalyzer
+
+    analyzer = FinancialDocumentAnalyzer(max_workers=workers)
+    started = time.perf_counter()
+    report_writer = ExcelReportWriter()
+    results = analyzer.analyze_zip_file(zip_path, report_writer=report_writer)
+    analyzed = time.perf_counter()
+    report = report_writer.finalize(results)
+    finished = time.perf_counter()
+
+    perf = results['perf']
+    wall_seconds = finished - started
+    return {
+        'wall_seconds': wall_seconds,
+        'analysis_seconds': analyzed - started,
+        'report_seconds': report_writer.seconds,
+        'pages': perf['total_pages'],
+        'pages_per_sec': perf['total_pages'] / wall_seconds if wall_seconds > 0 else 0.0,
+        'peak_rss_bytes': _peak_rss_bytes(),
+        'worker_peak_rss_bytes': max([f['peak_rss_bytes'] for f in perf['files']] + [_peak_rss_bytes(children=True)]),
+        'report_bytes': len(report),
+        'stages': perf['stages'],
+        'problems': check_against_manifest(results, manifest) if manifest else []
+    }
+
+
+def run_isolated(zip_path: str, workers: Optional[int], manifest: Optional[Dict] = None) -> Dict:
+    """run_once in a freshly spawned interpreter, so peak RSS and caches start from zero"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(run_once, zip_path, workers, manifest).result()
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    """Median, min and max of each compared metric over repeated runs"""
+    summary = {}
+    for metric in COMPARED_METRICS:
+        values = [run[metric] for run in runs]
+        summary[metric] = {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+    return summary
+
+
+def _int_list(text: str) -> List[int]:
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def bundle_spec_from_args(args) -> BundleSpec:
+    overrides = {key: value for key, value in (
+        ('pages_per_file', args.pages), ('rows_per_table', args.rows), ('extra_files', args.extra_files),
+        ('seed', args.seed)) if value is not None}
+    return BundleSpec.preset(args.preset, **overrides)
+
+
+def run_benchmark(args) -> Dict:
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.bundle:
+            zip_path, manifest, spec = args.bundle, None, None
+        else:
+            spec = bundle_spec_from_args(args)
+            zip_path = os.path.join(work_dir, "bundle.zip")
+            manifest = build_bundle(zip_path, spec)
+        bundle_bytes = os.path.getsize(zip_path)
+
+        runs = []
+        for repeat in range(args.warmup + args.repeat):
+            run = run_isolated(zip_path, args.workers, manifest)
+            label = "warmup" if repeat < args.warmup else f"run {repeat - args.warmup + 1}"
+            print(f"{label}: {run['wall_seconds']:.2f}s, {run['pages_per_sec']:.1f} pages/sec, "
+                  f"peak {run['peak_rss_bytes'] / 1024 ** 2:.0f} MB (workers {run['worker_peak_rss_bytes'] / 1024 ** 2:.0f} MB), "
+                  f"report {run['report_bytes'] / 1024:.0f} KB")
+            for problem in run['problems']:
+                print(f"  accuracy: {problem}")
+            if repeat >= args.warmup:
+                runs.append(run)
+
+    return {
+        'benchmark': 'end_to_end',
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'environment': environment(),
+        'workers': args.workers or os.cpu_count(),
+        'bundle': {
+            'path': args.bundle,
+            'preset': None if args.bundle else args.preset,
+            'spec': spec.to_dict() if spec else None,
+            'files': len(manifest['files']) if manifest else None,
+            'pages': runs[0]['pages'] if runs else None,
+            'bytes': bundle_bytes
+        },
+        'runs': runs,
+        'summary': summarize(runs)
+    }
+
+
+def default_worker_counts() -> List[int]:
+    """1, 2, 4, ... up to the CPU count, plus the CPU count itself"""
+    cpus = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return counts
+
+
+def serial_fraction(speedup: float, workers: int) -> Optional[float]:
+    """Karp-Flatt metric: the serial fraction of Amdahl's law implied by a measured speedup"""
+    if workers <= 1 or speedup <= 0:
+        return None
+    return (1 / speedup - 1 / workers) / (1 - 1 / workers)
+
+
+def amdahl_speedup(fraction: float, workers: int) -> float:
+    return 1 / (fraction + (1 - fraction) / workers)
+
+
+def run_scaling(args) -> Dict:
+    """Median wall time of every bundle shape at every worker count, with speedup against one worker"""
+    worker_counts = sorted(set([1] + (args.workers or default_worker_counts())))
+    shapes = [(preset, pages, extra_files)
+              for preset in args.presets
+              for pages in args.pages or [None]
+              for extra_files in args.extra_files or [None]]
+    rows, fits, problems = [], [], []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for index, (preset, pages, extra_files) in enumerate(shapes):
+            overrides = {key: value for key, value in (('pages_per_file', pages), ('extra_files', extra_files))
+                         if value is not None}
+            spec = BundleSpec.preset(preset, **overrides)
+            label = preset + "".join(f" {key}={value}" for key, value in overrides.items())
+            zip_path = os.path.join(work_dir, f"bundle-{index}.zip")
+            manifest = build_bundle(zip_path, spec)
+            print(f"{label}: {len(manifest['files'])} PDFs, {manifest['total_pages']} pages")
+
+            serial_seconds = None
+            fractions = []
+            for workers in worker_counts:
+                for _ in range(args.warmup):
+                    run_isolated(zip_path, workers, manifest)
+                runs = [run_isolated(zip_path, workers, manifest) for _ in range(args.repeat)]
+                for run in runs:
+                    problems.extend(f"{label}, {workers} workers: {problem}" for problem in run['problems'])
+                wall_seconds = statistics.median(run['wall_seconds'] for run in runs)
+                if serial_seconds is None:
+                    serial_seconds = wall_seconds
+                speedup = serial_seconds / wall_seconds
+                fraction = serial_fraction(speedup, workers)
+                if fraction is not None:
+                    fractions.append(fraction)
+                peak_rss = max(run['peak_rss_bytes'] for run in runs)
+                worker_peak_rss = max(run['worker_peak_rss_bytes'] for run in runs)
+                row = {
+                    'shape': label,
+                    'files': len(manifest['files']),
+                    'pages': manifest['total_pages'],
+                    'workers': workers,
+                    'wall_seconds': wall_seconds,
+                    'pages_per_sec': manifest['total_pages'] / wall_seconds,
+                    'speedup': speedup,
+                    'efficiency': speedup / workers,
+                    'serial_fraction': fraction,
+                    'peak_rss_bytes': peak_rss,
+                    'worker_peak_rss_bytes': worker_peak_rss,
+                    # One worker runs in the main process; above that each worker is its own process
+                    'estimated_total_rss_bytes': peak_rss if workers == 1 else peak_rss + workers * worker_peak_rss
+                }
+                rows.append(row)
+                print(f"  {workers:>3} workers: {wall_seconds:.2f}s, speedup {speedup:.2f}, "
+                      f"efficiency {speedup / workers:.0%}")
+
+            fit = statistics.mean(fractions) if fractions else None
+            fits.append({
+                'shape': label,
+                'serial_fraction': fit,
+                'projected_speedup': {str(n): amdahl_speedup(min(max(fit, 0.0), 1.0), n) for n in PROJECTED_WORKERS}
+                if fit is not None else {}
+            })
+
+    return {
+        'benchmark': 'scaling',
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'environment': environment(),
+        'worker_counts': worker_counts,
+        'repeat': args.repeat,
+        'rows': rows,
+        'fits': fits,
+        'problems': problems
+    }
+
+
+def scaling_summary(result: Dict) -> List[str]:
+    """Plain-text table of a scaling sweep and the Amdahl projection for each shape"""
+    lines = [f"{'Shape':<28}{'Files':>6}{'Pages':>7}{'Workers':>8}{'Wall s':>9}{'Pages/s':>9}"
+             f"{'Speedup':>8}{'Effic.':>8}{'Serial':>8}{'Worker MB':>10}{'Total MB':>10}"]
+    for row in result['rows']:
+        fraction = "" if row['serial_fraction'] is None else f"{row['serial_fraction']:.2f}"
+        lines.append(f"{row['shape']:<28}{row['files']:>6}{row['pages']:>7}{row['workers']:>8}"
+                     f"{row['wall_seconds']:>9.2f}{row['pages_per_sec']:>9.1f}{row['speedup']:>8.2f}"
+                     f"{row['efficiency']:>8.0%}{fraction:>8}{row['worker_peak_rss_bytes'] / 1024 ** 2:>10.0f}"
+                     f"{row['estimated_total_rss_bytes'] / 1024 ** 2:>10.0f}")
+    lines.append("")
+    for fit in result['fits']:
+        if fit['serial_fraction'] is None:
+            lines.append(f"{fit['shape']}: only one worker count measured, no serial fraction")
+            continue
+        projected = ", ".join(f"{n} workers {speedup:.1f}x" for n, speedup in fit['projected_speedup'].items())
+        lines.append(f"{fit['shape']}: serial fraction {fit['serial_fraction']:.2f}; projected speedup {projected}")
+    env = result['environment']
+    if max(result['worker_counts']) > (env['cpu_count'] or 1):
+        lines.append(f"Note: worker counts above {env['cpu_count']} CPUs share cores, so their speedup "
+                     f"understates what more cores would give")
+    lines.append(f"Measured {result['created_at']} at commit {env['git_commit']} on {env['cpu_count']} CPUs, "
+                 f"median of {result['repeat']} runs")
+    return lines
+
+
+def write_scaling_csv(result: Dict, path: str):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SCALING_COLUMNS)
+        writer.writeheader()
+        writer.writerows(result['rows'])
+
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """Side-by-side medians of two saved benchmark results"""
+    lines = [f"{'Metric':<24}{'Baseline':>16}{'Current':>16}{'Change':>10}"]
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old = baseline['summary'][metric]['median']
+        new = current['summary'][metric]['median']
+        change = (new - old) / old * 100 if old else 0.0
+        better = (change > 0) == higher_is_better
+        marker = "" if abs(change) < 1 else (" better" if better else " worse")
+        number = ",.0f" if metric.endswith('bytes') else ".3f"
+        lines.append(f"{metric:<24}{old:>16{number}}{new:>16{number}}{change:>+9.1f}%{marker}")
+    for name in ('baseline', 'current'):
+        result = baseline if name == 'baseline' else current
+        env = result['environment']
+        lines.append(f"{name}: {result['created_at']} commit {env['git_commit']} on {env['cpu_count']} CPUs, "
+                     f"{result['workers']} workers, {result['bundle']['pages']} pages")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the Financial Document Analyzer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="End-to-end benchmark on a synthetic (or given) bundle")
+    run_parser.add_argument("--preset", choices=sorted(PRESETS), default="medium", help="Synthetic bundle shape")
+    run_parser.add_argument("--pages", type=int, help="Override pages per PDF")
+    run_parser.add_argument("--rows", type=int, help="Override rows per table")
+    run_parser.add_argument("--extra-files", type=int, help="Override the number of supporting PDFs")
+    run_parser.add_argument("--seed", type=int)
+    run_parser.add_argument("--bundle", help="Benchmark this ZIP instead of a synthetic bundle")
+    run_parser.add_argument("--workers", type=int, default=None, help="Parse workers (default: CPU count)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Measured runs")
+    run_parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs first (warms the page cache)")
+    run_parser.add_argument("-o", "--output", help="Save the result as JSON")
+
+    scaling_parser = commands.add_parser("scaling", help="Sweep worker counts and bundle shapes")
+    scaling_parser.add_argument("--workers", type=_int_list, help="Comma-separated worker counts "
+                                "(default: 1, 2, 4, ... up to the CPU count); 1 is always included")
+    scaling_parser.add_argument("--presets", type=lambda text: text.split(","), default=["small", "medium"],
+                                help="Comma-separated synthetic bundle presets (default: small,medium)")
+    scaling_parser.add_argument("--pages", type=_int_list, help="Comma-separated pages per PDF to sweep")
+    scaling_parser.add_argument("--extra-files", type=_int_list, help="Comma-separated supporting PDF counts to sweep")
+    scaling_parser.add_argument("--repeat", type=int, default=3, help="Measured runs per point")
+    scaling_parser.add_argument("--warmup", type=int, default=0, help="Unmeasured runs before each point")
+    scaling_parser.add_argument("-o", "--output", help="Save the result as JSON")
+    scaling_parser.add_argument("--csv", help="Save the summary table as CSV")
+
+    compare_parser = commands.add_parser("compare", help="Compare two saved results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        result = run_benchmark(args)
+        summary = result['summary']
+        print(f"median {summary['wall_seconds']['median']:.2f}s, {summary['pages_per_sec']['median']:.1f} pages/sec "
+              f"over {args.repeat} runs")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+            print(f"Saved to {args.output}")
+        if any(run['problems'] for run in result['runs']):
+            sys.exit(1)
+    elif args.command == "scaling":
+        unknown = [preset for preset in args.presets if preset not in PRESETS]
+        if unknown:
+            parser.error(f"unknown presets: {', '.join(unknown)} (choose from {', '.join(sorted(PRESETS))})")
+        result = run_scaling(args)
+        print("\n".join(scaling_summary(result)))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+            print(f"Saved to {args.output}")
+        if args.csv:
+            write_scaling_csv(result, args.csv)
+            print(f"Saved summary to {args.csv}")
+        for problem in result['problems']:
+            print(f"accuracy: {problem}")
+        if result['problems']:
+            sys.exit(1)
+    else:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        print("\n".join(compare(baseline, current)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# Financial Document Analyzer - Checkpoints
+# Purpose: Durable per-file parse results for bundle analyses, keyed by bundle fingerprint and
+#          archive member, so a run that dies part way (OOM, deploy, container restart) resumes
+#          from the files it already finished instead of from zero
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zipfile
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY
+
+CHECKPOINT_FILE = "checkpoints.sqlite3"
+# Bump when the shape of parsed results changes, so older checkpoints are not reused. It is part
+# of the checkpoint row key only: the bundle fingerprint is also the bundle's identity in the
+# results history and text index, and must not change with it
+CHECKPOINT_VERSION = 3
+
+CHECKPOINT_LOOKUPS = REGISTRY.counter('fda_checkpoint_lookups_total',
+                                      'PDFs looked up in the checkpoint store at the start of a run', ['result'])
+CHECKPOINT_WRITES = REGISTRY.counter('fda_checkpoint_writes_total', 'Parsed PDFs saved to the checkpoint store')
+
+
+def bundle_fingerprint(members: List[zipfile.ZipInfo]) -> str:
+    """Identity of a bundle from its central directory: member names, sizes and CRC-32s
+
+    Nothing is decompressed, so this is cheap for any archive size, and the same bundle
+    uploaded again under another file name gets the same fingerprint.
+    """
+    digest = hashlib.sha256()
+    for info in members:
+        digest.update(f"\0{info.filename}\0{info.file_size}\0{info.CRC}".encode())
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """
+    SQLite file of parsed results, one row per (bundle fingerprint, member index).
+    Each save is committed on its own, so everything saved before a crash survives it.
+    A connection belongs to the thread that opened it.
+
+    settings are the analyzer settings that shape a parsed result (whether page text is
+    indexed, the page limit, the rules); results saved under other settings are not reused.
+    """
+
+    def __init__(self, path: str, settings: Optional[Dict] = None):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.settings = hashlib.sha256(json.dumps(settings or {}, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        # WAL keeps a save to one append; NORMAL sync survives process crashes, which is what we resume from
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_results (
+                bundle TEXT NOT NULL,
+                member_index INTEGER NOT NULL,
+                member TEXT NOT NULL,
+                result TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                PRIMARY KEY (bundle, member_index)
+            )""")
+
+    @classmethod
+    def in_directory(cls, directory: str, settings: Optional[Dict] = None) -> 'CheckpointStore':
+        return cls(os.path.join(directory, CHECKPOINT_FILE), settings)
+
+    def _key(self, bundle: str) -> str:
+        """Row key of a bundle's results in the current checkpoint version and settings"""
+        return f"{bundle}/v{CHECKPOINT_VERSION}/{self.settings}"
+
+    def load(self, bundle: str, members: List[str]) -> Dict[int, Dict]:
+        """Saved results of a bundle by member index, marked 'restored'
+
+        Rows whose member name no longer matches are ignored.
+        """
+        restored = {}
+        rows = self.conn.execute("SELECT member_index, member, result FROM file_results WHERE bundle = ?",
+                                 (self._key(bundle),))
+        for index, member, result in rows:
+            if index < len(members) and members[index] == member:
+                restored[index] = {**json.loads(result), 'restored': True}
+        CHECKPOINT_LOOKUPS.labels(result='hit').inc(len(restored))
+        CHECKPOINT_LOOKUPS.labels(result='miss').inc(len(members) - len(restored))
+        return restored
+
+    def save(self, bundle: str, index: int, member: str, parsed: Dict):
+        self.conn.execute("INSERT OR REPLACE INTO file_results VALUES (?, ?, ?, ?, ?)",
+                          (self._key(bundle), index, member, json.dumps(parsed), time.time()))
+        CHECKPOINT_WRITES.inc()
+
+    def forget(self, bundle: str) -> int:
+        """Drop a bundle's saved results, of every checkpoint version and settings; returns the number of files dropped"""
+        return self.conn.execute("DELETE FROM file_results WHERE bundle = ? OR substr(bundle, 1, ?) = ?",
+                                 (bundle, len(bundle) + 1, bundle + '/')).rowcount
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Drop results saved more than max_age_seconds ago; returns the number of files dropped"""
+        return self.conn.execute("DELETE FROM file_results WHERE saved_at < ?",
+                                 (time.time() - max_age_seconds,)).rowcount
+
+    def bundles(self) -> List[Dict]:
+        """Checkpointed bundles with their file counts, newest first"""
+        rows = self.conn.execute("""
+            SELECT bundle, COUNT(*), MAX(saved_at) FROM file_results
+            GROUP BY bundle ORDER BY MAX(saved_at) DESC""")
+        return [{'bundle': bundle.split('/')[0], 'files': files, 'last_saved': last_saved}
+                for bundle, files, last_saved in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+def zip_fingerprint(zip_path: str) -> str:
+    """bundle_fingerprint of the PDFs in a ZIP file"""
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        return bundle_fingerprint([info for info in zip_ref.infolist()
+                                   if not info.is_dir() and info.filename.lower().endswith('.pdf')])
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Inspect or clear analysis checkpoints")
+    parser.add_argument("checkpoint_dir", help="Directory holding the checkpoint store (FDA_CHECKPOINT_DIR)")
+    parser.add_argument("--forget", metavar="ZIP", help="Drop the checkpoint of this bundle")
+    parser.add_argument("--prune-days", type=float, help="Drop checkpoints older than this many days")
+    args = parser.parse_args(argv)
+
+    store = CheckpointStore.in_directory(args.checkpoint_dir)
+    try:
+        if args.forget:
+            print(f"Dropped {store.forget(zip_fingerprint(args.forget))} checkpointed files")
+        elif args.prune_days is not None:
+            print(f"Dropped {store.prune(args.prune_days * 86400)} checkpointed files")
+        else:
+            for bundle in store.bundles():
+                saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(bundle['last_saved']))
+                print(f"{bundle['bundle'][:16]}  {bundle['files']:>6} files  last saved {saved}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
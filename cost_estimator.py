@@ -0,0 +1,278 @@
+# Financial Document Analyzer - Cost Estimator
+# Purpose: Pre-flight estimate of a bundle before it is analyzed: pages, likely financial tables
+#          and run time, from the ZIP central directory and each PDF's trailer and page tree only
+#          (no layout parsing). A per-file cost model calibrated on finished runs prices the pages,
+#          and an ETA tracker corrects the estimate by how the files parsed so far compared with it
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import zipfile
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+
+from archive_limits import ArchiveLimits, check_members, copy_member, open_archive
+from results_store import document_key
+
+# Uncalibrated model: parse seconds = pages x 0.1 + MB x 0.5 + 0.05 per file
+DEFAULT_SECONDS_PER_PAGE = 0.1
+DEFAULT_SECONDS_PER_MB = 0.5
+DEFAULT_SECONDS_PER_FILE = 0.05
+DEFAULT_TABLES_PER_PAGE = 1.0
+# Only used for a PDF whose page tree cannot be read
+DEFAULT_BYTES_PER_PAGE = 50 * 1024
+# Calibration trusts the defaults as much as this many observed files (or pages, for table density)
+PRIOR_FILES = 20
+PRIOR_PAGES = 200
+# The ETA moves to the observed speed once the finished files carry about this many files' worth of estimate
+ETA_PRIOR_FILES = 2
+# Members up to this size are read for their page tree in memory, larger ones through a temporary file
+SPOOL_IN_MEMORY_BYTES = 64 * 1024 * 1024
+
+
+def document_kind(filename: str) -> str:
+    """'schedule', 'annexure', 'trial balance' or 'other'; table density is calibrated per kind"""
+    key = document_key(filename)
+    if key is None:
+        return 'other'
+    return key if key == 'trial balance' else key.rsplit(' ', 1)[0]
+
+
+def count_pages(stream) -> Optional[int]:
+    """Page count from the trailer's /Root /Pages /Count, without reading any page (None if unreadable)"""
+    try:
+        pages = resolve1(PDFDocument(PDFParser(stream)).catalog['Pages'])
+        count = resolve1(pages.get('Count'))
+    except Exception:
+        return None
+    return count if isinstance(count, int) and count >= 0 else None
+
+
+class CostModel:
+    """Parse time and table density of a PDF from its pages, size and kind
+
+    seconds = pages x seconds_per_page + MB x seconds_per_mb + seconds_per_file. calibrate() refits
+    the three coefficients by least squares over every file seen so far, held towards the defaults
+    by PRIOR_FILES pseudo-files, and keeps tables per page by document kind. With a path, the
+    running sums are kept there as JSON so each finished run sharpens the next estimate.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.coefficients = np.array([DEFAULT_SECONDS_PER_PAGE, DEFAULT_SECONDS_PER_MB, DEFAULT_SECONDS_PER_FILE])
+        self.files = 0
+        self.xtx = np.zeros((3, 3))
+        self.xty = np.zeros(3)
+        # kind -> [tables, pages]
+        self.tables: Dict[str, List[float]] = {}
+        self.bytes_seen = 0.0
+        self.pages_seen = 0.0
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> 'CostModel':
+        """The model saved at path, or the defaults if there is none yet"""
+        model = cls(path)
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            model.files = state['files']
+            model.xtx = np.array(state['xtx'])
+            model.xty = np.array(state['xty'])
+            model.tables = state['tables']
+            model.bytes_seen = state['bytes_seen']
+            model.pages_seen = state['pages_seen']
+            model._fit()
+        return model
+
+    def save(self):
+        if not self.path:
+            return
+        state = {'files': self.files, 'xtx': self.xtx.tolist(), 'xty': self.xty.tolist(), 'tables': self.tables,
+                 'bytes_seen': self.bytes_seen, 'pages_seen': self.pages_seen,
+                 'coefficients': dict(zip(('seconds_per_page', 'seconds_per_mb', 'seconds_per_file'),
+                                          self.coefficients.tolist()))}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Several analyses may finish at once; each replaces the file whole
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def calibrate(self, file_perfs: Iterable[Dict]):
+        """Add the per-file timings of a finished run (perf['files']) and refit
+
+        Only files parsed in full count: restored, skipped and cut-short files did not cost what
+        their pages would have.
+        """
+        for file_perf in file_perfs:
+            if file_perf['restored'] or file_perf['status'] != 'analyzed' or not file_perf['pages']:
+                continue
+            x = np.array([file_perf['pages'], file_perf['bytes_read'] / 1024 ** 2, 1.0])
+            self.xtx += np.outer(x, x)
+            self.xty += x * file_perf['parse_seconds']
+            self.files += 1
+            counts = self.tables.setdefault(document_kind(file_perf['filename']), [0.0, 0.0])
+            counts[0] += file_perf['tables']
+            counts[1] += file_perf['pages']
+            self.bytes_seen += file_perf['bytes_read']
+            self.pages_seen += file_perf['pages']
+        self._fit()
+
+    def _fit(self):
+        if not self.files:
+            return
+        defaults = np.array([DEFAULT_SECONDS_PER_PAGE, DEFAULT_SECONDS_PER_MB, DEFAULT_SECONDS_PER_FILE])
+        # Ridge towards the defaults, scaled to an average observed file so each term weighs alike
+        prior = PRIOR_FILES * np.diag(np.diag(self.xtx) / self.files)
+        self.coefficients = np.maximum(np.linalg.solve(self.xtx + prior, self.xty + prior @ defaults), 0.0)
+
+    def tables_per_page(self, kind: str) -> float:
+        tables, pages = self.tables.get(kind, (0.0, 0.0))
+        return (tables + PRIOR_PAGES * DEFAULT_TABLES_PER_PAGE) / (pages + PRIOR_PAGES)
+
+    @property
+    def bytes_per_page(self) -> float:
+        return (self.bytes_seen + PRIOR_PAGES * DEFAULT_BYTES_PER_PAGE) / (self.pages_seen + PRIOR_PAGES)
+
+    def estimate_file(self, filename: str, size: int, pages: Optional[int] = None) -> Dict:
+        """Estimate for one PDF of `size` bytes; without a page count, pages are guessed from the size"""
+        counted = pages is not None
+        if not counted:
+            pages = max(1, round(size / self.bytes_per_page))
+        kind = document_kind(filename)
+        seconds = float(self.coefficients @ np.array([pages, size / 1024 ** 2, 1.0]))
+        return {'filename': filename, 'kind': kind, 'bytes': size, 'pages': pages, 'pages_counted': counted,
+                'tables': pages * self.tables_per_page(kind), 'seconds': seconds}
+
+    def to_dict(self) -> Dict:
+        return {'path': self.path, 'files': self.files,
+                **dict(zip(('seconds_per_page', 'seconds_per_mb', 'seconds_per_file'), self.coefficients.tolist()))}
+
+
+def pdf_members(members: Iterable[zipfile.ZipInfo]) -> List[zipfile.ZipInfo]:
+    """The members the analysis reads, in archive order"""
+    return [info for info in members if not info.is_dir() and info.filename.lower().endswith('.pdf')]
+
+
+def bundle_estimate(files: List[Dict], workers: int, started: float) -> Dict:
+    """Totals over per-file estimates; wall time assumes `workers` parallel parses but is never
+    less than the longest single file"""
+    cpu_seconds = sum(f['seconds'] for f in files)
+    workers = max(1, workers)
+    return {
+        'total_files': len(files),
+        'total_pages': sum(f['pages'] for f in files),
+        'counted_files': sum(f['pages_counted'] for f in files),
+        'tables': sum(f['tables'] for f in files),
+        'cpu_seconds': cpu_seconds,
+        'seconds': max([cpu_seconds / workers] + [f['seconds'] for f in files]),
+        'workers': workers,
+        'preflight_seconds': time.perf_counter() - started,
+        'files': files
+    }
+
+
+def estimate_members(members: Iterable[zipfile.ZipInfo], model: CostModel, workers: int = 1) -> Dict:
+    """Central directory only: pages guessed from member sizes"""
+    started = time.perf_counter()
+    return bundle_estimate([model.estimate_file(info.filename, info.file_size) for info in pdf_members(members)],
+                           workers, started)
+
+
+def estimate_bundle(zip_path: str, model: Optional[CostModel] = None, workers: int = 1,
+                    limits: Optional[ArchiveLimits] = None) -> Dict:
+    """Pre-flight estimate of a ZIP: pages from each PDF's page tree, priced by the cost model
+
+    The archive is held to the archive limits first (raising ArchiveRejected); each PDF is then
+    decompressed once, without parsing any page. Files are listed in the order the analysis
+    reads them.
+    """
+    started = time.perf_counter()
+    model = model or CostModel()
+    files = []
+    with open_archive(zip_path) as zip_ref:
+        check_members(zip_ref.infolist(), limits or ArchiveLimits.from_env())
+        for info in pdf_members(zip_ref.infolist()):
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_IN_MEMORY_BYTES) as spool:
+                copy_member(zip_ref, info, spool)
+                spool.seek(0)
+                pages = count_pages(spool)
+            files.append(model.estimate_file(info.filename, info.file_size, pages))
+    return bundle_estimate(files, workers, started)
+
+
+class EtaTracker:
+    """Remaining run time of an analysis: the estimate for the files still to come, scaled by how
+    long the finished files took against their own estimates"""
+
+    def __init__(self, estimate: Dict):
+        self.predicted = [f['seconds'] for f in estimate['files']]
+        self.workers = estimate['workers']
+        self.remaining = sum(self.predicted)
+        self.predicted_done = 0.0
+        self.actual_done = 0.0
+        self.prior = ETA_PRIOR_FILES * (self.remaining / len(self.predicted) if self.predicted else 0.0)
+
+    def file_done(self, index: int, parse_seconds: float, restored: bool = False):
+        self.remaining -= self.predicted[index]
+        if not restored:
+            self.predicted_done += self.predicted[index]
+            self.actual_done += parse_seconds
+
+    @property
+    def correction(self) -> float:
+        """Observed over estimated parse time so far, starting from 1"""
+        if self.predicted_done + self.prior <= 0:
+            return 1.0
+        return (self.actual_done + self.prior) / (self.predicted_done + self.prior)
+
+    def eta_seconds(self) -> float:
+        return max(self.remaining, 0.0) * self.correction / self.workers
+
+
+def format_seconds(seconds: float) -> str:
+    """'45s', '12 min' or '2.5 h'"""
+    if seconds < 90:
+        return f"{seconds:.0f}s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Estimate pages, tables and run time of a ZIP of PDFs without "
+                                                 "parsing it")
+    parser.add_argument("zip_paths", nargs="+", metavar="zip_path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel parses (default: CPU count)")
+    parser.add_argument("--model", default=os.environ.get('FDA_COST_MODEL'),
+                        help="Calibrated cost model file (default: FDA_COST_MODEL, else the built-in defaults)")
+    parser.add_argument("--files", action="store_true", help="List each PDF's estimate")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    model = CostModel.load(args.model)
+    estimates = {path: estimate_bundle(path, model, args.workers) for path in args.zip_paths}
+    if args.json:
+        print(json.dumps({'model': model.to_dict(), 'bundles': estimates}, indent=2))
+        return
+    print(f"Cost model: {model.coefficients[0]:.3f}s/page, {model.coefficients[1]:.3f}s/MB, "
+          f"{model.coefficients[2]:.3f}s/file ({model.files} calibration files)")
+    for path, estimate in estimates.items():
+        print(f"{path}: {estimate['total_files']} PDFs, {estimate['total_pages']} pages, ~{estimate['tables']:.0f} "
+              f"tables, about {format_seconds(estimate['seconds'])} on {estimate['workers']} workers "
+              f"(read in {estimate['preflight_seconds'] * 1000:.0f} ms)")
+        if args.files:
+            for f in estimate['files']:
+                pages = f['pages'] if f['pages_counted'] else f"~{f['pages']}"
+                print(f"  {f['filename']}\t{pages} pages\t{f['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@
 
 import zipfile
 import os
+import asyncio
+import numpy as np
 import pandas as pd
 import pdfplumber
 import re
@@ -13,11 +15,421 @@ from pathlib import Path
 import openpyxl
 from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.cell import WriteOnlyCell
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import shutil
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, Iterable, List, Dict, Tuple, Optional, Union
 import tempfile
 import io
+import time
+import heapq
+import json
+import logging
+import cProfile
+import pstats
+import tracemalloc
+import multiprocessing
+import argparse
+import sys
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import Executor, ThreadPoolExecutor
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from archive_limits import ArchiveLimits, ArchiveRejected, PageLimitExceeded, check_archive, copy_member, safe_extract
+from cost_estimator import CostModel, EtaTracker, estimate_bundle, estimate_members, format_seconds, pdf_members
+from page_sampling import DEFAULT_MAX_BLANK_RATE, DEFAULT_SAMPLE_PAGES, DEFAULT_TIME_BUDGET, triage_bundle
+from checkpoint_store import CheckpointStore, bundle_fingerprint, zip_fingerprint
+from metrics import REGISTRY, start_http_server
+from results_store import PERIOD_PATTERNS, infer_period, period_order, save_results
+from text_index import BundleTextIndex, TextIndex, page_terms
+from page_columns import FilePages, PageColumns
+from validation_rules import RulePlan, load_rules, rules_failed
+from table_continuation import BROUGHT_FORWARD, CARRIED_FORWARD, TableContinuationTracker, header_signature, is_carry_row
+from period_comparison import TOTAL_LABELS, DEFAULT_VARIANCE_THRESHOLD, compare_in_store, describe_prior
+from worker_pool import MemoryBudgetExceeded, TaskCancelled, TaskTimeout, WorkerLost, WorkerPool, heartbeat
+
+logger = logging.getLogger("financial_analyzer")
+
+PAGE_STAGES = ('extract_text', 'extract_tables', 'analyze_tables')
+
+# A file the analysis could not finish is 'skipped: <reason>', or 'partial: <reason>' when
+# some of its pages were parsed
+FILE_ANALYZED = 'analyzed'
+MEMORY_BUDGET = 'memory budget'
+WORKER_EXITED = 'worker exited'
+PAGE_TIMEOUT = 'page timeout'
+DOCUMENT_TIMEOUT = 'document timeout'
+RUN_TIME_BUDGET = 'run time budget'
+PAGE_LIMIT = 'page limit'
+
+# Bundles of a batch analyzed at the same time on the shared pool
+BATCH_BUNDLES_IN_FLIGHT = 2
+
+# First number in a cleaned-up cell, as calculate_column_total has always read amounts
+AMOUNT_PATTERN = re.compile(r'-?\d+\.?\d*')
+# A row fails reconciliation when opening + debit - credit misses its closing balance by more than this
+RECONCILIATION_TOLERANCE = 0.01
+# Failing rows listed per table; beyond this they are only counted
+MAX_LISTED_UNRECONCILED_ROWS = 50
+
+# Service metrics. They are updated by the process that aggregates results (from timings the
+# workers already return), so the per-page parsing hot path carries no metrics overhead.
+DOCUMENTS_ANALYZED = REGISTRY.counter('fda_documents_total', 'PDF documents analyzed', ['status'])
+PAGES_ANALYZED = REGISTRY.counter('fda_pages_total', 'PDF pages analyzed')
+BLANK_PAGES = REGISTRY.counter('fda_blank_pages_total', 'Blank PDF pages found')
+FINANCIAL_TABLES = REGISTRY.counter('fda_financial_tables_total', 'Financial tables analyzed')
+BYTES_READ = REGISTRY.counter('fda_bytes_read_total', 'Uncompressed bytes read from ZIP archives')
+STAGE_SECONDS = REGISTRY.counter('fda_stage_seconds_total', 'Time spent per analysis stage', ['stage'])
+PAGE_SECONDS = REGISTRY.histogram('fda_page_seconds', 'Parse time per PDF page',
+                                  buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+DOCUMENT_SECONDS = REGISTRY.histogram('fda_document_seconds', 'Parse time per PDF document')
+BUNDLE_SECONDS = REGISTRY.histogram('fda_bundle_seconds', 'Wall time per ZIP bundle analysis',
+                                    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200))
+REPORT_SECONDS = REGISTRY.histogram('fda_report_seconds', 'Time spent building an Excel report')
+ANALYSES_CANCELLED = REGISTRY.counter('fda_analyses_cancelled_total', 'ZIP bundle analyses stopped by a cancel request')
+ANALYSES_IN_PROGRESS = REGISTRY.gauge('fda_analyses_in_progress', 'ZIP bundles currently being analyzed')
+FILES_IN_FLIGHT = REGISTRY.gauge('fda_files_in_flight', 'PDFs read from a ZIP but not yet aggregated')
+PARSE_QUEUE_DEPTH = REGISTRY.gauge('fda_parse_queue_depth', 'PDFs waiting for a parse worker')
+WORKER_RSS = REGISTRY.gauge('fda_worker_rss_bytes', 'Resident set size of parse workers after their last PDF', ['pid'])
+DOCUMENT_PEAK_RSS = REGISTRY.histogram('fda_document_peak_rss_bytes', 'Peak worker resident set size while parsing a PDF',
+                                       buckets=tuple(mb * 1024 ** 2 for mb in (64, 128, 256, 512, 1024, 2048, 4096, 8192)))
+PAGES_TIMED_OUT = REGISTRY.counter('fda_pages_timed_out_total', 'PDF pages abandoned after the page timeout')
+LAST_RUN_PAGES_PER_SEC = REGISTRY.gauge('fda_last_run_pages_per_second', 'Throughput of the most recent analysis')
+
+def report_file_error(pdf_file: str, error: str):
+    """Show a file's error in the Streamlit session running the analysis; outside one (the HTTP API,
+    the watch folder, the command line) st.error would go nowhere, so it is logged"""
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        st.error(f"Error processing {pdf_file}: {error}")
+    else:
+        logger.warning("Error processing %s: %s", pdf_file, error)
+
+def record_file_metrics(file_perf: Dict):
+    """Update the service metrics from one file's perf entry (see PerfStats.add_file)"""
+    if file_perf['restored']:
+        # Parsed (and counted) by an earlier run
+        DOCUMENTS_ANALYZED.labels(status='restored').inc()
+        return
+    if file_perf['status'] != FILE_ANALYZED:
+        status = 'skipped'
+    else:
+        status = 'error' if file_perf['errors'] else 'ok'
+    DOCUMENTS_ANALYZED.labels(status=status).inc()
+    PAGES_ANALYZED.inc(file_perf['pages'])
+    BLANK_PAGES.inc(file_perf['blank_pages'])
+    PAGES_TIMED_OUT.inc(file_perf['timed_out_pages'])
+    FINANCIAL_TABLES.inc(file_perf['tables'])
+    BYTES_READ.inc(file_perf['bytes_read'])
+    PAGE_SECONDS.observe_many(page['seconds'] for page in file_perf['page_timings'])
+    DOCUMENT_SECONDS.observe(file_perf['parse_seconds'])
+    if file_perf['peak_rss_bytes']:
+        DOCUMENT_PEAK_RSS.observe(file_perf['peak_rss_bytes'])
+    if file_perf['worker_rss_bytes']:
+        WORKER_RSS.labels(pid=file_perf['worker_pid']).set(file_perf['worker_rss_bytes'])
+
+def record_run_metrics(perf: Dict):
+    """Update the service metrics once a bundle analysis has finished"""
+    BUNDLE_SECONDS.observe(perf['wall_seconds'])
+    LAST_RUN_PAGES_PER_SEC.set(perf['pages_per_sec'])
+    for stage, seconds in perf['stages'].items():
+        STAGE_SECONDS.labels(stage=stage).inc(seconds)
+
+def _current_rss() -> int:
+    """Resident set size of this process in bytes (0 where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def _reset_peak_rss():
+    """Reset this process's peak RSS (VmHWM) so the next reading covers only what follows"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in bytes since the last reset"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return 0
+    # Lifetime peak (kilobytes on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class PerfStats:
+    """
+    Low-overhead timers and counters for one analysis run.
+    Stage seconds are summed durations, so overlapping stages can add up to more than the wall time.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.files = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def add_file(self, filename: str, bytes_read: int, compressed_bytes: int, read_seconds: float,
+                 parsed: Dict) -> Dict:
+        """Record per-file and per-page timings for one parsed PDF (a _parse_pdf_worker result)
+
+        Files restored from a checkpoint keep their original timings but add nothing to the stage totals.
+        """
+        page_results = parsed['pages']
+        parse_seconds = parsed['parse_seconds']
+        restored = parsed.get('restored', False)
+        stages = defaultdict(float) if restored else self.stages
+        pages = []
+        tables = 0
+        for page in page_results:
+            timings = page.get('timings', {})
+            for name in PAGE_STAGES:
+                stages[name] += timings.get(name, 0.0)
+            tables += len(page['tables'])
+            pages.append({
+                'page': page['page'],
+                'seconds': sum(timings.get(name, 0.0) for name in PAGE_STAGES) + page.get('timeout_seconds', 0.0),
+                'timed_out': page.get('timed_out', False),
+                'tables': len(page['tables']),
+                'raw_tables': page.get('raw_tables', 0),
+                **{f'{name}_seconds': timings.get(name, 0.0) for name in PAGE_STAGES}
+            })
+
+        stages['zip_read'] += read_seconds
+        stages['parse'] += parse_seconds
+        page_count = len(page_results)
+        file_perf = {
+            'filename': filename,
+            'pages': page_count,
+            'blank_pages': sum(1 for page in page_results if page['is_blank']),
+            'timed_out_pages': sum(1 for page in page_results if page.get('timed_out')),
+            'tables': tables,
+            'errors': len(parsed['errors']),
+            'bytes_read': bytes_read,
+            'compressed_bytes': compressed_bytes,
+            'read_seconds': read_seconds,
+            'parse_seconds': parse_seconds,
+            'pages_per_sec': page_count / parse_seconds if parse_seconds > 0 else 0.0,
+            'tables_per_page': tables / page_count if page_count else 0.0,
+            'worker_pid': parsed['worker_pid'],
+            'worker_rss_bytes': parsed['worker_rss_bytes'],
+            'peak_rss_bytes': parsed['peak_rss_bytes'],
+            'status': parsed['status'],
+            'restored': restored,
+            'page_timings': pages
+        }
+        self.files.append(file_perf)
+        return file_perf
+
+    def to_dict(self) -> Dict:
+        wall_seconds = time.perf_counter() - self.started
+        total_pages = sum(f['pages'] for f in self.files)
+        return {
+            'wall_seconds': wall_seconds,
+            'total_pages': total_pages,
+            'total_bytes_read': sum(f['bytes_read'] for f in self.files),
+            'pages_per_sec': total_pages / wall_seconds if wall_seconds > 0 else 0.0,
+            'restored_files': sum(1 for f in self.files if f['restored']),
+            'stages': dict(self.stages),
+            'files': self.files
+        }
+
+class RunProfiler:
+    """
+    On-demand cProfile (and optionally tracemalloc) capture of one analysis run.
+    Pool workers profile each PDF they parse; their stats are merged into the run's stats.
+    Enable with the UI checkbox, the --profile CLI flag or FDA_PROFILE=1.
+    """
+
+    def __init__(self, top_n: int = 30, trace_memory: bool = False):
+        self.top_n = top_n
+        self.trace_memory = trace_memory
+        self.worker_dir: Optional[str] = None
+        self.stats: Optional[pstats.Stats] = None
+        self.summary = ""
+        self._profile: Optional[cProfile.Profile] = None
+
+    @classmethod
+    def from_env(cls) -> Optional['RunProfiler']:
+        """Profiler configured by FDA_PROFILE, FDA_PROFILE_MEMORY and FDA_PROFILE_TOP, if enabled"""
+        if not _env_flag('FDA_PROFILE'):
+            return None
+        return cls(top_n=int(os.environ.get('FDA_PROFILE_TOP', 30)), trace_memory=_env_flag('FDA_PROFILE_MEMORY'))
+
+    def start(self):
+        self.worker_dir = tempfile.mkdtemp(prefix='fda_profile_')
+        if self.trace_memory:
+            tracemalloc.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self, worker_labels: Dict[str, str]):
+        """Merge worker stats into the run's stats; worker_labels maps spool names to PDF names"""
+        self._profile.disable()
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        self.stats = pstats.Stats(self._profile)
+        worker_peaks = []
+
+        for name in sorted(os.listdir(self.worker_dir)):
+            path = os.path.join(self.worker_dir, name)
+            label = worker_labels.get(name.split('.')[0], name)
+            if name.endswith('.pstats'):
+                self.stats.add(path)
+            elif name.endswith('.mem.json'):
+                with open(path) as f:
+                    worker_peaks.append((json.load(f)['peak_bytes'], label))
+        shutil.rmtree(self.worker_dir, ignore_errors=True)
+        # The per-worker temp files are gone; don't list them in the printed stats
+        self.stats.files = []
+
+        summary = io.StringIO()
+        summary.write(f"Top {self.top_n} functions by cumulative time\n")
+        self.stats.stream = summary
+        self.stats.sort_stats('cumulative').print_stats(self.top_n)
+        summary.write(f"\nTop {self.top_n} functions by own time\n")
+        self.stats.sort_stats('tottime').print_stats(self.top_n)
+
+        if self.trace_memory:
+            summary.write(f"\nMain process peak traced memory: {peak / 1024 ** 2:.1f} MiB\n")
+            for stat in snapshot.statistics('lineno')[:self.top_n]:
+                summary.write(f"  {stat}\n")
+            if worker_peaks:
+                summary.write("\nLargest worker peaks (traced memory per PDF)\n")
+                for peak_bytes, label in sorted(worker_peaks, reverse=True)[:self.top_n]:
+                    summary.write(f"  {peak_bytes / 1024 ** 2:10.1f} MiB  {label}\n")
+
+        self.summary = summary.getvalue()
+
+    def save(self, base_path: str) -> List[str]:
+        """Write <base>_profile.pstats and <base>_profile.txt and return their paths"""
+        stats_path = base_path + "_profile.pstats"
+        summary_path = base_path + "_profile.txt"
+        self.stats.dump_stats(stats_path)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(self.summary)
+        return [stats_path, summary_path]
+
+class AnalysisCancelled(TaskCancelled):
+    """The analysis was stopped through its CancellationToken"""
+
+class CancellationToken:
+    """
+    Cancel switch for one analysis, safe to flip from any thread (a UI callback, an API handler).
+    The pipeline checks it between files and pages; callbacks registered with add_callback()
+    run once on cancel(), which is how in-flight parses on pool workers are interrupted.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Run callback on cancel (straight away if already cancelled)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise AnalysisCancelled("analysis cancelled")
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, '').strip().lower() not in ('', '0', 'false', 'no')
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name, '').strip()
+    return int(value) if value else None
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.environ.get(name, '').strip()
+    return float(value) if value else None
+
+# A bare year is the period of a trial balance named like "Trial Balance 2024"
+TRIAL_BALANCE_YEAR = re.compile(r'\b((?:19|20)\d{2})\b')
+# Words that do not tell trial balances apart: the document name, copy markers, punctuation
+TRIAL_BALANCE_NOISE = re.compile(r'\btrial\s*balance\b|\s*\((?:\d+|copy)\)|\bcopy\b|[^a-z0-9]+')
+
+def trial_balance_group(filename: str) -> Tuple[str, Optional[str]]:
+    """(entity, period) from a trial balance file name: 'Trial Balance - Branch A FY2023-24.pdf' -> ('branch a', 'FY2023-24')"""
+    stem = os.path.splitext(os.path.basename(filename))[0].lower().replace('_', ' ')
+    period = infer_period(stem)
+    for pattern, _ in PERIOD_PATTERNS:
+        stem = pattern.sub(' ', stem)
+    if period is None:
+        match = TRIAL_BALANCE_YEAR.search(stem)
+        period = match.group(1) if match else None
+    entity = TRIAL_BALANCE_YEAR.sub(' ', stem) if period is not None else stem
+    return ' '.join(TRIAL_BALANCE_NOISE.sub(' ', entity).split()), period
+
+def _tb_comparison(check: str, files: str, left: float, right: float) -> Dict:
+    return {'check': check, 'files': files, 'left': left, 'right': right, 'difference': left - right,
+            'agrees': abs(left - right) < 0.01}
+
+def batch_summary(name: str, results: Optional[Dict], error: Optional[str] = None,
+                  sheet: Optional[str] = None) -> Dict:
+    """One row of a batch: a bundle's headline results, or the error that stopped it"""
+    if results is None:
+        return {'bundle': name, 'sheet': sheet, 'status': f"failed: {error}", 'total_pdf_files': 0, 'pages': 0,
+                'missing_files': [], 'incomplete_files': 0, 'receipt_payment_equal': None,
+                'trial_balance_consistent': None, 'rules_failed': None, 'wall_seconds': 0.0}
+    return {
+        'bundle': name,
+        'sheet': sheet,
+        'status': 'partial' if results['partial'] else 'completed',
+        'total_pdf_files': results['total_pdf_files'],
+        'pages': results['perf']['total_pages'],
+        'missing_files': results['missing_files'],
+        'incomplete_files': len(results['incomplete_files']),
+        'receipt_payment_equal': results['receipt_payment_verification']['equal'],
+        'trial_balance_consistent': results['trial_balance_verification']['consistent'],
+        'rules_failed': rules_failed(results['rule_checks']) if results.get('rule_checks') else None,
+        'wall_seconds': results['perf']['wall_seconds']
+    }
 
 class FinancialDocumentAnalyzer:
     """
@@ -25,22 +437,79 @@ class FinancialDocumentAnalyzer:
     Identifies missing schedules/annexures, blank pages, and validates financial totals.
     """
 
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, executor: Optional[Executor] = None,
+                 queue_depth: Optional[int] = None, profiler: Optional[RunProfiler] = None,
+                 memory_budget_mb: Optional[int] = None, max_files_per_worker: Optional[int] = None,
+                 page_timeout: Optional[float] = None, document_timeout: Optional[float] = None,
+                 run_timeout: Optional[float] = None, checkpoint_dir: Optional[str] = None,
+                 text_index: Optional[str] = None, rules: Union[None, str, List] = None,
+                 archive_limits: Optional[ArchiveLimits] = None, cost_model: Optional[CostModel] = None):
+        """
+        max_workers: parallel PDF parses (processes; 1 parses in a background thread)
+        executor: shared executor to parse on instead of a per-run process pool
+        queue_depth: files allowed in flight between reading the ZIP and aggregating results
+        profiler: profile the next run (defaults to the FDA_PROFILE environment switch)
+        memory_budget_mb: kill a parse worker that grows past this RSS and skip its file
+                          (defaults to FDA_MEMORY_BUDGET_MB; forces process workers)
+        max_files_per_worker: replace each parse worker after this many files
+                              (defaults to FDA_MAX_FILES_PER_WORKER)
+        page_timeout: seconds one page may take before its worker is replaced and the page
+                      is reported as timed out (defaults to FDA_PAGE_TIMEOUT)
+        document_timeout: seconds one PDF may take in total (defaults to FDA_DOCUMENT_TIMEOUT)
+        run_timeout: seconds for the whole bundle; files not finished by then are left out of a
+                     partial report (defaults to FDA_RUN_TIMEOUT)
+        checkpoint_dir: save each analyzed PDF here as it finishes and resume a re-run of the same
+                        bundle from what was saved (defaults to FDA_CHECKPOINT_DIR)
+        text_index: index the text of every page into this text index file for term and phrase
+                    search (defaults to FDA_TEXT_INDEX)
+        rules: validation rules file (YAML or JSON) or list of rules to evaluate on every run
+               (defaults to FDA_RULES); raises RuleError if a rule cannot be compiled
+        archive_limits: member count, size, compression ratio and page limits a ZIP must keep to
+                        (defaults to the FDA_ZIP_MAX_* and FDA_PDF_MAX_PAGES settings)
+        cost_model: prices pre-flight estimates and ETAs; a model loaded from a file is calibrated
+                    with every finished run (defaults to the file FDA_COST_MODEL, else built-in costs)
+        """
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.executor = executor
+        self.profiler = profiler if profiler is not None else RunProfiler.from_env()
+        self.memory_budget_mb = memory_budget_mb if memory_budget_mb is not None else _env_int('FDA_MEMORY_BUDGET_MB')
+        self.max_files_per_worker = (max_files_per_worker if max_files_per_worker is not None
+                                     else _env_int('FDA_MAX_FILES_PER_WORKER'))
+        self.page_timeout = page_timeout if page_timeout is not None else _env_float('FDA_PAGE_TIMEOUT')
+        self.document_timeout = document_timeout if document_timeout is not None else _env_float('FDA_DOCUMENT_TIMEOUT')
+        self.run_timeout = run_timeout if run_timeout is not None else _env_float('FDA_RUN_TIMEOUT')
+        self.checkpoint_dir = checkpoint_dir or os.environ.get('FDA_CHECKPOINT_DIR') or None
+        self.text_index = text_index or os.environ.get('FDA_TEXT_INDEX') or None
+        self.rules = load_rules(rules if rules is not None else os.environ.get('FDA_RULES') or None)
+        self.archive_limits = archive_limits or ArchiveLimits.from_env()
+        self.cost_model = cost_model or CostModel.load(os.environ.get('FDA_COST_MODEL') or None)
+        self.queue_depth = max(queue_depth or 2 * self.max_workers, self.max_workers)
         self.results = []
         self.missing_files = []
         self.required_schedules = [f"schedule {i}" for i in range(1, 23)]  # Schedule 1-22
         self.required_annexures = [f"annexure {i}" for i in range(1, 13)]  # Annexure 1-12
 
     def extract_zip_file(self, zip_path: str, extract_to: str = None) -> str:
-        """Extract ZIP file and return extraction path"""
+        """Extract ZIP file and return extraction path; raises ArchiveRejected if it breaks the archive limits"""
         if extract_to is None:
             extract_to = tempfile.mkdtemp()
 
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_to)
+        safe_extract(zip_path, extract_to, self.archive_limits)
 
         return extract_to
 
+    def preflight(self, zip_path: str) -> Dict:
+        """Estimate pages, tables and run time of a ZIP from its PDFs' page trees, without parsing pages"""
+        return estimate_bundle(zip_path, self.cost_model, self.max_workers, self.archive_limits)
+
+    def triage(self, zip_path: str, sample_pages: int = DEFAULT_SAMPLE_PAGES,
+               time_budget: float = DEFAULT_TIME_BUDGET, max_blank_rate: float = DEFAULT_MAX_BLANK_RATE) -> Dict:
+        """Analyze a stratified sample of each PDF's pages on the parse workers within time_budget seconds
+        and extrapolate blank pages and tables with confidence bounds; needs_full_analysis says whether
+        to queue the full run"""
+        return triage_bundle(self, zip_path, _parse_pdf_worker, sample_pages, time_budget,
+                             max_blank_rate=max_blank_rate)
+
     def find_pdf_files(self, directory: str) -> List[str]:
         """Find all PDF files in directory and subdirectories"""
         pdf_files = []
@@ -73,20 +542,45 @@ class FinancialDocumentAnalyzer:
         cleaned_text = re.sub(r'\s+', ' ', text.strip())
         return len(cleaned_text) < 50  # Threshold for blank page
 
-    def extract_financial_tables(self, pdf_path: str) -> List[Dict]:
-        """Extract tables and analyze financial data from PDF"""
+    def extract_financial_tables(self, pdf_path: str, errors: Optional[List[str]] = None, start_page: int = 1,
+                                 page_callback: Optional[Callable[[int, Optional[Dict]], None]] = None,
+                                 cancel_token: Optional[CancellationToken] = None,
+                                 index_text: bool = False, max_pages: Optional[int] = None,
+                                 pages: Optional[Iterable[int]] = None) -> List[Dict]:
+        """Extract tables and analyze financial data from PDF
+
+        Errors are shown in the UI, or appended to `errors` when a list is given
+        (worker processes have no UI to report to). Parsing begins at start_page;
+        page_callback, if given, is called with (page number, None) as each page starts
+        and (page number, page result) when it is done. Cancellation (cancel_token, or a
+        TaskCancelled raised by page_callback) is checked before each page and propagates.
+        With index_text, each page result also carries its terms for the text index.
+        A PDF of more than max_pages pages raises PageLimitExceeded before any page is parsed.
+        With pages, only those page numbers are parsed, in the order given (instead of start_page on).
+        """
         page_results = []
 
         try:
             with pdfplumber.open(pdf_path) as pdf:
-                for page_num, page in enumerate(pdf.pages, 1):
+                if max_pages is not None and len(pdf.pages) > max_pages:
+                    raise PageLimitExceeded(len(pdf.pages), max_pages)
+                selected = enumerate(pdf.pages[start_page - 1:], start_page) if pages is None else \
+                    ((page_num, pdf.pages[page_num - 1]) for page_num in pages)
+                for page_num, page in selected:
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    if page_callback:
+                        page_callback(page_num, None)
+                    started = time.perf_counter()
                     page_text = page.extract_text() or ""
 
                     # Check if page is blank
                     is_blank = self.is_page_blank(page_text)
+                    text_done = time.perf_counter()
 
                     # Extract tables
                     tables = page.extract_tables()
+                    tables_done = time.perf_counter()
 
                     # Analyze each table for financial columns
                     table_analysis = []
@@ -99,15 +593,31 @@ class FinancialDocumentAnalyzer:
                                     'financial_data': financial_data
                                 })
 
-                    page_results.append({
+                    page_result = {
                         'page': page_num,
                         'is_blank': is_blank,
                         'tables': table_analysis,
-                        'text_preview': page_text[:200] if page_text else ""
-                    })
-
+                        'text_preview': page_text[:200] if page_text else "",
+                        'raw_tables': len(tables),
+                        'timings': {
+                            'extract_text': text_done - started,
+                            'extract_tables': tables_done - text_done,
+                            'analyze_tables': time.perf_counter() - tables_done
+                        }
+                    }
+                    if index_text:
+                        page_result['terms'] = page_terms(page_text)
+                    page_results.append(page_result)
+                    if page_callback:
+                        page_callback(page_num, page_result)
+
+        except (TaskCancelled, PageLimitExceeded):
+            raise
         except Exception as e:
-            st.error(f"Error processing {pdf_path}: {str(e)}")
+            if errors is not None:
+                errors.append(str(e))
+            else:
+                report_file_error(pdf_path, str(e))
 
         return page_results
 
@@ -141,52 +651,104 @@ class FinancialDocumentAnalyzer:
         if all(col == -1 for col in financial_columns.values()):
             return None
 
-        # Calculate totals for each financial column
-        totals = {}
-        for col_name, col_idx in financial_columns.items():
-            if col_idx >= 0:
-                total = self.calculate_column_total(table, col_idx)
-                totals[col_name] = total
-
-        return {
+        mapped = [col_name for col_name, col_idx in financial_columns.items() if col_idx >= 0]
+        col_indexes = [financial_columns[col_name] for col_name in mapped]
+
+        # b/f and c/f rows repeat totals of other pages: keep them out of the totals and let the
+        # continuation tracker decide whether they count
+        first_row, end_row = 1, len(table)
+        brought_forward = is_carry_row(table[1], BROUGHT_FORWARD)
+        if brought_forward:
+            first_row = 2
+        carried_forward = end_row > first_row and is_carry_row(table[-1], CARRIED_FORWARD)
+        if carried_forward:
+            end_row -= 1
+
+        # Parse the mapped columns once into one array; totals and the row check both use it
+        amounts = self.table_amounts(table, col_indexes, first_row, end_row)
+        present = ~np.isnan(amounts)
+        amounts = np.where(present, amounts, 0.0)
+
+        financial_data = {
             'column_mapping': financial_columns,
-            'totals': totals,
-            'row_count': len(table) - 1  # Excluding header
+            'totals': dict(zip(mapped, amounts.sum(axis=0).tolist())),
+            'row_count': len(table) - 1,  # Excluding header
+            'header_signature': header_signature(headers)
         }
+        if brought_forward:
+            financial_data['brought_forward'] = self.carry_amounts(table, 1, mapped, col_indexes)
+        if carried_forward:
+            financial_data['carried_forward'] = self.carry_amounts(table, len(table) - 1, mapped, col_indexes)
+        if len(mapped) == len(financial_columns):
+            financial_data['reconciliation'] = self.reconcile_rows(amounts, present, first_row)
+        return financial_data
+
+    def table_amounts(self, table: List[List], col_indexes: List[int], first_row: int = 1,
+                      end_row: Optional[int] = None) -> np.ndarray:
+        """Amounts of the given columns in rows first_row..end_row (all data rows by default) as a
+        (rows, columns) array, NaN where a cell holds no number"""
+        search = AMOUNT_PATTERN.search
+        nan = float('nan')
+        values = []
+        append = values.append
+        for row in table[first_row:end_row]:
+            width = len(row)
+            for col_idx in col_indexes:
+                cell = row[col_idx] if col_idx < width else None
+                if cell:
+                    match = search(str(cell).replace(',', '').replace('(', '-').replace(')', ''))
+                    append(float(match.group()) if match else nan)
+                else:
+                    append(nan)
+        return np.array(values, dtype=np.float64).reshape(-1, len(col_indexes))
+
+    def carry_amounts(self, table: List[List], row_idx: int, mapped: List[str], col_indexes: List[int]) -> Dict[str, float]:
+        """Amounts on a b/f or c/f row, by financial column"""
+        amounts = self.table_amounts(table, col_indexes, row_idx, row_idx + 1)[0].tolist()
+        return {col_name: amount for col_name, amount in zip(mapped, amounts) if not np.isnan(amount)}
 
     def calculate_column_total(self, table: List[List], col_idx: int) -> float:
         """Calculate total for a specific column"""
-        total = 0.0
-        for row in table[1:]:  # Skip header
-            if col_idx < len(row) and row[col_idx]:
-                cell_value = str(row[col_idx]).replace(',', '').replace('(', '-').replace(')', '')
-                try:
-                    # Extract numeric value
-                    numeric_value = re.findall(r'-?\d+\.?\d*', cell_value)
-                    if numeric_value:
-                        total += float(numeric_value[0])
-                except (ValueError, IndexError):
-                    continue
-        return total
-
-    def check_receipt_payment_balance(self, page_results: List[Dict]) -> Dict:
-        """Check if receipt and payment totals are equal on last page"""
-        if not page_results:
-            return {'status': 'No pages found', 'equal': False}
+        return float(np.nansum(self.table_amounts(table, [col_idx])))
+
+    def reconcile_rows(self, amounts: np.ndarray, present: np.ndarray, first_row: int = 1) -> Dict:
+        """Rows whose opening + debit - credit does not equal their closing balance
+
+        amounts holds the opening, debit, credit and closing columns (missing cells as zero) and
+        present marks the cells that held a number; all rows are checked in one array expression.
+        Rows without both balances (narration, headings) are not checked. Row numbers count data
+        rows from 1, the first array row being data row first_row, and at most
+        MAX_LISTED_UNRECONCILED_ROWS are listed.
+        """
+        opening, debit, credit, closing = amounts.T
+        difference = opening + debit - credit - closing
+        checked = present[:, 0] & present[:, 3]
+        failed = np.flatnonzero(checked & (np.abs(difference) > RECONCILIATION_TOLERANCE))
+        return {
+            'checked_rows': int(np.count_nonzero(checked)),
+            'failed_count': len(failed),
+            'failed_rows': [{
+                'row': row + first_row,
+                'opening_balance': opening[row],
+                'debit': debit[row],
+                'credit': credit[row],
+                'closing_balance': closing[row],
+                'difference': difference[row]
+            } for row in failed[:MAX_LISTED_UNRECONCILED_ROWS].tolist()]
+        }
 
-        last_page = page_results[-1]
-        receipt_total = 0
-        payment_total = 0
+    def check_receipt_payment_balance(self, last_page_totals: Optional[Dict[str, float]]) -> Dict:
+        """Check if receipt and payment totals are equal on last page
 
-        for table in last_page.get('tables', []):
-            financial_data = table.get('financial_data', {})
-            totals = financial_data.get('totals', {})
+        last_page_totals is a file summary's totals of its last page as printed, b/f rows
+        included (see summarize_file); None means the file had no pages.
+        """
+        if last_page_totals is None:
+            return {'status': 'No pages found', 'equal': False}
 
-            # Look for receipt/payment patterns
-            if 'debit' in totals:
-                receipt_total += totals['debit']
-            if 'credit' in totals:
-                payment_total += totals['credit']
+        # Debits are receipts and credits payments
+        receipt_total = last_page_totals.get('debit', 0)
+        payment_total = last_page_totals.get('credit', 0)
 
         return {
             'receipt_total': receipt_total,
@@ -195,212 +757,1245 @@ class FinancialDocumentAnalyzer:
             'difference': receipt_total - payment_total
         }
 
-    def check_trial_balance_consistency(self, pdf_files: List[str]) -> Dict:
-        """Check if trial balance pages have consistent grand totals"""
-        trial_balance_files = [f for f in pdf_files if 'trial balance' in os.path.basename(f).lower()]
+    def find_trial_balance_files(self, pdf_files: List[str]) -> List[str]:
+        """Files the trial balance consistency check compares"""
+        return [f for f in pdf_files if 'trial balance' in os.path.basename(f).lower()]
+
+    def check_trial_balance_consistency(self, pdf_files: List[str],
+                                        file_pages: Optional[Dict[str, FilePages]] = None,
+                                        file_status: Optional[Dict[str, str]] = None) -> Dict:
+        """Check every trial balance file, grouped by entity and period
+
+        Each file's debits should equal its credits, copies of the same entity and period should
+        agree on all four totals, and a period's closing total should be the next period's opening
+        total (periods of the same granularity only, in date order). file_pages maps file names to
+        the page details of files summarized during the main pass, so they are not parsed again.
+        Page totals already leave out carried-forward rows. Files whose file_status is not
+        'analyzed' (skipped or cut short) have no complete totals; they are listed as not
+        comparable and left out.
+        """
+        file_pages = file_pages or {}
+        file_status = file_status or {}
+        trial_balance_files = self.find_trial_balance_files(pdf_files)
+
+        if not trial_balance_files:
+            return {'status': 'No trial balance files found', 'consistent': False, 'files': [], 'comparisons': [],
+                    'not_comparable': []}
+
+        files = []
+        not_comparable = []
+        for tb_file in trial_balance_files:
+            status = file_status.get(tb_file, FILE_ANALYZED)
+            if status != FILE_ANALYZED:
+                not_comparable.append({'filename': os.path.basename(tb_file), 'status': status})
+                continue
+            pages = file_pages.get(tb_file)
+            if pages is None:
+                pages = self.summarize_file(tb_file, self.extract_financial_tables(tb_file))['page_details']
+            entity, period = trial_balance_group(tb_file)
+            files.append({'filename': os.path.basename(tb_file), 'entity': entity, 'period': period,
+                          **pages.totals()})
+
+        comparisons = []
+        groups = defaultdict(list)
+        for tb in files:
+            comparisons.append(_tb_comparison('Debit vs credit', tb['filename'], tb['debit_total'], tb['credit_total']))
+            groups[tb['entity'], tb['period']].append(tb)
+
+        for group in groups.values():
+            reference = group[0]
+            for tb in group[1:]:
+                for column, label in TOTAL_LABELS:
+                    comparisons.append(_tb_comparison(f"Same period {label.lower()}",
+                                                      f"{reference['filename']} / {tb['filename']}",
+                                                      reference[column], tb[column]))
+
+        # One file per period of an entity (the first) carries its closing total into the next
+        # period of the same granularity: FY2023-24 does not follow 2023, nor 2024-Q1 2024-03
+        periods = defaultdict(list)
+        for (entity, period), group in groups.items():
+            if period is not None:
+                granularity, order = period_order(period)
+                periods[entity, granularity].append((order, group[0]))
+        for entity_periods in periods.values():
+            entity_periods.sort(key=lambda item: item[0])
+            for (_, earlier), (_, later) in zip(entity_periods, entity_periods[1:]):
+                comparisons.append(_tb_comparison('Closing vs next opening',
+                                                  f"{earlier['filename']} -> {later['filename']}",
+                                                  earlier['closing_balance_total'], later['opening_balance_total']))
+
+        failed = sum(not comparison['agrees'] for comparison in comparisons)
+        status = f"{len(files)} trial balance file(s), {failed} of {len(comparisons)} comparison(s) differ"
+        if not_comparable:
+            status += f"; {len(not_comparable)} not comparable"
+        return {
+            'status': status,
+            'consistent': bool(files) and failed == 0,
+            'difference': max((abs(comparison['difference']) for comparison in comparisons), default=0.0),
+            'debit_total': sum(tb['debit_total'] for tb in files),
+            'credit_total': sum(tb['credit_total'] for tb in files),
+            'files': files,
+            'comparisons': comparisons,
+            'not_comparable': not_comparable
+        }
 
-        if len(trial_balance_files) < 2:
-            return {'status': 'Less than 2 trial balance files found', 'consistent': False}
+    def analyze_zip_file(self, zip_path: str, progress_callback: Optional[Callable[[Dict], None]] = None,
+                         report_writer: Optional['ExcelReportWriter'] = None,
+                         cancel_token: Optional[CancellationToken] = None, estimate: Optional[Dict] = None) -> Dict:
+        """Main analysis function
+
+        progress_callback, if given, is called with a 'started' event once the PDFs are
+        known and a 'file' event (with the file's errors) after each PDF has been analyzed. If report_writer is
+        given, detail rows are streamed into it while the remaining files are parsed.
+        Cancelling cancel_token stops the run with AnalysisCancelled. estimate, a preflight()
+        of the same ZIP, gives the events' ETA its page counts.
+        """
+        return asyncio.run(self.analyze_zip_file_async(zip_path, progress_callback, report_writer, cancel_token,
+                                                       estimate))
+
+    async def analyze_zip_file_async(self, zip_path: str,
+                                     progress_callback: Optional[Callable[[Dict], None]] = None,
+                                     report_writer: Optional['ExcelReportWriter'] = None,
+                                     cancel_token: Optional[CancellationToken] = None,
+                                     estimate: Optional[Dict] = None) -> Dict:
+        """Staged analysis pipeline: read ZIP members, parse PDFs and aggregate results concurrently
+
+        Members are spooled to disk one at a time, parsed on the executor and aggregated in
+        archive order. At most `queue_depth` files are in flight between the reader and the
+        aggregator, so memory is bounded by queue depth rather than bundle size.
+        Once run_timeout has passed, the remaining files are skipped and a partial result is returned.
+        With checkpoint_dir set, files analyzed by an earlier run of the same bundle are taken
+        from the checkpoint instead of being parsed again.
+        On cancel, parses still queued are dropped and running ones stop at their next page,
+        so the executor is free for other work as soon as AnalysisCancelled is raised.
+        An archive that breaks the archive limits raises ArchiveRejected before anything is scheduled.
+        Progress events carry an ETA from the estimate (a preflight() result, or else one made from
+        member sizes), corrected as files finish; the cost model is calibrated on the run's timings.
+        """
+        cancel_token = cancel_token or CancellationToken()
+        cancel_token.raise_if_cancelled()
+        # The central directory alone shows a zip bomb or unsafe paths; refuse those before any work starts
+        check_archive(zip_path, self.archive_limits)
+        loop = asyncio.get_running_loop()
+        cancel_requested = asyncio.Event()
+        on_cancel = lambda: loop.call_soon_threadsafe(cancel_requested.set)
+        cancel_token.add_callback(on_cancel)
+        perf = PerfStats()
+        run_deadline = perf.started + self.run_timeout if self.run_timeout else None
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        worker_profile = (profiler.worker_dir, profiler.trace_memory) if profiler is not None else (None, False)
+        pdf_files: List[str] = []
+        worker_pids = set()
+        ANALYSES_IN_PROGRESS.inc()
+        spool_dir = tempfile.mkdtemp()
+        checkpoints = CheckpointStore.in_directory(self.checkpoint_dir, self.checkpoint_settings()) \
+            if self.checkpoint_dir else None
+        executor = self.executor
+        owns_executor = executor is None
+        if owns_executor:
+            executor = self.create_executor()
 
-        totals_comparison = []
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                # The central directory is enough to know the PDFs and missing files up front
+                members = pdf_members(zip_ref.infolist())
+                pdf_files = [info.filename for info in members]
+                missing_files = self.check_missing_files(pdf_files)
+                bundle = bundle_fingerprint(members)
+                restored = checkpoints.load(bundle, pdf_files) if checkpoints is not None else {}
+                if estimate is None or estimate['total_files'] != len(members):
+                    estimate = estimate_members(members, self.cost_model, self.max_workers)
+                eta = EtaTracker(estimate)
+
+                if progress_callback:
+                    progress_callback({'event': 'started', 'total_files': len(pdf_files),
+                                       'restored_files': len(restored), 'estimated_pages': estimate['total_pages'],
+                                       'estimated_seconds': estimate['seconds']})
+
+                window = asyncio.Semaphore(self.queue_depth)
+                read_times: Dict[int, float] = {}
+                # Local share of the queue/in-flight gauges, which are shared by concurrent runs
+                live = {'queued': 0, 'in_flight': 0}
+                parse_queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_workers)
+                result_queue: asyncio.Queue = asyncio.Queue()
+
+                async def read_members():
+                    # Stage 1: copy each member out of the archive (blocking I/O, off the loop)
+                    for index, info in enumerate(members):
+                        await window.acquire()
+                        if cancel_token.cancelled:
+                            return
+                        live['in_flight'] += 1
+                        FILES_IN_FLIGHT.inc()
+                        if index in restored:
+                            # Finished by an earlier run: straight to the aggregator
+                            read_times[index] = 0.0
+                            await result_queue.put((index, restored.pop(index)))
+                            continue
+                        spool_path = os.path.join(spool_dir, f"{index:06d}.pdf")
+                        started = time.perf_counter()
+                        if run_deadline is not None and started >= run_deadline:
+                            # Out of time: the parse stage records the file as skipped
+                            spool_path = None
+                        else:
+                            await loop.run_in_executor(None, _spool_zip_member, zip_ref, info, spool_path)
+                        read_times[index] = time.perf_counter() - started
+                        await parse_queue.put((index, spool_path))
+                        live['queued'] += 1
+                        PARSE_QUEUE_DEPTH.inc()
+                    for _ in range(self.max_workers):
+                        await parse_queue.put(None)
+
+                async def parse_members():
+                    # Stage 2: CPU-bound PDF parsing on the executor
+                    while True:
+                        item = await parse_queue.get()
+                        if item is None:
+                            return
+                        live['queued'] -= 1
+                        PARSE_QUEUE_DEPTH.dec()
+                        index, spool_path = item
+                        try:
+                            parsed = await self._parse_member(executor, spool_path, worker_profile, run_deadline,
+                                                              cancel_token)
+                        finally:
+                            if spool_path is not None:
+                                os.unlink(spool_path)
+                        if checkpoints is not None and parsed['status'] == FILE_ANALYZED:
+                            # Only complete files are kept; anything cut short is retried on resume
+                            checkpoints.save(bundle, index, pdf_files[index], parsed)
+                        await result_queue.put((index, parsed))
+
+                stages = [asyncio.ensure_future(read_members())]
+                stages += [asyncio.ensure_future(parse_members()) for _ in range(self.max_workers)]
+                cancel_waiter = asyncio.ensure_future(cancel_requested.wait())
 
-        for tb_file in trial_balance_files[:2]:  # Check first two files
-            page_results = self.extract_financial_tables(tb_file)
-            grand_total = 0
+                try:
+                    # Stage 3: aggregate totals and stream report rows in archive order
+                    all_results = []
+                    page_columns = PageColumns()
+                    rule_plan = RulePlan(self.rules)
+                    text_terms = BundleTextIndex() if self.text_index else None
+                    pending: Dict[int, Dict] = {}
+
+                    while len(all_results) < len(members):
+                        result_waiter = asyncio.ensure_future(result_queue.get())
+                        done, _ = await asyncio.wait([result_waiter, cancel_waiter] + stages,
+                                                     return_when=asyncio.FIRST_COMPLETED)
+                        if cancel_token.cancelled:
+                            result_waiter.cancel()
+                            cancel_token.raise_if_cancelled()
+                        if result_waiter not in done:
+                            result_waiter.cancel()
+                            # A stage finished early; surface its exception if it failed
+                            for stage in done:
+                                stage.result()
+                            stages = [stage for stage in stages if not stage.done()]
+                            continue
+
+                        index, parsed = result_waiter.result()
+                        pending[index] = parsed
+
+                        while len(all_results) in pending:
+                            index = len(all_results)
+                            parsed = pending.pop(index)
+                            page_results = parsed['pages']
+                            pdf_file = pdf_files[index]
+                            info = members[index]
+                            file_perf = perf.add_file(os.path.basename(pdf_file), info.file_size, info.compress_size,
+                                                      read_times.pop(index, 0.0), parsed)
+                            record_file_metrics(file_perf)
+                            eta.file_done(index, parsed['parse_seconds'], parsed.get('restored', False))
+                            if not parsed.get('restored'):
+                                worker_pids.add(parsed['worker_pid'])
+                            for error in parsed['errors']:
+                                report_file_error(pdf_file, error)
+                            if text_terms is not None:
+                                with perf.stage('index'):
+                                    text_terms.add_file(os.path.basename(pdf_file), page_results)
+
+                            with perf.stage('aggregate'):
+                                file_summary = self.summarize_file(pdf_file, page_results, page_columns)
+                                file_summary['status'] = parsed['status']
+                                file_summary['peak_memory_bytes'] = parsed['peak_rss_bytes']
+                                file_summary['timed_out_pages'] = [page['page'] for page in page_results
+                                                                   if page.get('timed_out')]
+                            with perf.stage('checks'):
+                                rule_plan.add_file(index, file_summary['filename'], file_summary['page_details'])
+                            all_results.append(file_summary)
+                            if report_writer is not None:
+                                with perf.stage('report'):
+                                    report_writer.add_file(file_summary)
+                            window.release()
+                            live['in_flight'] -= 1
+                            FILES_IN_FLIGHT.dec()
+
+                            if progress_callback:
+                                progress_callback({
+                                    'event': 'file',
+                                    'index': index + 1,
+                                    'total_files': len(pdf_files),
+                                    'filename': file_summary['filename'],
+                                    'pages': file_summary['pages'],
+                                    'status': file_summary['status'],
+                                    'errors': parsed['errors'],
+                                    'eta_seconds': eta.eta_seconds()
+                                })
+                finally:
+                    cancel_waiter.cancel()
+                    for stage in stages:
+                        stage.cancel()
+                    # Cancelling the parse stages interrupts their in-flight parses
+                    await asyncio.gather(*stages, return_exceptions=True)
+                    # Files still queued or in flight if the run was aborted
+                    PARSE_QUEUE_DEPTH.dec(live['queued'])
+                    FILES_IN_FLIGHT.dec(live['in_flight'])
+
+            with perf.stage('checks'):
+                # Check receipt/payment balance
+                receipt_payment_check = {'status': 'No financial data found', 'equal': False}
+                if pdf_files:
+                    # Use the first PDF for receipt/payment check
+                    receipt_payment_check = self.check_receipt_payment_balance(all_results[0]['last_page_totals'])
+
+                # Check trial balance consistency on the page columns of the files already summarized
+                trial_balance_check = self.check_trial_balance_consistency(
+                    pdf_files, {pdf_file: file_summary['page_details'] for pdf_file, file_summary in zip(pdf_files, all_results)},
+                    {pdf_file: file_summary['status'] for pdf_file, file_summary in zip(pdf_files, all_results)})
+                rule_checks = rule_plan.finish()
+
+            if text_terms is not None:
+                with perf.stage('index'):
+                    text_index = TextIndex(self.text_index)
+                    try:
+                        text_index.add_bundle(bundle, os.path.basename(zip_path), text_terms)
+                    finally:
+                        text_index.close()
+
+            perf_summary = perf.to_dict()
+            perf_summary['estimate'] = {key: value for key, value in estimate.items() if key != 'files'}
+            record_run_metrics(perf_summary)
+            if self.cost_model.path:
+                self.cost_model.calibrate(perf_summary['files'])
+                self.cost_model.save()
+
+            # Files the analysis could not finish, and whether the run itself ran out of time
+            incomplete_files = [{'filename': f['filename'], 'status': f['status'], 'timed_out_pages': f['timed_out_pages']}
+                                for f in all_results if f['status'] != FILE_ANALYZED]
 
-            for page in page_results:
-                for table in page.get('tables', []):
-                    financial_data = table.get('financial_data', {})
-                    totals = financial_data.get('totals', {})
-                    grand_total += sum(totals.values())
+            return {
+                'bundle_fingerprint': bundle,
+                'text_index': self.text_index,
+                'total_pdf_files': len(pdf_files),
+                'missing_files': missing_files,
+                'file_analysis': all_results,
+                'page_columns': page_columns,
+                'incomplete_files': incomplete_files,
+                'partial': any(f['status'].endswith(RUN_TIME_BUDGET) for f in incomplete_files),
+                'receipt_payment_verification': receipt_payment_check,
+                'trial_balance_verification': trial_balance_check,
+                'rule_checks': rule_checks,
+                'perf': perf_summary
+            }
 
-            totals_comparison.append(grand_total)
+        except AnalysisCancelled:
+            ANALYSES_CANCELLED.inc()
+            raise
 
-        consistent = abs(totals_comparison[0] - totals_comparison[1]) < 0.01 if len(totals_comparison) == 2 else False
+        finally:
+            cancel_token.remove_callback(on_cancel)
+            ANALYSES_IN_PROGRESS.dec()
+            if profiler is not None:
+                profiler.stop({f"{index:06d}": name for index, name in enumerate(pdf_files)})
+            if owns_executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                # This run's workers exit with the pool; stop reporting their memory
+                for pid in worker_pids:
+                    WORKER_RSS.remove(pid)
+            # Clean up temporary directory
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            if checkpoints is not None:
+                checkpoints.close()
+
+    async def _parse_member(self, executor: Executor, spool_path: Optional[str], worker_profile: Tuple,
+                            run_deadline: Optional[float], cancel_token: CancellationToken) -> Dict:
+        """Parse one spooled PDF on the executor within the page, document and run time limits
+
+        A page that overruns page_timeout is recorded as timed out and parsing resumes from the
+        next page in a fresh worker. Document and run limits keep the pages parsed so far.
+        Returns a _parse_pdf_worker result whose status says what, if anything, was left out.
+        """
+        started = time.perf_counter()
+        document_deadline = started + self.document_timeout if self.document_timeout else None
+        pages: List[Dict] = []
+        errors: List[str] = []
+        start_page = 1
+        index_text = self.text_index is not None
+        reason = None
+        worker_pid = worker_rss = peak_rss = 0
+
+        while True:
+            now = time.perf_counter()
+            if spool_path is None or (run_deadline is not None and now >= run_deadline):
+                reason = RUN_TIME_BUDGET
+                break
+            if document_deadline is not None and now >= document_deadline:
+                reason = DOCUMENT_TIMEOUT
+                break
+            deadlines = [deadline for deadline in (run_deadline, document_deadline) if deadline is not None]
+            timeout = min(deadlines) - now if deadlines else None
+
+            max_pages = self.archive_limits.max_pages
+            if isinstance(executor, WorkerPool):
+                # Finished pages only travel with the heartbeats when a timeout could salvage them
+                future = executor.submit_with_timeout(timeout, self.page_timeout, _parse_pdf_worker,
+                                                      spool_path, *worker_profile, start_page, index_text,
+                                                      max_pages=max_pages,
+                                                      keep_pages=timeout is not None or self.page_timeout is not None)
+            elif isinstance(executor, ThreadPoolExecutor):
+                # Same process: the parse checks the token itself between pages
+                future = executor.submit(_parse_pdf_worker, spool_path, *worker_profile, start_page, index_text,
+                                         cancel_token, max_pages=max_pages)
+            else:
+                # Executors without a supervisor cannot stop a running parse
+                future = executor.submit(_parse_pdf_worker, spool_path, *worker_profile, start_page, index_text,
+                                         max_pages=max_pages)
+            try:
+                result = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # The run was aborted or cancelled; give the worker back to the queue
+                if isinstance(executor, WorkerPool):
+                    executor.interrupt(future)
+                raise
+            except PageLimitExceeded as e:
+                # Nothing was parsed: the page count is read before the first page
+                reason = PAGE_LIMIT
+                errors.append(f"{reason} ({e})")
+                break
+            except WorkerLost as e:
+                worker_pid = e.pid
+                if isinstance(e, MemoryBudgetExceeded):
+                    # The whole file is dropped; its pages may be what pushed the worker over
+                    peak_rss = max(peak_rss, e.rss_bytes)
+                    pages = []
+                    reason = MEMORY_BUDGET
+                elif isinstance(e, TaskTimeout):
+                    # Keep the pages the worker finished and reported before it was killed
+                    pages.extend(page for _, page in e.progress if page is not None)
+                    started_pages = [page_num for page_num, page in e.progress if page is None]
+                    if e.heartbeat and started_pages:
+                        page_num = started_pages[-1]
+                        pages.append(_timed_out_page(page_num, e.seconds))
+                        errors.append(f"page {page_num} timed out after {e.seconds:.1f}s")
+                        reason = PAGE_TIMEOUT
+                        start_page = page_num + 1
+                        continue
+                    if run_deadline is not None and time.perf_counter() >= run_deadline:
+                        reason = RUN_TIME_BUDGET
+                    else:
+                        reason = DOCUMENT_TIMEOUT
+                else:
+                    reason = WORKER_EXITED
+                errors.append(f"{reason} ({e})")
+                break
+
+            pages.extend(result['pages'])
+            errors.extend(result['errors'])
+            worker_pid, worker_rss = result['worker_pid'], result['worker_rss_bytes']
+            peak_rss = max(peak_rss, result['peak_rss_bytes'])
+            break
 
         return {
-            'file1_total': totals_comparison[0] if len(totals_comparison) > 0 else 0,
-            'file2_total': totals_comparison[1] if len(totals_comparison) > 1 else 0,
-            'consistent': consistent,
-            'difference': abs(totals_comparison[0] - totals_comparison[1]) if len(totals_comparison) == 2 else 0
+            'pages': pages,
+            'errors': errors,
+            'parse_seconds': time.perf_counter() - started,
+            'worker_pid': worker_pid,
+            'worker_rss_bytes': worker_rss,
+            'peak_rss_bytes': peak_rss,
+            'status': FILE_ANALYZED if reason is None else f"{'partial' if pages else 'skipped'}: {reason}"
         }
 
-    def analyze_zip_file(self, zip_path: str) -> Dict:
-        """Main analysis function"""
-        # Extract ZIP file
-        extract_path = self.extract_zip_file(zip_path)
+    def analyze_zip_files(self, zip_paths: List[str], progress_callback: Optional[Callable[[Dict], None]] = None,
+                          report_writer: Optional['BatchReportWriter'] = None,
+                          cancel_token: Optional[CancellationToken] = None,
+                          on_bundle: Optional[Callable[[str, Dict], None]] = None,
+                          bundles_in_flight: int = BATCH_BUNDLES_IN_FLIGHT) -> List[Dict]:
+        """Analyze several bundles together; see analyze_zip_files_async"""
+        return asyncio.run(self.analyze_zip_files_async(zip_paths, progress_callback, report_writer, cancel_token,
+                                                        on_bundle, bundles_in_flight))
+
+    async def analyze_zip_files_async(self, zip_paths: List[str],
+                                      progress_callback: Optional[Callable[[Dict], None]] = None,
+                                      report_writer: Optional['BatchReportWriter'] = None,
+                                      cancel_token: Optional[CancellationToken] = None,
+                                      on_bundle: Optional[Callable[[str, Dict], None]] = None,
+                                      bundles_in_flight: int = BATCH_BUNDLES_IN_FLIGHT) -> List[Dict]:
+        """Analyze a batch of bundles as concurrent pipelines on one shared parse pool
+
+        Up to bundles_in_flight bundles run at once, so the pool's workers (and the analyzer each
+        keeps) go straight on to the next bundle instead of idling on one bundle's last files;
+        checkpoints and the text index are shared as well. Each bundle's detail rows stream into
+        its sheet of report_writer. A finished bundle's results go to on_bundle (to store them,
+        say; it runs on a thread, off the event loop) and are then reduced to a batch_summary row,
+        so memory follows the bundles in flight rather than the batch. A bundle that fails, or
+        whose on_bundle raises, is reported in its row and the others go on.
+        progress_callback gets each bundle's events with a 'bundle' key added.
+        Returns the summary rows in input order.
+        """
+        cancel_token = cancel_token or CancellationToken()
+        executor = self.executor or self.create_executor()
+        slots = asyncio.Semaphore(max(1, bundles_in_flight))
+
+        async def run(zip_path: str) -> Dict:
+            name = os.path.basename(zip_path)
+            async with slots:
+                analyzer = FinancialDocumentAnalyzer(
+                    max_workers=self.max_workers, executor=executor, memory_budget_mb=self.memory_budget_mb,
+                    page_timeout=self.page_timeout, document_timeout=self.document_timeout,
+                    run_timeout=self.run_timeout, checkpoint_dir=self.checkpoint_dir, text_index=self.text_index,
+                    rules=self.rules, archive_limits=self.archive_limits, cost_model=self.cost_model)
+                # Concurrent runs cannot share one profiler
+                analyzer.profiler = None
+                writer = report_writer.bundle(name) if report_writer is not None else None
+                on_progress = (lambda event: progress_callback({**event, 'bundle': name})) if progress_callback else None
+                try:
+                    results = await analyzer.analyze_zip_file_async(zip_path, on_progress, writer, cancel_token)
+                    if on_bundle is not None:
+                        # Storing results is blocking work; the other bundles' pipelines keep the loop
+                        await asyncio.get_running_loop().run_in_executor(None, on_bundle, zip_path, results)
+                except AnalysisCancelled:
+                    raise
+                except ArchiveRejected as e:
+                    return batch_summary(name, None, error=f"archive rejected: {e}", sheet=writer and writer.title)
+                except Exception as e:
+                    return batch_summary(name, None, error=str(e), sheet=writer and writer.title)
+            return batch_summary(name, results, sheet=writer and writer.title)
 
         try:
-            # Find PDF files
-            pdf_files = self.find_pdf_files(extract_path)
-
-            # Check for missing files
-            missing_files = self.check_missing_files(pdf_files)
-
-            # Analyze each PDF
-            all_results = []
-            for pdf_file in pdf_files:
-                file_results = self.extract_financial_tables(pdf_file)
-
-                # Compile results for this file
-                file_summary = {
-                    'filename': os.path.basename(pdf_file),
-                    'pages': len(file_results),
-                    'blank_pages': sum(1 for page in file_results if page['is_blank']),
-                    'financial_tables': sum(len(page['tables']) for page in file_results),
-                    'page_details': []
-                }
-
-                # Add page-level details
-                for page in file_results:
-                    page_detail = {
-                        'page_number': page['page'],
-                        'is_blank': page['is_blank'],
-                        'opening_balance_total': 0,
-                        'debit_total': 0,
-                        'credit_total': 0,
-                        'closing_balance_total': 0
-                    }
-
-                    for table in page['tables']:
-                        financial_data = table.get('financial_data', {})
-                        totals = financial_data.get('totals', {})
-
-                        page_detail['opening_balance_total'] += totals.get('opening_balance', 0)
-                        page_detail['debit_total'] += totals.get('debit', 0)
-                        page_detail['credit_total'] += totals.get('credit', 0)
-                        page_detail['closing_balance_total'] += totals.get('closing_balance', 0)
+            return await asyncio.gather(*(run(zip_path) for zip_path in zip_paths))
+        finally:
+            if self.executor is None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def checkpoint_settings(self) -> Dict:
+        """Settings that shape parsed results: a checkpoint made under other settings is parsed again"""
+        return {'index_text': self.text_index is not None, 'max_pages': self.archive_limits.max_pages,
+                'rules': [rule.spec for rule in self.rules]}
+
+    def create_executor(self) -> Executor:
+        """Executor for a run without a shared one: worker processes, or one thread when that is enough"""
+        # Limits are enforced by killing workers, which needs worker processes
+        limited = self.memory_budget_mb or self.page_timeout or self.document_timeout or self.run_timeout
+        if self.max_workers > 1 or limited:
+            return self.create_worker_pool()
+        return ThreadPoolExecutor(max_workers=1)
+
+    def create_worker_pool(self) -> WorkerPool:
+        """Process pool with this analyzer's memory budget and recycling settings"""
+        return WorkerPool(max_workers=self.max_workers,
+                          memory_budget_bytes=self.memory_budget_mb * 1024 ** 2 if self.memory_budget_mb else None,
+                          max_tasks_per_worker=self.max_files_per_worker)
+
+    def summarize_file(self, pdf_file: str, file_results: List[Dict],
+                       page_columns: Optional[PageColumns] = None) -> Dict:
+        """Compile per-file counts and per-page financial totals from parsed pages
+
+        Page details are appended to page_columns (a new one if not given) and page_details is a
+        view of this file's rows. last_page_totals sums the tables on the last page as printed,
+        b/f rows included, for the receipt-payment check.
+        """
+        if page_columns is None:
+            page_columns = PageColumns()
+        file_id = page_columns.add_file(os.path.basename(pdf_file))
+        first_row = len(page_columns)
+        file_summary = {
+            'filename': os.path.basename(pdf_file),
+            'pages': len(file_results),
+            'blank_pages': sum(1 for page in file_results if page['is_blank']),
+            'financial_tables': sum(len(page['tables']) for page in file_results),
+            'unreconciled_rows': 0,
+            'reconciliation_failures': [],
+            'last_page_totals': None
+        }
 
-                    file_summary['page_details'].append(page_detail)
+        # Add page-level details; a ledger's b/f row is only counted on the page that opens it
+        tracker = TableContinuationTracker()
+        for page in file_results:
+            opening_balance = debit = credit = closing_balance = 0.0
+            unreconciled_rows = 0
+            for table, (totals, _) in zip(page['tables'], tracker.add_page(page)):
+                reconciliation = table.get('financial_data', {}).get('reconciliation')
+                if reconciliation:
+                    unreconciled_rows += reconciliation['failed_count']
+                    file_summary['reconciliation_failures'].extend(
+                        {'page': page['page'], 'table': table['table_index'], **failure}
+                        for failure in reconciliation['failed_rows'])
+
+                opening_balance += totals.get('opening_balance', 0)
+                debit += totals.get('debit', 0)
+                credit += totals.get('credit', 0)
+                closing_balance += totals.get('closing_balance', 0)
+
+            file_summary['unreconciled_rows'] += unreconciled_rows
+            page_columns.append(file_id, (page['page'], page['is_blank'], page.get('timed_out', False),
+                                          opening_balance, debit, credit, closing_balance,
+                                          len(page['tables']), unreconciled_rows))
+
+        if file_results:
+            last_page_totals = defaultdict(float)
+            for table in file_results[-1]['tables']:
+                financial_data = table.get('financial_data', {})
+                for totals in (financial_data.get('totals', {}), financial_data.get('brought_forward', {})):
+                    for column, amount in totals.items():
+                        last_page_totals[column] += amount
+            file_summary['last_page_totals'] = dict(last_page_totals)
+
+        tracker.close()
+        file_summary['continued_tables'] = tracker.stitched_tables
+        file_summary['carry_mismatches'] = tracker.total_carry_mismatches
+        file_summary['page_details'] = FilePages(page_columns, first_row, len(page_columns))
+        return file_summary
+
+def _spool_zip_member(zip_ref: zipfile.ZipFile, info: zipfile.ZipInfo, spool_path: str):
+    """Stream one archive member to disk without holding it in memory, no further than its declared size"""
+    with open(spool_path, 'wb') as target:
+        copy_member(zip_ref, info, target)
+
+_worker_analyzer: Optional[FinancialDocumentAnalyzer] = None
+
+def _parse_pdf_worker(pdf_path: str, profile_dir: Optional[str] = None, trace_memory: bool = False,
+                      start_page: int = 1, index_text: bool = False,
+                      cancel_token: Optional[CancellationToken] = None, max_pages: Optional[int] = None,
+                      keep_pages: bool = False, pages: Optional[List[int]] = None) -> Dict:
+    """Executor entry point: parse one PDF and return its page results, errors, parse time and worker memory
+
+    Each page start is sent to the pool as a heartbeat, so a supervising WorkerPool can time
+    out single pages or interrupt the parse. With keep_pages, each finished page result is sent
+    too, so the pool can keep the pages finished before a timeout killed the worker; otherwise
+    the pages only travel once, in the result. In-process (thread) parses are stopped through
+    cancel_token instead. With pages, only those page numbers are parsed.
+
+    peak_rss_bytes covers this parse only where the kernel lets the peak be reset (Linux);
+    elsewhere it is the worker's lifetime peak.
+
+    With profile_dir set, the parse is profiled and its stats are left in profile_dir
+    for the parent to merge.
+    """
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = FinancialDocumentAnalyzer()
+
+    profile = None
+    # Memory tracing is per process; in the parent's thread pool the run-level trace covers it
+    trace_memory = trace_memory and multiprocessing.parent_process() is not None
+    if profile_dir:
+        if trace_memory:
+            tracemalloc.stop()
+            tracemalloc.start()
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active in this process (Python 3.12+ monitoring)
+            profile = None
+
+    _reset_peak_rss()
+    started = time.perf_counter()
+    errors: List[str] = []
+
+    def page_callback(page_num: int, page_result: Optional[Dict]):
+        if page_result is None or keep_pages:
+            heartbeat((page_num, page_result))
+
+    try:
+        page_results = _worker_analyzer.extract_financial_tables(
+            pdf_path, errors=errors, start_page=start_page, page_callback=page_callback,
+            cancel_token=cancel_token, index_text=index_text, max_pages=max_pages, pages=pages)
+    finally:
+        elapsed = time.perf_counter() - started
+        if profile_dir:
+            stem = os.path.splitext(os.path.basename(pdf_path))[0]
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(os.path.join(profile_dir, stem + ".pstats"))
+            if trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                with open(os.path.join(profile_dir, stem + ".mem.json"), 'w') as f:
+                    json.dump({'peak_bytes': peak}, f)
+    return {
+        'pages': page_results,
+        'errors': errors,
+        'parse_seconds': elapsed,
+        'worker_pid': os.getpid(),
+        'worker_rss_bytes': _current_rss(),
+        'peak_rss_bytes': _peak_rss(),
+        'status': FILE_ANALYZED
+    }
+
+def _timed_out_page(page_num: int, seconds: float) -> Dict:
+    """Placeholder page result for a page abandoned after the page timeout"""
+    return {
+        'page': page_num,
+        'is_blank': False,
+        'tables': [],
+        'text_preview': "",
+        'raw_tables': 0,
+        'timings': {},
+        'timed_out': True,
+        'timeout_seconds': seconds
+    }
+
+HEADER_FONT = Font(bold=True)
+HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+
+class ExcelReportWriter:
+    """
+    Streaming Excel report builder.
+    Detail rows are written as each file is analyzed; summary sheets are added by finalize().
+    """
 
-                all_results.append(file_summary)
+    SLOWEST_PAGES = 25
 
-            # Check receipt/payment balance
-            receipt_payment_check = {'status': 'No financial data found', 'equal': False}
-            if pdf_files:
-                # Use the first PDF for receipt/payment check
-                first_pdf_results = self.extract_financial_tables(pdf_files[0])
-                receipt_payment_check = self.check_receipt_payment_balance(first_pdf_results)
+    DETAIL_HEADERS = ["File Name", "Page", "Is Blank", "Opening Balance Total",
+                      "Debit Total", "Credit Total", "Closing Balance Total", "Timed Out", "Unreconciled Rows"]
 
-            # Check trial balance consistency
-            trial_balance_check = self.check_trial_balance_consistency(pdf_files)
+    def __init__(self):
+        # Time spent building the report, shown on the Performance sheet
+        self.seconds = 0.0
+        # Write-only mode flushes rows to disk instead of keeping every cell in memory
+        self.wb = openpyxl.Workbook(write_only=True)
+
+        # Sheets appear in creation order, so create Summary first and fill it in at the end
+        self.summary_ws = self.wb.create_sheet("Summary")
+        self.summary_ws.column_dimensions['A'].width = 28
+        self.summary_ws.column_dimensions['B'].width = 16
+
+        self.detail_ws = self.wb.create_sheet("Detailed Analysis")
+        self.detail_ws.column_dimensions['A'].width = 50
+        for column in "BCDEFGHI":
+            self.detail_ws.column_dimensions[column].width = 24
+        self.detail_ws.append(self._header_row(self.detail_ws, self.DETAIL_HEADERS))
+
+    @staticmethod
+    def _header_row(ws, headers: List[str], fill: bool = True) -> List[WriteOnlyCell]:
+        row = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = HEADER_FONT
+            if fill:
+                cell.fill = HEADER_FILL
+            row.append(cell)
+        return row
+
+    def add_file(self, file_analysis: Dict):
+        """Append the page-level detail rows for one analyzed file"""
+        started = time.perf_counter()
+        _append_detail_rows(self.detail_ws, file_analysis)
+        self.seconds += time.perf_counter() - started
+
+    def finalize(self, analysis_results: Dict) -> bytes:
+        """Write the summary, missing-file and verification sheets and return the workbook bytes"""
+        started = time.perf_counter()
+        incomplete_files = analysis_results.get('incomplete_files', [])
+        # Summary sheet
+        self.summary_ws.append(self._header_row(self.summary_ws, ["Metric", "Value"]))
+        summary_data = [
+            ["Total PDF Files", analysis_results['total_pdf_files']],
+            ["Missing Files Count", len(analysis_results['missing_files'])],
+            ["Run Status", "Partial (run time budget reached)" if analysis_results.get('partial') else "Complete"],
+            ["Incomplete Files", len(incomplete_files)],
+            ["Timed-Out Pages", sum(len(f['timed_out_pages']) for f in incomplete_files)],
+            ["Receipt-Payment Balance", "Equal" if analysis_results['receipt_payment_verification']['equal'] else "Not Equal"],
+            ["Trial Balance Consistency", "Consistent" if analysis_results['trial_balance_verification']['consistent'] else "Inconsistent"],
+            ["Unreconciled Rows", sum(f.get('unreconciled_rows', 0) for f in analysis_results['file_analysis'])],
+            ["Continued Tables", sum(len(f.get('continued_tables', [])) for f in analysis_results['file_analysis'])],
+            ["Carry-Forward Mismatches", sum(f.get('carry_mismatches', 0) for f in analysis_results['file_analysis'])]
+        ]
+        rule_checks = analysis_results.get('rule_checks')
+        if rule_checks:
+            summary_data.append(["Validation Rules Failed", rules_failed(rule_checks)])
+        comparison = analysis_results.get('period_comparison')
+        if comparison:
+            summary_data.append(["Period Variances Flagged", comparison['flagged_files']])
+        for row in summary_data:
+            self.summary_ws.append(row)
+
+        # Missing Files sheet
+        missing_ws = self.wb.create_sheet("Missing Files")
+        missing_ws.column_dimensions['A'].width = _column_width(["Missing Files"] + analysis_results['missing_files'])
+        missing_ws.append(self._header_row(missing_ws, ["Missing Files"], fill=False))
+        for missing_file in analysis_results['missing_files']:
+            missing_ws.append([missing_file])
+
+        # Incomplete Files sheet: files skipped or cut short by a memory or time limit
+        incomplete_ws = self.wb.create_sheet("Incomplete Files")
+        incomplete_ws.column_dimensions['A'].width = 50
+        incomplete_ws.column_dimensions['B'].width = 28
+        incomplete_ws.column_dimensions['C'].width = 24
+        incomplete_ws.append(self._header_row(incomplete_ws, ["File Name", "Status", "Timed-Out Pages"]))
+        for incomplete in incomplete_files:
+            incomplete_ws.append([incomplete['filename'], incomplete['status'],
+                                  ", ".join(str(page) for page in incomplete['timed_out_pages'])])
+
+        # Verification sheet
+        rp_check = analysis_results['receipt_payment_verification']
+        tb_check = analysis_results['trial_balance_verification']
+        verification_rows = [
+            ["Receipt-Payment Balance", "Equal" if rp_check['equal'] else "Not Equal",
+             f"Receipt: {rp_check.get('receipt_total', 0)}, Payment: {rp_check.get('payment_total', 0)}"],
+            ["Trial Balance Consistency", "Consistent" if tb_check['consistent'] else "Inconsistent",
+             tb_check.get('status', '')]
+        ]
+        verification_rows.extend(
+            [f"Trial Balance: {comparison['check']}", "Agrees" if comparison['agrees'] else "Differs",
+             f"{comparison['files']}: {comparison['left']:,.2f} vs {comparison['right']:,.2f}"]
+            for comparison in tb_check.get('comparisons', []))
+        verification_rows.extend(["Trial Balance: not comparable", tb['status'], tb['filename']]
+                                 for tb in tb_check.get('not_comparable', []))
+        verification_ws = self.wb.create_sheet("Verification")
+        headers = ["Verification Type", "Status", "Details"]
+        for column, values in zip("ABC", zip(headers, *verification_rows)):
+            verification_ws.column_dimensions[column].width = _column_width(values)
+        verification_ws.append(self._header_row(verification_ws, headers))
+        for row in verification_rows:
+            verification_ws.append(row)
+
+        # Row Reconciliation sheet: ledger rows where opening + debit - credit != closing
+        reconciliation_ws = self.wb.create_sheet("Row Reconciliation")
+        reconciliation_ws.column_dimensions['A'].width = 50
+        for column in "BCDEFGHI":
+            reconciliation_ws.column_dimensions[column].width = 18
+        reconciliation_ws.append(self._header_row(reconciliation_ws, [
+            "File Name", "Page", "Table", "Row", "Opening Balance", "Debit", "Credit", "Closing Balance",
+            "Difference"]))
+        for file_analysis in analysis_results['file_analysis']:
+            for failure in file_analysis.get('reconciliation_failures', []):
+                reconciliation_ws.append([file_analysis['filename'], failure['page'], failure['table'], failure['row'],
+                                          *(round(failure[key], 2) for key in ('opening_balance', 'debit', 'credit',
+                                                                               'closing_balance', 'difference'))])
+
+        # Validation Rules sheet: one row per configured rule, then the failures they listed
+        if rule_checks:
+            self._write_rules_sheet(rule_checks)
+
+        # Continued Tables sheet: ledgers stitched across pages, with their totals over all pages
+        continued_ws = self.wb.create_sheet("Continued Tables")
+        continued_ws.column_dimensions['A'].width = 50
+        for column in "BCDEFGHI":
+            continued_ws.column_dimensions[column].width = 18
+        continued_ws.append(self._header_row(continued_ws, [
+            "File Name", "First Page", "Last Page", "Pages", "Opening Balance", "Debit", "Credit",
+            "Closing Balance", "Carry Mismatches"]))
+        for file_analysis in analysis_results['file_analysis']:
+            for table in file_analysis.get('continued_tables', []):
+                continued_ws.append([file_analysis['filename'], table['first_page'], table['last_page'], table['pages'],
+                                     *(round(table['totals'].get(key, 0), 2) for key in ('opening_balance', 'debit',
+                                                                                          'credit', 'closing_balance')),
+                                     table['carry_mismatches']])
+
+        # Period Comparison sheet: only when the run was compared with a stored prior period
+        if comparison:
+            self._write_comparison_sheet(comparison)
+
+        # Performance sheet
+        if analysis_results.get('perf'):
+            self.seconds += time.perf_counter() - started
+            started = time.perf_counter()
+            self._write_performance_sheet(analysis_results['perf'])
+
+        # Save to bytes
+        excel_file = io.BytesIO()
+        self.wb.save(excel_file)
+        self.seconds += time.perf_counter() - started
+        REPORT_SECONDS.observe(self.seconds)
+        return excel_file.getvalue()
+
+    def _write_rules_sheet(self, rule_checks: List[Dict]):
+        ws = self.wb.create_sheet("Validation Rules")
+        ws.column_dimensions['A'].width = 40
+        ws.column_dimensions['B'].width = 50
+        for column in "CDEFG":
+            ws.column_dimensions[column].width = 16
+        ws.append(self._header_row(ws, ["Rule", "Description", "Severity", "Scope", "Evaluated", "Failed", "Status"]))
+        for outcome in rule_checks:
+            ws.append([outcome['name'], outcome['description'], outcome['severity'], outcome['scope'],
+                       outcome['evaluated'], outcome['failed'],
+                       _yes_no(outcome['passed'], "Passed", "Failed") or "Not applicable"])
+
+        ws.append([])
+        ws.append(self._header_row(ws, ["Rule", "File Name", "Page", "Left", "Right", "Difference"], fill=False))
+        for outcome in rule_checks:
+            for failure in outcome['failures']:
+                ws.append([outcome['name'], failure['filename'], failure['page'], round(failure['left'], 2),
+                           round(failure['right'], 2), round(failure['difference'], 2)])
+
+    def _write_comparison_sheet(self, comparison: Dict):
+        """File totals against the prior period, then the pages whose totals moved past the threshold"""
+        ws = self.wb.create_sheet("Period Comparison")
+        ws.column_dimensions['A'].width = 50
+        for column in "BCDEFGHIJKLMN":
+            ws.column_dimensions[column].width = 16
+        ws.column_dimensions['O'].width = 20
+
+        ws.append(self._header_row(ws, ["Compared With", describe_prior(comparison)], fill=False))
+        ws.append(["Variance Threshold", f"{comparison['threshold']:.0%}"])
+        ws.append([])
+
+        headers = ["File Name", "Prior File Name"]
+        for _, label in TOTAL_LABELS:
+            headers += [f"{label} Current", f"{label} Prior", f"{label} Change %"]
+        ws.append(self._header_row(ws, headers + ["Status"]))
+        for row in comparison['files']:
+            values = [row['filename'], row['prior_filename']]
+            for column, _ in TOTAL_LABELS:
+                change = row['totals'].get(column)
+                if change is None:
+                    values += [None, None, None]
+                    continue
+                values += [round(change['current'], 2), round(change['prior'], 2), _change_pct(change)]
+            status = "Variance" if row['flagged'] else row['status'].capitalize()
+            ws.append(values + [status])
+        ws.append([])
+
+        ws.append(self._header_row(ws, ["Flagged Pages", "Page", "Total", "Current", "Prior", "Change",
+                                        "Change %"]))
+        labels = dict(TOTAL_LABELS)
+        for page in comparison['pages']:
+            ws.append([page['filename'], page['page_number'], labels[page['column']], round(page['current'], 2),
+                       round(page['prior'], 2), round(page['change'], 2), _change_pct(page)])
+
+    def _write_performance_sheet(self, perf: Dict):
+        """Run, stage, per-file and slowest-page timings"""
+        ws = self.wb.create_sheet("Performance")
+        ws.column_dimensions['A'].width = 50
+        for column in "BCDEFGHIJK":
+            ws.column_dimensions[column].width = 18
+        ws.column_dimensions['L'].width = 24
+
+        ws.append(self._header_row(ws, ["Metric", "Value"]))
+        ws.append(["Wall Time (s)", round(perf['wall_seconds'], 3)])
+        ws.append(["Total Pages", perf['total_pages']])
+        ws.append(["Pages/sec", round(perf['pages_per_sec'], 2)])
+        ws.append(["Bytes Read", perf['total_bytes_read']])
+        if perf.get('estimate'):
+            ws.append(["Estimated Pages", perf['estimate']['total_pages']])
+            ws.append(["Estimated Time (s)", round(perf['estimate']['seconds'], 3)])
+        ws.append([])
+
+        stages = dict(perf['stages'])
+        stages['report'] = self.seconds
+        ws.append(self._header_row(ws, ["Stage", "Seconds"]))
+        for stage, seconds in sorted(stages.items(), key=lambda item: -item[1]):
+            ws.append([stage, round(seconds, 3)])
+        ws.append([])
+
+        ws.append(self._header_row(ws, ["File Name", "Pages", "Bytes Read", "Read (s)", "Parse (s)", "Pages/sec",
+                                        "Tables/Page", "Extract Text (s)", "Extract Tables (s)", "Analyze Tables (s)",
+                                        "Peak Memory (MB)", "Status"]))
+        for file_perf in perf['files']:
+            page_timings = file_perf['page_timings']
+            ws.append([
+                file_perf['filename'],
+                file_perf['pages'],
+                file_perf['bytes_read'],
+                round(file_perf['read_seconds'], 3),
+                round(file_perf['parse_seconds'], 3),
+                round(file_perf['pages_per_sec'], 2),
+                round(file_perf['tables_per_page'], 2),
+                *[round(sum(page[f'{name}_seconds'] for page in page_timings), 3) for name in PAGE_STAGES],
+                round(file_perf['peak_rss_bytes'] / 1024 ** 2, 1),
+                file_perf['status']
+            ])
+        ws.append([])
+
+        ws.append(self._header_row(ws, ["Slowest Pages", "Page", "Seconds", "Tables", "Raw Tables",
+                                        "Extract Text (s)", "Extract Tables (s)", "Analyze Tables (s)"]))
+        slowest = heapq.nlargest(
+            self.SLOWEST_PAGES,
+            ((page['seconds'], file_perf['filename'], page) for file_perf in perf['files'] for page in file_perf['page_timings']),
+            key=lambda item: item[0]
+        )
+        for seconds, filename, page in slowest:
+            ws.append([filename, page['page'], round(seconds, 3), page['tables'], page['raw_tables'],
+                       *[round(page[f'{name}_seconds'], 3) for name in PAGE_STAGES]])
+
+class BatchReportWriter:
+    """
+    Streaming Excel workbook for a batch of bundles: a Bundles summary sheet, the missing files
+    of every bundle, and one detail sheet per bundle written while that bundle is analyzed.
+    """
 
-            return {
-                'total_pdf_files': len(pdf_files),
-                'missing_files': missing_files,
-                'file_analysis': all_results,
-                'receipt_payment_verification': receipt_payment_check,
-                'trial_balance_verification': trial_balance_check
-            }
+    # Excel's limit on sheet names
+    MAX_TITLE = 31
 
-        finally:
-            # Clean up temporary directory
-            shutil.rmtree(extract_path, ignore_errors=True)
+    def __init__(self):
+        self.seconds = 0.0
+        self.wb = openpyxl.Workbook(write_only=True)
+        # Filled in by finalize(); created now so they come before the detail sheets
+        self.summary_ws = self.wb.create_sheet("Bundles")
+        self.missing_ws = self.wb.create_sheet("Missing Files")
+        self.titles = {"bundles", "missing files"}
+
+    def bundle(self, name: str) -> '_BundleSheetWriter':
+        """Detail sheet for one bundle, with the add_file() of an ExcelReportWriter"""
+        stem = re.sub(r'[\[\]:*?/\\]', '_', os.path.splitext(name)[0]) or "Bundle"
+        title, suffix = stem[:self.MAX_TITLE], 1
+        while title.lower() in self.titles:
+            suffix += 1
+            title = f"{stem[:self.MAX_TITLE - len(str(suffix)) - 1]}~{suffix}"
+        self.titles.add(title.lower())
+        ws = self.wb.create_sheet(title)
+        ws.column_dimensions['A'].width = 50
+        for column in "BCDEFGHI":
+            ws.column_dimensions[column].width = 24
+        ws.append(ExcelReportWriter._header_row(ws, ExcelReportWriter.DETAIL_HEADERS))
+        return _BundleSheetWriter(self, ws, title)
+
+    def finalize(self, summaries: List[Dict]) -> bytes:
+        """Write the Bundles and Missing Files sheets from batch_summary rows and return the workbook bytes"""
+        started = time.perf_counter()
+        ws = self.summary_ws
+        ws.column_dimensions['A'].width = 40
+        ws.column_dimensions['B'].width = 32
+        ws.column_dimensions['C'].width = 28
+        for column in "DEFGHIJK":
+            ws.column_dimensions[column].width = 18
+        ws.append(ExcelReportWriter._header_row(ws, [
+            "Bundle", "Detail Sheet", "Status", "PDF Files", "Pages", "Missing Files", "Incomplete Files",
+            "Receipt-Payment", "Trial Balance", "Rules Failed", "Wall Time (s)"]))
+        for summary in summaries:
+            ws.append([
+                summary['bundle'],
+                summary['sheet'],
+                summary['status'],
+                summary['total_pdf_files'],
+                summary['pages'],
+                len(summary['missing_files']),
+                summary['incomplete_files'],
+                _yes_no(summary['receipt_payment_equal'], "Equal", "Not Equal"),
+                _yes_no(summary['trial_balance_consistent'], "Consistent", "Inconsistent"),
+                summary['rules_failed'],
+                round(summary['wall_seconds'], 1)
+            ])
+        ws.append(["Total", None, f"{sum(1 for s in summaries if not s['status'].startswith('failed'))} of "
+                                  f"{len(summaries)} analyzed",
+                   sum(s['total_pdf_files'] for s in summaries), sum(s['pages'] for s in summaries),
+                   sum(len(s['missing_files']) for s in summaries), sum(s['incomplete_files'] for s in summaries)])
+
+        self.missing_ws.column_dimensions['A'].width = 40
+        self.missing_ws.column_dimensions['B'].width = 24
+        self.missing_ws.append(ExcelReportWriter._header_row(self.missing_ws, ["Bundle", "Missing File"]))
+        for summary in summaries:
+            for missing_file in summary['missing_files']:
+                self.missing_ws.append([summary['bundle'], missing_file])
+
+        excel_file = io.BytesIO()
+        self.wb.save(excel_file)
+        self.seconds += time.perf_counter() - started
+        REPORT_SECONDS.observe(self.seconds)
+        return excel_file.getvalue()
+
+class _BundleSheetWriter:
+    """report_writer for one bundle of a batch: streams its detail rows into its own sheet"""
+
+    def __init__(self, batch: BatchReportWriter, ws, title: str):
+        self.batch = batch
+        self.ws = ws
+        self.title = title
+
+    def add_file(self, file_analysis: Dict):
+        started = time.perf_counter()
+        _append_detail_rows(self.ws, file_analysis)
+        self.batch.seconds += time.perf_counter() - started
+
+def _append_detail_rows(ws, file_analysis: Dict):
+    """Page-level detail rows of one analyzed file"""
+    filename = file_analysis['filename']
+    for page_number, is_blank, opening_balance, debit, credit, closing_balance, timed_out, unreconciled_rows in \
+            file_analysis['page_details'].rows('page_number', 'is_blank', 'opening_balance_total', 'debit_total',
+                                               'credit_total', 'closing_balance_total', 'timed_out',
+                                               'unreconciled_rows'):
+        ws.append([
+            filename,
+            page_number,
+            "Yes" if is_blank else "No",
+            round(opening_balance, 2),
+            round(debit, 2),
+            round(credit, 2),
+            round(closing_balance, 2),
+            "Yes" if timed_out else "No",
+            unreconciled_rows
+        ])
+
+def _yes_no(value: Optional[bool], yes: str, no: str) -> Optional[str]:
+    return None if value is None else yes if value else no
+
+def _change_pct(change: Dict) -> str:
+    """Relative change for display; a change from zero has none"""
+    return "new" if change['change_pct'] is None else f"{change['change_pct']:+.1%}"
+
+def _column_width(values) -> int:
+    """Column width that fits the longest value, capped like the rest of the report"""
+    return min(max((len(str(value)) for value in values), default=0) + 2, 50)
 
 def generate_excel_report(analysis_results: Dict, output_filename: str = "financial_analysis_report.xlsx") -> bytes:
     """Generate Excel report and return as bytes"""
-    wb = openpyxl.Workbook()
-
-    # Remove default sheet
-    wb.remove(wb.active)
-
-    # Create Summary sheet
-    summary_ws = wb.create_sheet("Summary")
-
-    # Headers
-    headers = ["Metric", "Value"]
-    for col, header in enumerate(headers, 1):
-        cell = summary_ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-
-    # Data
-    summary_data = [
-        ["Total PDF Files", analysis_results['total_pdf_files']],
-        ["Missing Files Count", len(analysis_results['missing_files'])],
-        ["Receipt-Payment Balance", "Equal" if analysis_results['receipt_payment_verification']['equal'] else "Not Equal"],
-        ["Trial Balance Consistency", "Consistent" if analysis_results['trial_balance_verification']['consistent'] else "Inconsistent"]
-    ]
-
-    for row, (metric, value) in enumerate(summary_data, 2):
-        summary_ws.cell(row=row, column=1, value=metric)
-        summary_ws.cell(row=row, column=2, value=value)
-
-    # Create Detailed Analysis sheet
-    detail_ws = wb.create_sheet("Detailed Analysis")
-
-    headers = ["File Name", "Page", "Is Blank", "Opening Balance Total", 
-              "Debit Total", "Credit Total", "Closing Balance Total"]
-
-    # Write headers
-    for col, header in enumerate(headers, 1):
-        cell = detail_ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-
-    # Write data
-    row = 2
+    writer = ExcelReportWriter()
     for file_analysis in analysis_results['file_analysis']:
-        filename = file_analysis['filename']
-        for page_detail in file_analysis['page_details']:
-            detail_ws.cell(row=row, column=1, value=filename)
-            detail_ws.cell(row=row, column=2, value=page_detail['page_number'])
-            detail_ws.cell(row=row, column=3, value="Yes" if page_detail['is_blank'] else "No")
-            detail_ws.cell(row=row, column=4, value=round(page_detail['opening_balance_total'], 2))
-            detail_ws.cell(row=row, column=5, value=round(page_detail['debit_total'], 2))
-            detail_ws.cell(row=row, column=6, value=round(page_detail['credit_total'], 2))
-            detail_ws.cell(row=row, column=7, value=round(page_detail['closing_balance_total'], 2))
-            row += 1
-
-    # Create Missing Files sheet
-    missing_ws = wb.create_sheet("Missing Files")
-    missing_ws.cell(row=1, column=1, value="Missing Files").font = Font(bold=True)
-
-    for row, missing_file in enumerate(analysis_results['missing_files'], 2):
-        missing_ws.cell(row=row, column=1, value=missing_file)
-
-    # Create Verification sheet
-    verification_ws = wb.create_sheet("Verification")
-    headers = ["Verification Type", "Status", "Details"]
-
-    for col, header in enumerate(headers, 1):
-        cell = verification_ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-
-    # Receipt-Payment verification
-    rp_check = analysis_results['receipt_payment_verification']
-    verification_ws.cell(row=2, column=1, value="Receipt-Payment Balance")
-    verification_ws.cell(row=2, column=2, value="Equal" if rp_check['equal'] else "Not Equal")
-    verification_ws.cell(row=2, column=3, value=f"Receipt: {rp_check.get('receipt_total', 0)}, Payment: {rp_check.get('payment_total', 0)}")
-
-    # Trial Balance verification
-    tb_check = analysis_results['trial_balance_verification']
-    verification_ws.cell(row=3, column=1, value="Trial Balance Consistency")
-    verification_ws.cell(row=3, column=2, value="Consistent" if tb_check['consistent'] else "Inconsistent")
-    verification_ws.cell(row=3, column=3, value=f"File1 Total: {tb_check.get('file1_total', 0)}, File2 Total: {tb_check.get('file2_total', 0)}")
-
-    # Auto-adjust column widths for all sheets
-    for ws in wb.worksheets:
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-    # Save to bytes
-    excel_file = io.BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-    return excel_file.getvalue()
+        writer.add_file(file_analysis)
+    return writer.finalize(analysis_results)
 
 # Streamlit Web Application
+@st.fragment
+def _text_search(index_path: str, bundle: Optional[str]):
+    """Search box over the text index; a fragment, so searching does not rerun the analysis"""
+    query = st.text_input("Words or \"quoted phrases\"", placeholder='"provision for gratuity"')
+    if not query:
+        return
+    text_index = TextIndex(index_path)
+    try:
+        started = time.perf_counter()
+        hits, total = text_index.search(query, bundle)
+        elapsed = time.perf_counter() - started
+    finally:
+        text_index.close()
+    st.caption(f"{total} matching pages in {elapsed * 1000:.1f} ms" +
+               (f", showing the first {len(hits)}" if total > len(hits) else ""))
+    if hits:
+        # Hits from one bundle need no bundle column
+        columns = ['filename', 'page_number', 'matches'] if bundle else ['source', 'filename', 'page_number', 'matches']
+        st.dataframe(pd.DataFrame(hits)[columns].rename(columns={
+            'source': 'Bundle', 'filename': 'Filename', 'page_number': 'Page', 'matches': 'Matches'}),
+            use_container_width=True)
+
+def _analyze_in_background(analyze: Callable[[Callable[[Dict], None]], object], cancel_token: CancellationToken):
+    """Run analyze(progress_callback) on a background thread while the script thread shows its progress
+
+    Streamlit stops a script (Cancel click, rerun, closed tab) by raising inside its next st call;
+    polling here turns that into cancel_token.cancel(), so an abandoned analysis stops within a
+    page instead of parsing on alongside the next one. Progress events of a batch are added up
+    over its bundles.
+    """
+    done: Dict[Optional[str], int] = {}
+    totals: Dict[Optional[str], int] = {}
+    etas: Dict[Optional[str], float] = {}
+    outcome = {}
+
+    def on_progress(event: Dict):
+        bundle = event.get('bundle')
+        if event['event'] == 'started':
+            totals[bundle] = event['total_files']
+            etas[bundle] = event['estimated_seconds']
+        else:
+            done[bundle] = event['index']
+            etas[bundle] = event['eta_seconds']
+
+    def run():
+        try:
+            outcome['results'] = analyze(on_progress)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, name="analysis", daemon=True)
+    # Lets per-file errors from the pipeline reach this session
+    add_script_run_ctx(thread)
+    thread.start()
+    progress_bar = st.progress(0.0, text="Analyzing financial documents...")
+    try:
+        while thread.is_alive():
+            thread.join(0.25)
+            total = sum(totals.values())
+            if total:
+                analyzed = sum(done.values())
+                # Bundles of a batch not started yet have no estimate, so only a single bundle shows one
+                eta = f", about {format_seconds(etas[None])} left" if list(etas) == [None] else ""
+                progress_bar.progress(analyzed / total, text=f"Analyzed {analyzed} of {total} PDFs{eta}")
+    except BaseException:
+        cancel_token.cancel()
+        thread.join()
+        raise
+    progress_bar.empty()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['results']
+
+def _analyze_batch_upload(analyzer: FinancialDocumentAnalyzer, uploaded_files: List, results_db: Optional[str],
+                          client: Optional[str], period: Optional[str]):
+    """Analyze several uploaded bundles together and offer one consolidated workbook"""
+    upload_dir = tempfile.mkdtemp()
+    try:
+        zip_paths = []
+        for index, uploaded in enumerate(uploaded_files):
+            # A directory per upload keeps each bundle's own name, even when two are the same
+            bundle_dir = os.path.join(upload_dir, str(index))
+            os.makedirs(bundle_dir)
+            zip_paths.append(os.path.join(bundle_dir, os.path.basename(uploaded.name)))
+            with open(zip_paths[-1], 'wb') as f:
+                shutil.copyfileobj(uploaded, f)
+
+        stored = []
+        def on_bundle(zip_path: str, results: Dict):
+            if results_db:
+                stored.append(save_results(results_db, results, client, period, zip_path))
+
+        report_writer = BatchReportWriter()
+        cancel_slot = st.empty()
+        cancel_slot.button("⛔ Cancel analysis", key="cancel_analysis")
+        cancel_token = CancellationToken()
+        summaries = _analyze_in_background(
+            lambda on_progress: analyzer.analyze_zip_files(zip_paths, on_progress, report_writer, cancel_token,
+                                                           on_bundle),
+            cancel_token)
+        cancel_slot.empty()
+        excel_data = report_writer.finalize(summaries)
+    except Exception as e:
+        st.error(f"❌ Error analyzing files: {str(e)}")
+        return
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    failed = [summary for summary in summaries if summary['status'].startswith('failed')]
+    if failed:
+        st.warning(f"{len(failed)} of {len(summaries)} bundles could not be analyzed.")
+    else:
+        st.success(f"✅ Analyzed {len(summaries)} bundles!")
+    if stored:
+        st.caption(f"🗄️ Stored {len(stored)} bundles in the results history")
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🗂️ Bundles", len(summaries))
+    with col2:
+        st.metric("📄 Total PDF Files", sum(summary['total_pdf_files'] for summary in summaries))
+    with col3:
+        st.metric("📑 Pages", sum(summary['pages'] for summary in summaries))
+    with col4:
+        st.metric("❌ Missing Files", sum(len(summary['missing_files']) for summary in summaries))
+
+    st.header("🗂️ Bundles")
+    st.dataframe(pd.DataFrame([{
+        'Bundle': summary['bundle'],
+        'Status': summary['status'],
+        'PDF Files': summary['total_pdf_files'],
+        'Pages': summary['pages'],
+        'Missing Files': len(summary['missing_files']),
+        'Incomplete Files': summary['incomplete_files'],
+        'Receipt-Payment': _yes_no(summary['receipt_payment_equal'], "✅ Equal", "❌ Not Equal"),
+        'Trial Balance': _yes_no(summary['trial_balance_consistent'], "✅ Consistent", "❌ Inconsistent"),
+        'Wall Time (s)': round(summary['wall_seconds'], 1)
+    } for summary in summaries]), use_container_width=True)
+
+    st.subheader("📥 Download Report")
+    st.download_button(
+        label="📊 Download Consolidated Excel Report",
+        data=excel_data,
+        file_name="batch_analysis_report.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
 def main():
     st.set_page_config(
         page_title="Financial Document Analyzer",
@@ -409,6 +2004,10 @@ def main():
         initial_sidebar_state="expanded"
     )
 
+    # Optional Prometheus endpoint for this Streamlit process
+    if os.environ.get('FDA_METRICS_PORT'):
+        start_http_server(int(os.environ['FDA_METRICS_PORT']))
+
     st.title("📊 Financial Document Analyzer")
     st.markdown("**Analyze financial documents, identify missing schedules/annexures, and generate comprehensive reports**")
 
@@ -430,14 +2029,72 @@ def main():
         - Trial balance consistency
         """)
 
+        st.header("🛠️ Diagnostics")
+        profile_run = st.checkbox("Profile this analysis", value=_env_flag('FDA_PROFILE'),
+                                  help="Capture a cProfile of the run, including the parsing workers")
+        profile_memory = st.checkbox("Include memory allocations", value=_env_flag('FDA_PROFILE_MEMORY'),
+                                     disabled=not profile_run, help="Also trace allocations with tracemalloc (slower)")
+
+        st.header("⏳ Limits")
+        memory_budget_mb = st.number_input("Memory budget per worker (MB)", min_value=0, step=256,
+                                           value=_env_int('FDA_MEMORY_BUDGET_MB') or 0,
+                                           help="Skip a PDF whose parse grows past this; 0 means no limit")
+        page_timeout = st.number_input("Page timeout (s)", min_value=0, step=10,
+                                       value=int(_env_float('FDA_PAGE_TIMEOUT') or 0),
+                                       help="Skip a page that takes longer than this; 0 means no limit")
+        document_timeout = st.number_input("Document timeout (s)", min_value=0, step=60,
+                                           value=int(_env_float('FDA_DOCUMENT_TIMEOUT') or 0),
+                                           help="Stop parsing a PDF after this long; 0 means no limit")
+        run_timeout = st.number_input("Run time budget (s)", min_value=0, step=60,
+                                      value=int(_env_float('FDA_RUN_TIMEOUT') or 0),
+                                      help="Return a partial report after this long; 0 means no limit")
+
+        st.header("🔎 Search")
+        shared_index = os.environ.get('FDA_TEXT_INDEX')
+        # Off unless an index is configured: indexing costs every run, and pays off only when searched
+        index_text = st.checkbox("Index page text", value=bool(shared_index),
+                                 help="Index every page's text so the bundle can be searched by term or phrase")
+        search_all = st.checkbox("Search all indexed bundles", disabled=not (index_text and shared_index),
+                                 help="Search every bundle in the FDA_TEXT_INDEX index, not only this one")
+
+        results_db = os.environ.get('FDA_RESULTS_DB')
+        if results_db:
+            st.header("🗄️ History")
+            client = st.text_input("Client", help="Stored with the results; defaults to the ZIP name")
+            period = st.text_input("Period", placeholder="2024-Q1",
+                                   help="Stored with the results; defaults to a period in the ZIP name")
+            compare_periods = st.checkbox("Compare with previous period",
+                                          help="Match schedules and annexures against the client's stored prior "
+                                               "period and flag large changes")
+            prior_period = st.text_input("Prior period", disabled=not compare_periods,
+                                         help="Compare with this period; defaults to the latest earlier one")
+            variance_threshold = st.number_input("Variance threshold (%)", min_value=0, step=5,
+                                                 value=int(DEFAULT_VARIANCE_THRESHOLD * 100),
+                                                 disabled=not compare_periods)
+
     # File upload
-    uploaded_file = st.file_uploader(
-        "Choose a ZIP file containing financial documents",
+    uploaded_files = st.file_uploader(
+        "Choose ZIP files containing financial documents",
         type=['zip'],
-        help="Upload a ZIP file containing PDF documents for analysis"
+        accept_multiple_files=True,
+        help="Upload a ZIP file containing PDF documents for analysis, or several to analyze them together "
+             "into one workbook"
     )
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
 
-    if uploaded_file is not None:
+    if uploaded_files and st.session_state.get('cancel_analysis'):
+        st.warning("⛔ Analysis cancelled.")
+        st.button("🔄 Analyze again")
+
+    elif len(uploaded_files) > 1:
+        analyzer = FinancialDocumentAnalyzer(memory_budget_mb=int(memory_budget_mb), page_timeout=page_timeout,
+                                             document_timeout=document_timeout, run_timeout=run_timeout)
+        # Batch results have no search box, so only a configured index is worth writing
+        analyzer.text_index = shared_index if index_text else None
+        _analyze_batch_upload(analyzer, uploaded_files, results_db,
+                              results_db and client.strip() or None, results_db and period.strip() or None)
+
+    elif uploaded_file is not None:
         # Save uploaded file temporarily
         with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as tmp_file:
             tmp_file.write(uploaded_file.read())
@@ -445,13 +2102,57 @@ def main():
 
         try:
             # Initialize analyzer
-            analyzer = FinancialDocumentAnalyzer()
-
-            # Show progress
-            with st.spinner('Analyzing financial documents...'):
-                results = analyzer.analyze_zip_file(tmp_file_path)
-
-            st.success("✅ Analysis completed successfully!")
+            analyzer = FinancialDocumentAnalyzer(memory_budget_mb=int(memory_budget_mb), page_timeout=page_timeout,
+                                                 document_timeout=document_timeout, run_timeout=run_timeout)
+            analyzer.profiler = RunProfiler(trace_memory=profile_memory) if profile_run else None
+            # Without a configured index, each bundle is indexed into a private one for this page,
+            # which keeps only the latest bundle of each session
+            private_index = os.path.join(tempfile.gettempdir(), f"fda_text_{os.getpid()}.sqlite3")
+            analyzer.text_index = (shared_index or private_index) if index_text else None
+            previous_bundle = st.session_state.pop('private_text_bundle', None)
+            if previous_bundle is not None and os.path.exists(private_index):
+                text_index = TextIndex(private_index)
+                try:
+                    text_index.forget(previous_bundle)
+                finally:
+                    text_index.close()
+            report_writer = ExcelReportWriter()
+            with st.spinner("Estimating..."):
+                estimate = analyzer.preflight(tmp_file_path)
+            st.info(f"🧮 {estimate['total_files']} PDFs, {estimate['total_pages']:,} pages, about "
+                    f"{estimate['tables']:,.0f} financial tables: expected to take about "
+                    f"{format_seconds(estimate['seconds'])}")
+
+            # Show progress; clicking Cancel reruns the script, which stops this analysis
+            cancel_slot = st.empty()
+            cancel_slot.button("⛔ Cancel analysis", key="cancel_analysis")
+            cancel_token = CancellationToken()
+            results = _analyze_in_background(
+                lambda on_progress: analyzer.analyze_zip_file(tmp_file_path, on_progress, report_writer, cancel_token,
+                                                              estimate),
+                cancel_token)
+            cancel_slot.empty()
+            if analyzer.text_index == private_index:
+                st.session_state['private_text_bundle'] = results['bundle_fingerprint']
+            if results_db and compare_periods:
+                # Before saving, so a re-run of the same bundle is never its own prior period
+                results['period_comparison'] = compare_in_store(
+                    results_db, results, uploaded_file.name, client.strip() or None, period.strip() or None,
+                    prior_period.strip() or None, variance_threshold / 100)
+            if results_db:
+                bundle_id = save_results(results_db, results, client.strip() or None, period.strip() or None,
+                                         uploaded_file.name)
+                st.caption(f"🗄️ Stored as bundle {bundle_id} in the results history")
+
+            if results['partial']:
+                st.warning("⏳ The run time budget was reached; this is a partial report.")
+            else:
+                st.success("✅ Analysis completed successfully!")
+            if results['perf']['restored_files']:
+                st.info(f"♻️ Resumed from checkpoint: {results['perf']['restored_files']} PDFs were not parsed again.")
+            if results['incomplete_files']:
+                st.warning("Not fully analyzed: " + ", ".join(
+                    f"{f['filename']} ({f['status']})" for f in results['incomplete_files']))
 
             # Display results
             col1, col2, col3, col4 = st.columns(4)
@@ -488,13 +2189,22 @@ def main():
                     'Filename': file_analysis['filename'],
                     'Pages': file_analysis['pages'],
                     'Blank Pages': file_analysis['blank_pages'],
-                    'Financial Tables': file_analysis['financial_tables']
+                    'Financial Tables': file_analysis['financial_tables'],
+                    'Unreconciled Rows': file_analysis['unreconciled_rows'],
+                    'Continued Tables': len(file_analysis['continued_tables']),
+                    'Peak Memory (MB)': round(file_analysis['peak_memory_bytes'] / 1024 ** 2, 1),
+                    'Status': file_analysis['status']
                 })
 
             if file_summary_data:
                 file_df = pd.DataFrame(file_summary_data)
                 st.dataframe(file_df, use_container_width=True)
 
+            page_columns = results.get('page_columns')
+            if page_columns is not None and len(page_columns):
+                with st.expander(f"🗂️ Page Details ({len(page_columns):,} pages)"):
+                    st.dataframe(page_columns.to_frame(), use_container_width=True, hide_index=True)
+
             # Verification results
             st.subheader("✅ Verification Results")
 
@@ -510,14 +2220,70 @@ def main():
             with col2:
                 st.write("**Trial Balance Verification:**")
                 tb_check = results['trial_balance_verification']
-                st.write(f"- File 1 Total: {tb_check.get('file1_total', 0):,.2f}")
-                st.write(f"- File 2 Total: {tb_check.get('file2_total', 0):,.2f}")
+                st.write(f"- {tb_check.get('status', '')}")
                 st.write(f"- Status: {'✅ Consistent' if tb_check['consistent'] else '❌ Inconsistent'}")
+                if tb_check.get('comparisons'):
+                    st.dataframe(pd.DataFrame([{
+                        'Check': comparison['check'],
+                        'Files': comparison['files'],
+                        'Left': comparison['left'],
+                        'Right': comparison['right'],
+                        'Agrees': '✅' if comparison['agrees'] else '❌'
+                    } for comparison in tb_check['comparisons']]), use_container_width=True)
+                for tb in tb_check.get('not_comparable', []):
+                    st.write(f"- Not comparable: {tb['filename']} ({tb['status']})")
+
+            if results.get('rule_checks'):
+                st.write("**Validation Rules:**")
+                st.dataframe(pd.DataFrame([{
+                    'Rule': outcome['name'],
+                    'Severity': outcome['severity'],
+                    'Scope': outcome['scope'],
+                    'Evaluated': outcome['evaluated'],
+                    'Failed': outcome['failed'],
+                    'Status': _yes_no(outcome['passed'], '✅ Passed', '❌ Failed') or '➖ Not applicable'
+                } for outcome in results['rule_checks']]), use_container_width=True, hide_index=True)
+
+            # Changes against the prior period
+            if results_db and compare_periods:
+                comparison = results.get('period_comparison')
+                with st.expander("📈 Period Comparison", expanded=bool(comparison and comparison['flagged_files'])):
+                    if comparison is None:
+                        st.write("No earlier period of this client in the results history.")
+                    else:
+                        st.write(f"Compared with {describe_prior(comparison)}; "
+                                 f"{comparison['flagged_files']} files changed by more than "
+                                 f"{comparison['threshold']:.0%}.")
+                        comparison_rows = []
+                        for row in comparison['files']:
+                            comparison_row = {'Filename': row['filename'] or row['prior_filename']}
+                            for column, label in TOTAL_LABELS:
+                                change = row['totals'].get(column)
+                                comparison_row[label] = change and round(change['current'], 2)
+                                comparison_row[f"{label} Change"] = change and _change_pct(change)
+                            comparison_row['Status'] = "⚠️ Variance" if row['flagged'] else row['status']
+                            comparison_rows.append(comparison_row)
+                        st.dataframe(pd.DataFrame(comparison_rows), use_container_width=True)
+
+            if results['text_index']:
+                st.subheader("🔎 Search Page Text")
+                _text_search(results['text_index'], None if search_all and shared_index else results['bundle_fingerprint'])
+
+            # Where the time went
+            with st.expander("⏱️ Performance"):
+                perf = results['perf']
+                st.write(f"- Wall Time: {perf['wall_seconds']:.2f}s")
+                st.write(f"- Estimated beforehand: {perf['estimate']['seconds']:.2f}s for "
+                         f"{perf['estimate']['total_pages']} pages")
+                st.write(f"- Pages/sec: {perf['pages_per_sec']:.1f} ({perf['total_pages']} pages, {perf['total_bytes_read']:,} bytes read)")
+                stage_df = pd.DataFrame(sorted(perf['stages'].items(), key=lambda item: -item[1]),
+                                        columns=['Stage', 'Seconds'])
+                st.dataframe(stage_df, use_container_width=True)
 
             # Generate and offer Excel download
             st.subheader("📥 Download Report")
 
-            excel_data = generate_excel_report(results)
+            excel_data = report_writer.finalize(results)
 
             st.download_button(
                 label="📊 Download Excel Report",
@@ -526,6 +2292,30 @@ def main():
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
 
+            if analyzer.profiler is not None:
+                with tempfile.TemporaryDirectory() as profile_dir:
+                    stats_path, summary_path = analyzer.profiler.save(os.path.join(profile_dir, "financial_analysis"))
+                    with open(stats_path, 'rb') as f:
+                        stats_data = f.read()
+
+                with st.expander("🔬 Profile"):
+                    st.code(analyzer.profiler.summary)
+                st.download_button(
+                    label="🔬 Download Profile Summary",
+                    data=analyzer.profiler.summary,
+                    file_name="financial_analysis_profile.txt",
+                    mime="text/plain"
+                )
+                st.download_button(
+                    label="🔬 Download Profile Stats (pstats)",
+                    data=stats_data,
+                    file_name="financial_analysis_profile.pstats",
+                    mime="application/octet-stream"
+                )
+
+        except ArchiveRejected as e:
+            st.error(f"❌ Archive rejected: {e}")
+
         except Exception as e:
             st.error(f"❌ Error analyzing file: {str(e)}")
 
@@ -537,5 +2327,219 @@ def main():
     st.markdown("---")
     st.markdown("**Financial Document Analyzer** - Built with Streamlit and Python")
 
+def cli(argv: Optional[List[str]] = None):
+    """Command-line analysis: write the Excel report (and optional profile) next to the ZIP"""
+    parser = argparse.ArgumentParser(description="Analyze a ZIP of financial PDFs and write the Excel report")
+    parser.add_argument("zip_paths", nargs="+", metavar="zip_path",
+                        help="ZIP file containing PDF documents; several are analyzed together into one workbook")
+    parser.add_argument("-o", "--output", help="Report path (default: <zip name>_analysis_report.xlsx next to the ZIP, "
+                                               "or batch_analysis_report.xlsx next to the first of several)")
+    parser.add_argument("--bundles-in-flight", type=int, default=BATCH_BUNDLES_IN_FLIGHT,
+                        help="Bundles of a batch analyzed at the same time (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel PDF parses (default: CPU count)")
+    parser.add_argument("--profile", action="store_true", help="Profile the run with cProfile (or set FDA_PROFILE=1)")
+    parser.add_argument("--profile-memory", action="store_true", help="Also trace memory allocations with tracemalloc")
+    parser.add_argument("--profile-top", type=int, default=30, help="Functions listed in the profile summary")
+    parser.add_argument("--metrics-file", help="Write metrics in Prometheus text format to this file when done")
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help="Skip a PDF whose worker grows past this RSS (or set FDA_MEMORY_BUDGET_MB)")
+    parser.add_argument("--max-files-per-worker", type=int, default=None,
+                        help="Replace each parse worker after this many PDFs (or set FDA_MAX_FILES_PER_WORKER)")
+    parser.add_argument("--page-timeout", type=float, default=None,
+                        help="Seconds before a page is skipped as timed out (or set FDA_PAGE_TIMEOUT)")
+    parser.add_argument("--document-timeout", type=float, default=None,
+                        help="Seconds allowed per PDF (or set FDA_DOCUMENT_TIMEOUT)")
+    parser.add_argument("--run-timeout", type=float, default=None,
+                        help="Seconds for the whole bundle before writing a partial report (or set FDA_RUN_TIMEOUT)")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="Save analyzed PDFs here and resume an interrupted run of the same bundle "
+                             "(or set FDA_CHECKPOINT_DIR)")
+    parser.add_argument("--fresh", action="store_true", help="Discard this bundle's checkpoint and analyze every PDF")
+    parser.add_argument("--results-db", default=os.environ.get('FDA_RESULTS_DB'),
+                        help="Also store the results in this database (or set FDA_RESULTS_DB)")
+    parser.add_argument("--client", help="Client the bundle belongs to (default: the ZIP name)")
+    parser.add_argument("--period", help="Reporting period, e.g. 2024-Q1 or FY2023-24 (default: from the ZIP name)")
+    parser.add_argument("--text-index", default=None,
+                        help="Index page text into this file for term and phrase search with text_index.py "
+                             "(or set FDA_TEXT_INDEX)")
+    parser.add_argument("--rules", default=None,
+                        help="Evaluate the validation rules in this YAML or JSON file (or set FDA_RULES)")
+    parser.add_argument("--max-zip-members", type=int, default=None,
+                        help="Refuse a ZIP with more members, 0 for no limit (or set FDA_ZIP_MAX_MEMBERS)")
+    parser.add_argument("--max-zip-mb", type=int, default=None,
+                        help="Refuse a ZIP larger than this uncompressed (or set FDA_ZIP_MAX_MB)")
+    parser.add_argument("--max-zip-ratio", type=float, default=None,
+                        help="Refuse a ZIP member that expands more than this many times (or set FDA_ZIP_MAX_RATIO)")
+    parser.add_argument("--max-pdf-pages", type=int, default=None,
+                        help="Skip a PDF with more pages (or set FDA_PDF_MAX_PAGES)")
+    parser.add_argument("--triage", action="store_true",
+                        help="Analyze a sample of pages of each ZIP first and fully analyze only the bundles that need it")
+    parser.add_argument("--triage-only", action="store_true", help="Print the sampled triage and stop")
+    parser.add_argument("--sample-pages", type=int, default=_env_int('FDA_SAMPLE_PAGES') or DEFAULT_SAMPLE_PAGES,
+                        help="Pages sampled per PDF, first and last included (default: FDA_SAMPLE_PAGES, else 12)")
+    parser.add_argument("--triage-budget", type=float, default=_env_float('FDA_TRIAGE_BUDGET') or DEFAULT_TIME_BUDGET,
+                        help="Seconds for sampling each ZIP (default: FDA_TRIAGE_BUDGET, else 60)")
+    parser.add_argument("--max-blank-rate", type=float, default=DEFAULT_MAX_BLANK_RATE * 100,
+                        help="Percent of blank pages (upper confidence bound) above which triage asks for a full analysis")
+    parser.add_argument("--compare", action="store_true",
+                        help="Add a Period Comparison sheet against the client's previous stored period "
+                             "(needs --results-db)")
+    parser.add_argument("--prior-period", help="Compare with this stored period (default: the latest earlier one)")
+    parser.add_argument("--variance-threshold", type=float, default=DEFAULT_VARIANCE_THRESHOLD * 100,
+                        help="Flag totals that changed by more than this percentage (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.compare and not args.results_db:
+        parser.error("--compare needs --results-db (or FDA_RESULTS_DB)")
+    batch = len(args.zip_paths) > 1
+    if batch and (args.compare or args.profile or args.profile_memory):
+        parser.error("--compare and --profile work on a single ZIP file")
+    zip_path = args.zip_paths[0]
+    archive_limits = ArchiveLimits.from_env()
+    overrides = {'max_members': args.max_zip_members, 'max_ratio': args.max_zip_ratio, 'max_pages': args.max_pdf_pages,
+                 'max_bytes': None if args.max_zip_mb is None else args.max_zip_mb * 1024 ** 2}
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(archive_limits, name, value or None)
+
+    try:
+        rules = load_rules(args.rules or os.environ.get('FDA_RULES') or None)
+    except (OSError, ValueError) as e:
+        parser.error(f"rules: {e}")
+    try:
+        analyzer = FinancialDocumentAnalyzer(max_workers=args.workers, memory_budget_mb=args.memory_budget_mb,
+                                             max_files_per_worker=args.max_files_per_worker,
+                                             page_timeout=args.page_timeout, document_timeout=args.document_timeout,
+                                             run_timeout=args.run_timeout, checkpoint_dir=args.checkpoint_dir,
+                                             text_index=args.text_index, rules=rules,
+                                             archive_limits=archive_limits)
+    except OSError as e:
+        parser.error(f"cannot start the analyzer: {e}")
+    if args.fresh and analyzer.checkpoint_dir:
+        store = CheckpointStore.in_directory(analyzer.checkpoint_dir)
+        try:
+            for path in args.zip_paths:
+                store.forget(zip_fingerprint(path))
+        finally:
+            store.close()
+    if args.triage or args.triage_only:
+        args.zip_paths = _cli_triage(analyzer, args)
+        if args.triage_only or not args.zip_paths:
+            return
+        batch = len(args.zip_paths) > 1
+        zip_path = args.zip_paths[0]
+    if batch:
+        _cli_batch(analyzer, args)
+        return
+    if args.profile or args.profile_memory:
+        analyzer.profiler = RunProfiler(top_n=args.profile_top, trace_memory=args.profile_memory)
+
+    report_writer = ExcelReportWriter()
+    try:
+        results = analyzer.analyze_zip_file(zip_path, report_writer=report_writer)
+    except ArchiveRejected as e:
+        sys.exit(f"{zip_path}: archive rejected: {e}")
+    if args.compare:
+        # Before saving, so a re-run of the same bundle is never its own prior period
+        results['period_comparison'] = compare_in_store(args.results_db, results, zip_path, args.client,
+                                                        args.period, args.prior_period, args.variance_threshold / 100)
+    output = args.output or os.path.splitext(zip_path)[0] + "_analysis_report.xlsx"
+    with open(output, 'wb') as f:
+        f.write(report_writer.finalize(results))
+
+    perf = results['perf']
+    print(f"Analyzed {results['total_pdf_files']} PDFs ({perf['total_pages']} pages) in {perf['wall_seconds']:.1f}s")
+    if perf['restored_files']:
+        print(f"Resumed from checkpoint: {perf['restored_files']} PDFs were not parsed again")
+    print(f"Missing files: {len(results['missing_files'])}")
+    for incomplete in results['incomplete_files']:
+        timed_out = f" (timed-out pages: {', '.join(map(str, incomplete['timed_out_pages']))})" \
+            if incomplete['timed_out_pages'] else ""
+        print(f"{incomplete['status']}: {incomplete['filename']}{timed_out}")
+    if results['partial']:
+        print("Run time budget reached: the report is partial")
+    for outcome in results['rule_checks']:
+        if outcome['passed'] is None:
+            print(f"Rule not applicable ({outcome['severity']}): {outcome['name']} - no page or file it selects")
+        elif not outcome['passed']:
+            print(f"Rule failed ({outcome['severity']}): {outcome['name']} - {outcome['failed']} of "
+                  f"{outcome['evaluated']} checks")
+    if args.compare:
+        comparison = results['period_comparison']
+        if comparison is None:
+            print("No earlier period of this client in the results history to compare with")
+        else:
+            print(f"Compared with {describe_prior(comparison)}: {comparison['flagged_files']} files changed by "
+                  f"more than {comparison['threshold']:.0%}")
+    print(f"Report written to {output}")
+    if results['text_index']:
+        print(f"Page text indexed in {results['text_index']}")
+    if args.results_db:
+        bundle_id = save_results(args.results_db, results, args.client, args.period, zip_path)
+        print(f"Results stored in {args.results_db} (bundle {bundle_id})")
+    if analyzer.profiler is not None:
+        for path in analyzer.profiler.save(os.path.splitext(output)[0]):
+            print(f"Profile written to {path}")
+    if args.metrics_file:
+        REGISTRY.write_to_file(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}")
+
+def _cli_triage(analyzer: FinancialDocumentAnalyzer, args: argparse.Namespace) -> List[str]:
+    """Command-line triage: sample every ZIP and return those that need a full analysis"""
+    needed = []
+    for zip_path in args.zip_paths:
+        try:
+            triage = analyzer.triage(zip_path, args.sample_pages, args.triage_budget, args.max_blank_rate / 100)
+        except ArchiveRejected as e:
+            print(f"{zip_path}: archive rejected: {e}")
+            continue
+        blank, tables = triage['blank_pages'], triage['tables']
+        print(f"{zip_path}: sampled {triage['sampled_pages']} of {triage['total_pages']} pages in "
+              f"{triage['seconds']:.1f}s ({triage['confidence']:.0%} bounds)")
+        print(f"  Blank pages: ~{blank['estimate']:.0f} ({_bounds(blank)}), "
+              f"tables: ~{tables['estimate']:.0f} ({_bounds(tables)})")
+        if triage['needs_full_analysis']:
+            needed.append(zip_path)
+            for reason in triage['reasons']:
+                print(f"  Needs full analysis: {reason}")
+        else:
+            print("  No full analysis needed")
+    return needed
+
+def _bounds(estimate: Dict) -> str:
+    high = '?' if estimate['high'] is None else f"{estimate['high']:.0f}"
+    return f"{estimate['low']:.0f}-{high}"
+
+def _cli_batch(analyzer: FinancialDocumentAnalyzer, args: argparse.Namespace):
+    """Command-line batch: analyze every ZIP on one pool and write the consolidated workbook"""
+    def on_bundle(zip_path: str, results: Dict):
+        stored = ""
+        if args.results_db:
+            bundle_id = save_results(args.results_db, results, args.client, args.period, zip_path)
+            stored = f", stored as bundle {bundle_id}"
+        print(f"{os.path.basename(zip_path)}: {results['total_pdf_files']} PDFs, "
+              f"{len(results['missing_files'])} missing files{stored}")
+
+    report_writer = BatchReportWriter()
+    started = time.perf_counter()
+    summaries = analyzer.analyze_zip_files(args.zip_paths, report_writer=report_writer, on_bundle=on_bundle,
+                                           bundles_in_flight=args.bundles_in_flight)
+    output = args.output or os.path.join(os.path.dirname(args.zip_paths[0]), "batch_analysis_report.xlsx")
+    with open(output, 'wb') as f:
+        f.write(report_writer.finalize(summaries))
+
+    for summary in summaries:
+        if summary['status'].startswith('failed'):
+            print(f"{summary['bundle']}: {summary['status']}")
+    print(f"Analyzed {len(summaries)} bundles ({sum(summary['total_pdf_files'] for summary in summaries)} PDFs, "
+          f"{sum(summary['pages'] for summary in summaries)} pages) in {time.perf_counter() - started:.1f}s")
+    print(f"Report written to {output}")
+    if args.metrics_file:
+        REGISTRY.write_to_file(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}")
+
 if __name__ == "__main__":
-    main()
+    # `streamlit run` starts the web app; plain `python` runs the command-line analysis
+    if st.runtime.exists():
+        main()
+    else:
+        cli()
@@ -0,0 +1,204 @@
+# Financial Document Analyzer - Microbenchmarks
+# Purpose: Throughput of the table hot path (analyze_financial_table, calculate_column_total,
+#          is_page_blank, check_missing_files) on fixture tables, with stored baselines and a
+#          regression gate that fails when a change slows any of them past a tolerance
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmark import environment
+from synthetic_bundles import financial_table
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microbench_baseline.json")
+DEFAULT_TOLERANCE = 0.15
+ROW_COUNTS = (10, 1000, 100000)
+# Table widths: particulars, opening balance and debit; or every column the generator knows
+SHAPES = {'narrow': 3, 'wide': 8}
+MIN_SECONDS = 0.2
+REPEATS = 5
+
+
+def fixture_tables() -> Dict[str, List[List[str]]]:
+    """Tables by name (shape-numbers-rows), generated from fixed seeds"""
+    tables = {}
+    for shape, columns in SHAPES.items():
+        for noisy in (False, True):
+            for rows in ROW_COUNTS:
+                rng = random.Random(rows * 10 + columns + noisy)
+                table, _ = financial_table(rng, rows, columns, noisy)
+                tables[f"{shape}-{'noisy' if noisy else 'clean'}-{rows}"] = table
+    return tables
+
+
+def fixture_pages() -> Dict[str, str]:
+    """Page texts from empty to a dense 50 KB page"""
+    rng = random.Random(7)
+    words = ["Schedule", "Ledger", "Opening", "Balance", "Debit", "Credit", "Total", "31-03-2024", "1,234.00"]
+    line = lambda: " ".join(rng.choice(words) for _ in range(12))
+    return {
+        'empty': "",
+        'whitespace': " \n\t " * 200,
+        'short': "Page 3 of 12",
+        'typical': "\n".join(line() for _ in range(40)),
+        'dense': "\n".join(line() for _ in range(600)),
+    }
+
+
+def fixture_file_lists() -> Dict[str, List[str]]:
+    """Bundle file lists from a handful of schedules to thousands of supporting PDFs"""
+    required = [f"bundle/Schedule {i} Accounts.pdf" for i in range(1, 23)] + \
+               [f"bundle/Annexure {i} Details.pdf" for i in range(1, 13)]
+    return {
+        f"{count}-files": (required + [f"bundle/supporting/Document {i:05d}.pdf" for i in range(count)])[:count]
+        for count in (10, 100, 1000, 10000)
+    }
+
+
+def time_call(fn: Callable[[], object]) -> float:
+    """Best seconds per call: repeat batches sized to run at least MIN_SECONDS and keep the fastest"""
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_SECONDS:
+            break
+        calls = max(calls * 2, int(calls * MIN_SECONDS / max(elapsed, 1e-9)))
+    best = elapsed / calls
+    for _ in range(REPEATS - 1):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - started) / calls)
+    return best
+
+
+def benchmark_cases() -> List[Tuple[str, Callable[[], object], int, str]]:
+    """(name, call, units per call, unit) for every microbenchmark"""
+    from financial_document_analyzer import FinancialDocumentAnalyzer
+
+    analyzer = FinancialDocumentAnalyzer(max_workers=1)
+    cases = []
+    for name, table in fixture_tables().items():
+        rows = len(table) - 1
+        cases.append((f"analyze_financial_table[{name}]",
+                      lambda table=table: analyzer.analyze_financial_table(table), rows, "rows"))
+        # Column 2 is Debit in both shapes
+        cases.append((f"calculate_column_total[{name}]",
+                      lambda table=table: analyzer.calculate_column_total(table, 2), rows, "rows"))
+    for name, text in fixture_pages().items():
+        cases.append((f"is_page_blank[{name}]", lambda text=text: analyzer.is_page_blank(text), 1, "pages"))
+    for name, files in fixture_file_lists().items():
+        cases.append((f"check_missing_files[{name}]",
+                      lambda files=files: analyzer.check_missing_files(files), len(files), "files"))
+    return cases
+
+
+def run(selected: Optional[str] = None) -> Dict[str, Dict]:
+    results = {}
+    for name, fn, units, unit in benchmark_cases():
+        if selected and selected not in name:
+            continue
+        seconds = time_call(fn)
+        results[name] = {'seconds_per_call': seconds, 'throughput': units / seconds, 'unit': f"{unit}/sec"}
+        print(f"{name:<58}{units / seconds:>16,.0f} {unit}/sec  ({seconds * 1e6:,.1f} us/call)")
+    return results
+
+
+def check(results: Dict[str, Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """Benchmarks whose throughput fell more than `tolerance` below the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        change = result['throughput'] / base['throughput'] - 1
+        if change < -tolerance:
+            regressions.append(f"{name}: {result['throughput']:,.0f} {result['unit']} vs baseline "
+                               f"{base['throughput']:,.0f} ({change:+.0%})")
+    return regressions
+
+
+def best_of(results: Dict[str, Dict], path: str) -> Dict[str, Dict]:
+    """results merged with those stored at path, keeping each benchmark's higher throughput"""
+    if not os.path.exists(path):
+        return results
+    with open(path, encoding="utf-8") as f:
+        merged = json.load(f)['results']
+    for name, result in results.items():
+        if name not in merged or result['throughput'] > merged[name]['throughput']:
+            merged[name] = result
+    return merged
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks and regression gate for the table hot path")
+    parser.add_argument("-k", "--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if any benchmark regressed past the tolerance")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed throughput drop as a fraction (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="Also save these results as JSON")
+    parser.add_argument("--keep-best", action="store_true",
+                        help="When saving, keep each benchmark's best of this run and the file's earlier runs")
+    parser.add_argument("--results", help="With --check, check the results saved in this file instead of running")
+    args = parser.parse_args(argv)
+
+    if args.results:
+        with open(args.results, encoding="utf-8") as f:
+            document = json.load(f)
+        results = document['results']
+    else:
+        results = run(args.filter)
+        document = {
+            'benchmark': 'micro',
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'environment': environment(),
+            'results': results
+        }
+    if args.output:
+        saved = {**document, 'results': best_of(results, args.output) if args.keep_best else results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=2)
+
+    if args.save_baseline:
+        if args.keep_best:
+            document['results'] = best_of(results, args.baseline)
+        elif args.filter and os.path.exists(args.baseline):
+            # A filtered run only replaces the benchmarks it ran
+            with open(args.baseline, encoding="utf-8") as f:
+                stored = json.load(f)
+            stored['results'].update(results)
+            document['results'] = stored['results']
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}; run with --save-baseline first")
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        base_env, env = baseline['environment'], document['environment']
+        if (base_env['python'], base_env['machine'], base_env['cpu_count']) != (env['python'], env['machine'], env['cpu_count']):
+            print(f"Warning: baseline was measured on Python {base_env['python']}, {base_env['machine']}, "
+                  f"{base_env['cpu_count']} CPUs; comparisons across machines are unreliable")
+        regressions = check(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {baseline['created_at']} "
+              f"(commit {base_env['git_commit']})")
+
+
+if __name__ == "__main__":
+    main()
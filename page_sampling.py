@@ -0,0 +1,279 @@
+# Financial Document Analyzer - Page Sampling
+# Purpose: First-look triage of large bundles. Each PDF is analyzed on a stratified sample of its
+#          pages (its first and last pages always included, for the receipt-payment check) within a
+#          time budget, and the blank-page rate and table density of the whole bundle are
+#          extrapolated with confidence bounds, so a full analysis is queued only where it is needed
+
+import os
+import random
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import CancelledError, wait
+from itertools import zip_longest
+from statistics import NormalDist
+from typing import Callable, Dict, List, Optional, Tuple
+
+from archive_limits import check_members, copy_member, open_archive
+from cost_estimator import count_pages, pdf_members
+from worker_pool import TaskCancelled, TaskTimeout, WorkerLost, WorkerPool
+
+DEFAULT_SAMPLE_PAGES = 12
+DEFAULT_TIME_BUDGET = 60.0
+DEFAULT_CONFIDENCE = 0.95
+# A bundle whose blank-page rate may be above this (upper confidence bound) needs a full analysis
+DEFAULT_MAX_BLANK_RATE = 0.2
+# Seconds one sampled page may take when the analyzer has no page timeout of its own
+DEFAULT_PAGE_TIMEOUT = 30.0
+
+
+def stratified_sample(page_count: int, sample_pages: int, seed: int = 0) -> List[int]:
+    """Page numbers to analyze: the first and last page, and one page drawn at random from each of
+    sample_pages - 2 equal runs of the pages in between; every page of a file no longer than that"""
+    if page_count <= max(sample_pages, 2):
+        return list(range(1, page_count + 1))
+    rng = random.Random(seed)
+    interior = page_count - 2
+    strata = max(sample_pages - 2, 0)
+    picks = [rng.randint(2 + i * interior // strata, 1 + (i + 1) * interior // strata) for i in range(strata)]
+    return [1] + picks + [page_count]
+
+
+def proportion_bounds(successes: int, sampled: int, population: int, z: float) -> Tuple[float, float]:
+    """Wilson score interval for a share of `population` pages, from `sampled` of them drawn
+    without replacement (the finite population correction narrows it to nothing at a full count)"""
+    if sampled >= population:
+        share = successes / population if population else 0.0
+        return share, share
+    if not sampled:
+        return 0.0, 1.0
+    n = sampled * (population - 1) / (population - sampled)
+    share = successes / sampled
+    centre = share + z * z / (2 * n)
+    spread = z * (share * (1 - share) / n + z * z / (4 * n * n)) ** 0.5
+    return max(0.0, (centre - spread) / (1 + z * z / n)), min(1.0, (centre + spread) / (1 + z * z / n))
+
+
+def mean_bounds(values: List[int], population: int, z: float) -> Tuple[float, float, Optional[float]]:
+    """Mean of per-page counts over `population` pages from a sample of them, with normal bounds
+    (the upper bound is None with nothing sampled). Below two pages the variance is taken to be
+    the mean, as for a Poisson count."""
+    if not population:
+        return 0.0, 0.0, 0.0
+    if not values:
+        return 0.0, 0.0, None
+    n = len(values)
+    mean = sum(values) / n
+    variance = sum((value - mean) ** 2 for value in values) / (n - 1) if n > 1 else mean
+    error = z * (variance / n * max(0.0, 1 - n / population)) ** 0.5
+    return mean, max(0.0, mean - error), mean + error
+
+
+def _page_order(files: List[Dict]) -> List[Tuple[int, int]]:
+    """(file index, page) in the order to parse them: the first and last page of every file, then
+    the rest of each file's sample in random order, one page from each file in turn, so a sample
+    the deadline cuts short is still spread over every file and over each file's pages"""
+    boundary, interior = [], []
+    for index, f in enumerate(files):
+        sample = f['sample']
+        edges = sorted({sample[0], sample[-1]}) if sample else []
+        rest = [page for page in sample if page not in edges]
+        random.Random(f['seed']).shuffle(rest)
+        boundary += [(index, page) for page in edges]
+        interior.append([(index, page) for page in rest])
+    return boundary + [item for round_ in zip_longest(*interior) for item in round_ if item is not None]
+
+
+def _estimate(known: float, population: int, bounds: Tuple, sampled: int) -> Dict:
+    """Total over a file: the counted boundary pages plus the interior estimate scaled to its pages"""
+    estimate, low, high = bounds
+    return {'estimate': known + population * estimate, 'low': known + population * low,
+            'high': None if high is None else known + population * high,
+            'unsampled': population > 0 and not sampled}
+
+
+def _combine(estimates: List[Dict], total: int) -> Dict:
+    """Bundle total of per-file totals. Sampled files are independent strata, so their deviations
+    from the estimate add in quadrature; a file with no interior page sampled is only known to lie
+    anywhere in its range, so its deviation is added in full"""
+    estimate = sum(e['estimate'] for e in estimates)
+    sampled = [e for e in estimates if not e['unsampled']]
+    unsampled = [e for e in estimates if e['unsampled']]
+    low = estimate - sum((e['estimate'] - e['low']) ** 2 for e in sampled) ** 0.5 \
+        - sum(e['estimate'] - e['low'] for e in unsampled)
+    high = None
+    if all(e['high'] is not None for e in estimates):
+        high = estimate + sum((e['high'] - e['estimate']) ** 2 for e in sampled) ** 0.5 \
+            + sum(e['high'] - e['estimate'] for e in unsampled)
+    combined = {'estimate': estimate, 'low': max(0.0, low), 'high': high}
+    combined['rate'] = {key: None if value is None else value / total if total else 0.0
+                        for key, value in combined.items()}
+    return combined
+
+
+def _file_triage(analyzer, f: Dict, page_results: List[Dict], z: float) -> Dict:
+    """Extrapolate one PDF's blank pages and tables from its analyzed sample pages"""
+    page_count = f['pages']
+    page_results.sort(key=lambda page: page['page'])
+    summary = analyzer.summarize_file(f['filename'], page_results)
+
+    boundary = {1, page_count} if page_count else set()
+    interior = [page for page in page_results if page['page'] not in boundary]
+    counted = [page for page in page_results if page['page'] in boundary]
+    population = page_count - len(boundary)
+    blank = sum(page['is_blank'] for page in interior)
+    # Unsampled interior pages are taken to be as blank as the first and last, within bounds of 0 and 1
+    share = blank / len(interior) if interior else sum(page['is_blank'] for page in counted) / max(len(counted), 1)
+    last_page_done = bool(page_results) and page_results[-1]['page'] == page_count
+    return {
+        'filename': f['filename'],
+        'pages': page_count,
+        'sampled': [page['page'] for page in page_results],
+        'timed_out_pages': f['timed_out'],
+        'cut_short': f['cut_short'],
+        'blank_pages': _estimate(sum(page['is_blank'] for page in counted), population,
+                                 (share, *proportion_bounds(blank, len(interior), population, z)), len(interior)),
+        'tables': _estimate(sum(len(page['tables']) for page in counted), population,
+                            mean_bounds([len(page['tables']) for page in interior], population, z), len(interior)),
+        'unreconciled_rows': summary['unreconciled_rows'],
+        'last_page_totals': summary['last_page_totals'] if last_page_done else None,
+        'over_page_limit': False,
+        'errors': f['errors']
+    }
+
+
+def triage_bundle(analyzer, zip_path: str, parse_worker: Callable, sample_pages: int = DEFAULT_SAMPLE_PAGES,
+                  time_budget: float = DEFAULT_TIME_BUDGET, confidence: float = DEFAULT_CONFIDENCE,
+                  max_blank_rate: float = DEFAULT_MAX_BLANK_RATE) -> Dict:
+    """Sampled analysis of a ZIP with `analyzer` (a FinancialDocumentAnalyzer), and whether it needs
+    a full one
+
+    The archive is held to the analyzer's archive limits first (raising ArchiveRejected) and its
+    PDFs are spooled to disk. Each sampled page is then a task of its own for parse_worker
+    (_parse_pdf_worker) on the analyzer's worker pool (or a pool of max_workers made for the
+    triage), killed after the analyzer's page timeout (DEFAULT_PAGE_TIMEOUT if it has none).
+    First and last pages go first, so they are the last to be cut; pages still queued or running
+    when time_budget runs out are abandoned. needs_full_analysis is set, with its reasons, for
+    missing files, a receipt-payment difference (or a first file whose last page was not
+    analyzed), unreconciled rows, timed-out pages or unreadable files in the sample, files over
+    the analyzer's page limit (not sampled, as the full analysis would not parse them either), a
+    blank-page rate that may exceed max_blank_rate, or files the budget cut short before any page
+    between their first and last was analyzed.
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    pool = analyzer.executor if isinstance(analyzer.executor, WorkerPool) else analyzer.create_worker_pool()
+    page_timeout = analyzer.page_timeout or DEFAULT_PAGE_TIMEOUT
+    max_pages = analyzer.archive_limits.max_pages
+    spool_dir = tempfile.mkdtemp(prefix="fda_triage_")
+    try:
+        files = []
+        with open_archive(zip_path) as zip_ref:
+            check_members(zip_ref.infolist(), analyzer.archive_limits)
+            members = pdf_members(zip_ref.infolist())
+            for index, info in enumerate(members):
+                path = os.path.join(spool_dir, f"{index:06d}.pdf")
+                with open(path, 'w+b') as spool:
+                    copy_member(zip_ref, info, spool)
+                    spool.seek(0)
+                    page_count = count_pages(spool)
+                filename = os.path.basename(info.filename)
+                seed = zlib.crc32(filename.encode())
+                over_page_limit = page_count is not None and max_pages is not None and page_count > max_pages
+                files.append({'filename': filename, 'path': path, 'pages': page_count, 'seed': seed,
+                              'sample': stratified_sample(page_count, sample_pages, seed)
+                              if page_count and not over_page_limit else [],
+                              'errors': [] if page_count is not None else ["page tree could not be read"],
+                              'timed_out': [], 'cut_short': False, 'over_page_limit': over_page_limit})
+
+        futures = {pool.submit_with_timeout(page_timeout, None, parse_worker, files[index]['path'], pages=[page]):
+                   (index, page) for index, page in _page_order(files)}
+        done, pending = wait(futures, timeout=max(0.0, deadline - time.perf_counter()))
+        for future in pending:
+            pool.interrupt(future)
+            files[futures[future][0]]['cut_short'] = True
+
+        page_results: List[List[Dict]] = [[] for _ in files]
+        for future in done:
+            index, page = futures[future]
+            try:
+                result = future.result()
+            except TaskTimeout:
+                files[index]['timed_out'].append(page)
+                continue
+            except (WorkerLost, TaskCancelled, CancelledError) as e:
+                files[index]['errors'].append(f"page {page}: {e or type(e).__name__}")
+                continue
+            except Exception as e:
+                # Raised by the parse itself and forwarded by the worker; the other pages still count
+                files[index]['errors'].append(f"page {page}: {type(e).__name__}: {e}")
+                continue
+            page_results[index].extend(result['pages'])
+            files[index]['errors'].extend(result['errors'])
+    finally:
+        if pool is not analyzer.executor:
+            pool.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    files = [_file_triage(analyzer, f, page_results[index], z)
+             if f['pages'] is not None and not f['over_page_limit'] else
+             {'filename': f['filename'], 'pages': f['pages'], 'sampled': [], 'timed_out_pages': [], 'cut_short': False,
+              'over_page_limit': f['over_page_limit'], 'errors': f['errors']}
+             for index, f in enumerate(files)]
+    # Estimates cover the files that were sampled; files over the page limit are reasons of their own
+    readable = [f for f in files if f['pages'] is not None and not f['over_page_limit']]
+    total_pages = sum(f['pages'] for f in readable)
+    missing_files = analyzer.check_missing_files([info.filename for info in members])
+    if files and files[0]['pages'] and files[0].get('last_page_totals') is None:
+        receipt_payment_check = {'status': 'Last page not analyzed', 'equal': False}
+    else:
+        receipt_payment_check = analyzer.check_receipt_payment_balance(files[0].get('last_page_totals')
+                                                                       if files else None)
+    blank_pages = _combine([f['blank_pages'] for f in readable], total_pages)
+    tables = _combine([f['tables'] for f in readable], total_pages)
+
+    reasons = []
+    if missing_files:
+        reasons.append(f"{len(missing_files)} schedules or annexures missing")
+    if 'status' in receipt_payment_check:
+        reasons.append(f"receipt-payment check: {receipt_payment_check['status']}")
+    elif not receipt_payment_check['equal']:
+        reasons.append("receipts and payments differ on the last page of the first file")
+    unreconciled = sum(f['unreconciled_rows'] for f in readable)
+    if unreconciled:
+        reasons.append(f"{unreconciled} unreconciled rows on sampled pages")
+    timed_out = sum(len(f['timed_out_pages']) for f in files)
+    if timed_out:
+        reasons.append(f"{timed_out} sampled pages timed out")
+    failed = [f['filename'] for f in files if f['errors']]
+    if failed:
+        reasons.append(f"unreadable files: {', '.join(failed)}")
+    over_page_limit = [f['filename'] for f in files if f['over_page_limit']]
+    if over_page_limit:
+        reasons.append(f"over the {max_pages}-page limit, not sampled: {', '.join(over_page_limit)}")
+    if blank_pages['rate']['high'] is not None and blank_pages['rate']['high'] > max_blank_rate:
+        reasons.append(f"blank pages may be up to {blank_pages['rate']['high']:.0%} (limit {max_blank_rate:.0%})")
+    cut_short = [f['filename'] for f in readable if f['cut_short'] and f['blank_pages']['unsampled']]
+    if cut_short:
+        reasons.append(f"the time budget ran out before {len(cut_short)} files were sampled beyond their "
+                       f"first and last pages")
+
+    return {
+        'bundle': os.path.basename(zip_path),
+        'total_pdf_files': len(files),
+        'total_pages': total_pages,
+        'sampled_pages': sum(len(f['sampled']) for f in files),
+        'confidence': confidence,
+        'time_budget': time_budget,
+        'seconds': time.perf_counter() - started,
+        'budget_reached': any(f['cut_short'] for f in files),
+        'blank_pages': blank_pages,
+        'tables': tables,
+        'missing_files': missing_files,
+        'receipt_payment_verification': receipt_payment_check,
+        'needs_full_analysis': bool(reasons),
+        'reasons': reasons,
+        'files': files
+    }
@@ -0,0 +1,111 @@
+# Financial Document Analyzer - Period Comparison
+# Purpose: Compare a freshly analyzed bundle with the client's previous period in the results
+#          history, matching files by schedule/annexure number and pages by page number, and flag
+#          large variances; only the new bundle is parsed, the prior period comes from stored totals
+
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from results_store import TOTAL_COLUMNS, ResultsStore, bundle_identity, document_key
+
+# Totals compared, with the names used in reports
+TOTAL_LABELS = (('opening_balance_total', 'Opening Balance'), ('debit_total', 'Debit'),
+                ('credit_total', 'Credit'), ('closing_balance_total', 'Closing Balance'))
+DEFAULT_VARIANCE_THRESHOLD = 0.10
+# Differences below this are rounding, whatever their percentage
+DEFAULT_MIN_DIFFERENCE = 1.0
+
+# Files present in only one of the two periods
+NEW_FILE = 'new this period'
+DROPPED_FILE = 'not in this period'
+COMPARED = 'compared'
+
+
+def match_keys(filenames: Sequence[str]) -> List[str]:
+    """Join key per file: its schedule/annexure (or 'trial balance') when unique in the bundle, else its name"""
+    documents = [document_key(filename) for filename in filenames]
+    counts = Counter(documents)
+    return [document if document and counts[document] == 1 else filename.lower()
+            for filename, document in zip(filenames, documents)]
+
+
+def variance(current: float, prior: float, threshold: float, min_difference: float) -> Dict:
+    """Change between two totals; flagged when it is both material and past the relative threshold"""
+    change = current - prior
+    change_pct = change / abs(prior) if prior else (0.0 if not change else None)
+    flagged = abs(change) >= min_difference and (change_pct is None or abs(change_pct) > threshold)
+    return {'current': current, 'prior': prior, 'change': change, 'change_pct': change_pct, 'flagged': flagged}
+
+
+def compare_with_previous(results: Dict, store: ResultsStore, client: str, period: Optional[str] = None,
+                          prior_period: Optional[str] = None, threshold: float = DEFAULT_VARIANCE_THRESHOLD,
+                          min_difference: float = DEFAULT_MIN_DIFFERENCE) -> Optional[Dict]:
+    """Per-file and per-page variances of an analyze_zip_file result against the client's previous
+    stored bundle (see ResultsStore.previous_bundle); None when there is nothing to compare with"""
+    prior = store.previous_bundle(client, period, prior_period, exclude_fingerprint=results.get('bundle_fingerprint'))
+    if prior is None:
+        return None
+
+    current_files = results['file_analysis']
+    prior_files = store.bundle_files(prior['id'])
+    current_by_key = dict(zip(match_keys([f['filename'] for f in current_files]), current_files))
+    prior_by_key = dict(zip(match_keys([f['filename'] for f in prior_files]), prior_files))
+
+    prior_pages: Dict[tuple, Dict] = {}
+    prior_keys = {f['filename']: key for key, f in prior_by_key.items()}
+    for page in store.page_details(prior['id']):
+        prior_pages[(prior_keys[page['filename']], page['page_number'])] = page
+
+    files, pages = [], []
+    for key, current in current_by_key.items():
+        previous = prior_by_key.get(key)
+        row = {'key': key, 'filename': current['filename'], 'prior_filename': previous and previous['filename'],
+               'status': COMPARED if previous else NEW_FILE, 'totals': {}, 'flagged': False}
+        if previous:
+            current_totals = current['page_details'].totals()
+            for column in TOTAL_COLUMNS:
+                row['totals'][column] = variance(current_totals[column], previous[column], threshold, min_difference)
+            row['flagged'] = any(change['flagged'] for change in row['totals'].values())
+
+            for page_number, *page_totals in current['page_details'].rows('page_number', *TOTAL_COLUMNS):
+                previous_page = prior_pages.get((key, page_number))
+                if previous_page is None:
+                    continue
+                for column, total in zip(TOTAL_COLUMNS, page_totals):
+                    change = variance(total, previous_page[column], threshold, min_difference)
+                    if change['flagged']:
+                        pages.append({'key': key, 'filename': current['filename'],
+                                      'page_number': page_number, 'column': column, **change})
+        files.append(row)
+
+    for key, previous in prior_by_key.items():
+        if key not in current_by_key:
+            files.append({'key': key, 'filename': None, 'prior_filename': previous['filename'],
+                          'status': DROPPED_FILE, 'totals': {}, 'flagged': False})
+
+    return {
+        'prior': prior,
+        'threshold': threshold,
+        'min_difference': min_difference,
+        'files': files,
+        'pages': pages,
+        'flagged_files': sum(1 for row in files if row['flagged'])
+    }
+
+
+def describe_prior(comparison: Dict) -> str:
+    prior = comparison['prior']
+    period = f" {prior['period']}" if prior['period'] else ""
+    return f"{prior['client']}{period} ({prior['source']}, bundle {prior['id']})"
+
+
+def compare_in_store(path: str, results: Dict, source: str, client: Optional[str] = None,
+                     period: Optional[str] = None, prior_period: Optional[str] = None,
+                     threshold: float = DEFAULT_VARIANCE_THRESHOLD) -> Optional[Dict]:
+    """Open the store at path and compare with the previous period; client and period default from the source name"""
+    store = ResultsStore(path)
+    try:
+        client, period = bundle_identity(source, client, period)
+        return compare_with_previous(results, store, client, period, prior_period, threshold)
+    finally:
+        store.close()
@@ -0,0 +1,390 @@
+# Financial Document Analyzer - Results Store
+# Purpose: Keep every analysis in an embedded SQLite database (bundles, files, pages and
+#          verification checks, indexed by client, period and status) so portfolio-wide questions
+#          are answered from stored totals instead of re-parsing PDFs
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bundles (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT,
+    client TEXT NOT NULL,
+    period TEXT,
+    source TEXT,
+    analyzed_at REAL NOT NULL,
+    total_files INTEGER NOT NULL,
+    total_pages INTEGER NOT NULL,
+    missing_files TEXT NOT NULL,
+    partial INTEGER NOT NULL,
+    wall_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS bundles_client_period ON bundles (client, period);
+CREATE INDEX IF NOT EXISTS bundles_period ON bundles (period);
+CREATE INDEX IF NOT EXISTS bundles_analyzed_at ON bundles (analyzed_at);
+CREATE INDEX IF NOT EXISTS bundles_fingerprint ON bundles (fingerprint);
+
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    bundle_id INTEGER NOT NULL REFERENCES bundles (id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    document TEXT,
+    status TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    blank_pages INTEGER NOT NULL,
+    timed_out_pages INTEGER NOT NULL,
+    financial_tables INTEGER NOT NULL,
+    opening_balance_total REAL NOT NULL,
+    debit_total REAL NOT NULL,
+    credit_total REAL NOT NULL,
+    closing_balance_total REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_bundle ON files (bundle_id);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+CREATE INDEX IF NOT EXISTS files_document ON files (document);
+
+CREATE TABLE IF NOT EXISTS pages (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    page_number INTEGER NOT NULL,
+    is_blank INTEGER NOT NULL,
+    timed_out INTEGER NOT NULL,
+    opening_balance_total REAL NOT NULL,
+    debit_total REAL NOT NULL,
+    credit_total REAL NOT NULL,
+    closing_balance_total REAL NOT NULL,
+    PRIMARY KEY (file_id, page_number)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS verifications (
+    bundle_id INTEGER NOT NULL REFERENCES bundles (id) ON DELETE CASCADE,
+    check_name TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    amount_1 REAL,
+    amount_2 REAL,
+    difference REAL,
+    status TEXT,
+    PRIMARY KEY (bundle_id, check_name)
+);
+CREATE INDEX IF NOT EXISTS verifications_check ON verifications (check_name, passed);
+"""
+
+TOTAL_COLUMNS = ('opening_balance_total', 'debit_total', 'credit_total', 'closing_balance_total')
+CHECKS = ('receipt_payment', 'trial_balance')
+
+DOCUMENT_PATTERN = re.compile(r'\b(schedule|annexure)\s*[-_]?\s*(\d+)\b')
+PERIOD_PATTERNS = (
+    (re.compile(r'\bfy\s*[-_]?\s*(\d{4})\s*[-_/]\s*(\d{2}|\d{4})\b', re.I),
+     lambda m: f"FY{m.group(1)}-{m.group(2)[-2:]}"),
+    (re.compile(r'\b(\d{4})\s*[-_ ]?\s*q([1-4])\b', re.I), lambda m: f"{m.group(1)}-Q{m.group(2)}"),
+    (re.compile(r'\bq([1-4])\s*[-_ ]?\s*(\d{4})\b', re.I), lambda m: f"{m.group(2)}-Q{m.group(1)}"),
+    (re.compile(r'\b(\d{4})[-_](0[1-9]|1[0-2])\b'), lambda m: f"{m.group(1)}-{m.group(2)}"),
+)
+
+
+# Period labels (infer_period's, and a bare year) as a granularity and a sort key within it
+PERIOD_ORDERS = (
+    (re.compile(r'^FY(\d{4})-\d{2}$'), 'fiscal year'),
+    (re.compile(r'^(\d{4})-Q([1-4])$'), 'quarter'),
+    (re.compile(r'^(\d{4})-(\d{2})$'), 'month'),
+    (re.compile(r'^(\d{4})$'), 'year'),
+)
+
+
+def period_order(period: str) -> Tuple[str, Tuple[int, ...]]:
+    """('quarter', (2024, 1)) for '2024-Q1': periods only follow each other within one granularity,
+    and a label in no known format is a granularity of its own"""
+    for pattern, granularity in PERIOD_ORDERS:
+        match = pattern.match(period)
+        if match:
+            return granularity, tuple(int(group) for group in match.groups())
+    return period, ()
+
+
+def document_key(filename: str) -> Optional[str]:
+    """'schedule 3' / 'annexure 12' for a bundle file name, as the missing-files check spells them"""
+    name = os.path.basename(filename).lower()
+    match = DOCUMENT_PATTERN.search(name)
+    if match:
+        return f"{match.group(1)} {int(match.group(2))}"
+    if 'trial balance' in name:
+        return 'trial balance'
+    return None
+
+
+def infer_period(name: str) -> Optional[str]:
+    """Reporting period from a bundle name: FY2023-24, 2024-Q1 or 2024-03 (None if there is none)"""
+    stem = os.path.splitext(os.path.basename(name))[0].replace('_', ' ')
+    for pattern, label in PERIOD_PATTERNS:
+        match = pattern.search(stem)
+        if match:
+            return label(match)
+    return None
+
+
+class ResultsStore:
+    """
+    SQLite database of analysis results.
+    save() writes one bundle (files, pages, checks) in a single transaction and replaces an
+    earlier save of the same bundle for the same client and period. A store object belongs to
+    the thread that opened it; open one per thread.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def save(self, results: Dict, client: str, period: Optional[str] = None, source: Optional[str] = None) -> int:
+        """Store one analyze_zip_file result and return its bundle id"""
+        fingerprint = results.get('bundle_fingerprint')
+        with self.conn:
+            if fingerprint:
+                self.conn.execute("DELETE FROM bundles WHERE fingerprint = ? AND client = ? AND period IS ?",
+                                  (fingerprint, client, period))
+            bundle_id = self.conn.execute("""
+                INSERT INTO bundles (fingerprint, client, period, source, analyzed_at, total_files, total_pages,
+                                     missing_files, partial, wall_seconds)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", (
+                fingerprint, client, period, source, time.time(), results['total_pdf_files'],
+                results['perf']['total_pages'], json.dumps(results['missing_files']), int(results['partial']),
+                results['perf']['wall_seconds'])).lastrowid
+
+            for file_analysis in results['file_analysis']:
+                details = file_analysis['page_details']
+                file_id = self.conn.execute("""
+                    INSERT INTO files (bundle_id, filename, document, status, pages, blank_pages, timed_out_pages,
+                                       financial_tables, opening_balance_total, debit_total, credit_total,
+                                       closing_balance_total)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", (
+                    bundle_id, file_analysis['filename'], document_key(file_analysis['filename']),
+                    file_analysis['status'], file_analysis['pages'], file_analysis['blank_pages'],
+                    int(details.column('timed_out').sum()), file_analysis['financial_tables'],
+                    *(details.totals()[column] for column in TOTAL_COLUMNS))).lastrowid
+                self.conn.executemany("INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (
+                    (file_id, *page) for page in details.rows('page_number', 'is_blank', 'timed_out', *TOTAL_COLUMNS)))
+
+            rp = results['receipt_payment_verification']
+            tb = results['trial_balance_verification']
+            self.conn.executemany("INSERT INTO verifications VALUES (?, ?, ?, ?, ?, ?, ?)", [
+                (bundle_id, 'receipt_payment', int(rp['equal']), rp.get('receipt_total'), rp.get('payment_total'),
+                 rp.get('difference'), rp.get('status')),
+                (bundle_id, 'trial_balance', int(tb['consistent']), tb.get('debit_total'), tb.get('credit_total'),
+                 tb.get('difference'), tb.get('status'))
+            ])
+        return bundle_id
+
+    def find_bundles(self, client: Optional[str] = None, period: Optional[str] = None,
+                     since: Optional[float] = None, partial: Optional[bool] = None) -> List[Dict]:
+        """Stored bundles, newest first"""
+        where, params = self._bundle_filter(client, period, since)
+        if partial is not None:
+            where.append("b.partial = ?")
+            params.append(int(partial))
+        return self.query(f"""
+            SELECT b.id, b.client, b.period, b.source, b.analyzed_at, b.total_files, b.total_pages,
+                   b.missing_files, b.partial
+            FROM bundles b {self._where(where)} ORDER BY b.analyzed_at DESC""", params)
+
+    def failed_checks(self, check: str, client: Optional[str] = None, period: Optional[str] = None,
+                      since: Optional[float] = None) -> List[Dict]:
+        """Bundles whose receipt_payment or trial_balance check failed"""
+        if check not in CHECKS:
+            raise ValueError(f"check must be one of {', '.join(CHECKS)}")
+        where, params = self._bundle_filter(client, period, since)
+        where[:0] = ["v.check_name = ?", "v.passed = 0"]
+        params[:0] = [check]
+        return self.query(f"""
+            SELECT b.id, b.client, b.period, b.source, b.analyzed_at, v.amount_1, v.amount_2, v.difference, v.status
+            FROM verifications v JOIN bundles b ON b.id = v.bundle_id
+            {self._where(where)} ORDER BY b.client, b.period""", params)
+
+    def find_files(self, status: Optional[str] = None, document: Optional[str] = None,
+                   client: Optional[str] = None, period: Optional[str] = None,
+                   since: Optional[float] = None) -> List[Dict]:
+        """Stored files; status matches a prefix ('skipped', 'partial: page timeout', 'analyzed')"""
+        where, params = self._bundle_filter(client, period, since)
+        if status:
+            # Range scan on the status index instead of LIKE
+            where.append("f.status >= ? AND f.status < ?")
+            params.extend([status, status + '\uffff'])
+        if document:
+            where.append("f.document = ?")
+            params.append(document.lower())
+        return self.query(f"""
+            SELECT b.client, b.period, f.bundle_id, f.filename, f.document, f.status, f.pages, f.blank_pages,
+                   f.timed_out_pages, f.financial_tables, f.opening_balance_total, f.debit_total, f.credit_total,
+                   f.closing_balance_total
+            FROM files f JOIN bundles b ON b.id = f.bundle_id
+            {self._where(where)} ORDER BY b.client, b.period, f.id""", params)
+
+    def previous_bundle(self, client: str, period: Optional[str] = None, prior_period: Optional[str] = None,
+                        exclude_fingerprint: Optional[str] = None) -> Optional[Dict]:
+        """The bundle a new analysis of client/period is compared with
+
+        prior_period picks that period's latest bundle; otherwise the latest bundle of the closest
+        earlier period of the same granularity (see period_order: 2024-Q1 follows 2023-Q4, never
+        2024-12), or without a period, the client's most recently analyzed bundle.
+        """
+        where, params = ["b.client = ?"], [client]
+        if prior_period is not None:
+            where.append("b.period = ?")
+            params.append(prior_period)
+        elif period is not None:
+            where.append("b.period IS NOT NULL")
+        if exclude_fingerprint is not None:
+            where.append("b.fingerprint IS NOT ?")
+            params.append(exclude_fingerprint)
+        rows = self.query(f"""
+            SELECT b.id, b.client, b.period, b.source, b.analyzed_at FROM bundles b
+            {self._where(where)} ORDER BY b.analyzed_at DESC""", params)
+        if prior_period is None and period is not None:
+            # Period labels of different formats do not sort as text, so the order is read from them
+            granularity, order = period_order(period)
+            rows = [row for row in rows if period_order(row['period'])[0] == granularity
+                    and period_order(row['period'])[1] < order]
+            # Newest first already, so max() keeps the latest bundle of the closest period
+            return max(rows, key=lambda row: period_order(row['period'])[1], default=None)
+        return rows[0] if rows else None
+
+    def bundle_files(self, bundle_id: int) -> List[Dict]:
+        """Stored files of one bundle with their totals, in archive order"""
+        return self.query("""
+            SELECT id, filename, document, status, pages, opening_balance_total, debit_total, credit_total,
+                   closing_balance_total
+            FROM files WHERE bundle_id = ? ORDER BY id""", [bundle_id])
+
+    def page_details(self, bundle_id: int) -> List[Dict]:
+        """Per-page totals of one stored bundle, in file and page order"""
+        return self.query("""
+            SELECT f.filename, f.document, p.page_number, p.is_blank, p.timed_out, p.opening_balance_total,
+                   p.debit_total, p.credit_total, p.closing_balance_total
+            FROM pages p JOIN files f ON f.id = p.file_id
+            WHERE f.bundle_id = ? ORDER BY f.id, p.page_number""", [bundle_id])
+
+    def query(self, sql: str, params: Sequence = ()) -> List[Dict]:
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def delete_bundle(self, bundle_id: int) -> bool:
+        with self.conn:
+            return self.conn.execute("DELETE FROM bundles WHERE id = ?", (bundle_id,)).rowcount > 0
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _bundle_filter(client: Optional[str], period: Optional[str], since: Optional[float]):
+        where, params = [], []
+        for clause, value in (("b.client = ?", client), ("b.period = ?", period), ("b.analyzed_at >= ?", since)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        return where, params
+
+    @staticmethod
+    def _where(clauses: List[str]) -> str:
+        return "WHERE " + " AND ".join(clauses) if clauses else ""
+
+
+def bundle_identity(source: str, client: Optional[str] = None, period: Optional[str] = None):
+    """(client, period) for a bundle: as given, else the ZIP name and the period read from it"""
+    return client or os.path.splitext(os.path.basename(source))[0], period or infer_period(source)
+
+
+def save_results(path: str, results: Dict, client: Optional[str], period: Optional[str], source: str) -> int:
+    """Open the store at path, save one result and close it; client and period default from the source name"""
+    store = ResultsStore(path)
+    try:
+        return store.save(results, *bundle_identity(source, client, period), os.path.basename(source))
+    finally:
+        store.close()
+
+
+def _print_rows(rows: Iterable[Dict], as_json: bool):
+    rows = list(rows)
+    if as_json:
+        print(json.dumps(rows, indent=2))
+        return
+    if not rows:
+        print("No results")
+        return
+    columns = list(rows[0])
+    print("\t".join(columns))
+    for row in rows:
+        if 'analyzed_at' in row:
+            row['analyzed_at'] = time.strftime("%Y-%m-%d %H:%M", time.localtime(row['analyzed_at']))
+        print("\t".join("" if row[column] is None else str(row[column]) for column in columns))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Query stored analysis results")
+    parser.add_argument("--db", default=os.environ.get('FDA_RESULTS_DB'),
+                        help="Results database (default: FDA_RESULTS_DB)")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of tab-separated rows")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(command):
+        command.add_argument("--client")
+        command.add_argument("--period", help="e.g. 2024-Q1 or FY2023-24")
+        command.add_argument("--days", type=float, help="Only bundles analyzed in the last N days")
+
+    bundles_parser = commands.add_parser("bundles", help="List stored bundles")
+    add_filters(bundles_parser)
+    bundles_parser.add_argument("--partial", action="store_true", help="Only partial runs")
+
+    checks_parser = commands.add_parser("failed-checks", help="Bundles whose verification check failed")
+    checks_parser.add_argument("check", choices=CHECKS)
+    add_filters(checks_parser)
+
+    files_parser = commands.add_parser("files", help="Stored files by status or document")
+    files_parser.add_argument("--status", help="Status prefix, e.g. skipped or 'partial: page timeout'")
+    files_parser.add_argument("--document", help="e.g. 'schedule 3'")
+    add_filters(files_parser)
+
+    pages_parser = commands.add_parser("pages", help="Per-page totals of one bundle")
+    pages_parser.add_argument("bundle_id", type=int)
+
+    sql_parser = commands.add_parser("sql", help="Run a read-only SQL query")
+    sql_parser.add_argument("sql")
+
+    args = parser.parse_args(argv)
+    if not args.db:
+        parser.error("no database: pass --db or set FDA_RESULTS_DB")
+    if not os.path.exists(args.db):
+        sys.exit(f"No results database at {args.db}")
+
+    store = ResultsStore(args.db)
+    try:
+        since = time.time() - args.days * 86400 if getattr(args, 'days', None) else None
+        if args.command == "bundles":
+            rows = store.find_bundles(args.client, args.period, since, partial=True if args.partial else None)
+        elif args.command == "failed-checks":
+            rows = store.failed_checks(args.check, args.client, args.period, since)
+        elif args.command == "files":
+            rows = store.find_files(args.status, args.document, args.client, args.period, since)
+        elif args.command == "pages":
+            rows = store.page_details(args.bundle_id)
+        else:
+            store.conn.execute("PRAGMA query_only=ON")
+            try:
+                rows = store.query(args.sql)
+            except sqlite3.Error as e:
+                sys.exit(f"Query failed: {e}")
+        _print_rows(rows, args.json)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
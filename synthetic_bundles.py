@@ -0,0 +1,336 @@
+# Financial Document Analyzer - Synthetic Bundles
+# Purpose: Build deterministic ZIP bundles of financial PDFs (schedules, annexures, trial balances,
+#          blank pages, gaps) for benchmarks, with a manifest of what the analyzer should find.
+#          Pure Python: no external services or PDF libraries are needed to generate them.
+
+import argparse
+import io
+import json
+import random
+import zipfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 842
+MARGIN = 40
+ROW_HEIGHT = 12
+TABLE_GAP = 18
+TITLE_HEIGHT = 44
+
+COLUMN_HEADERS = ["Particulars", "Opening Balance", "Debit", "Credit", "Closing Balance",
+                  "Reference", "Note", "Group"]
+FINANCIAL_KEYS = {"Opening Balance": 'opening_balance', "Debit": 'debit', "Credit": 'credit',
+                  "Closing Balance": 'closing_balance'}
+
+# Named bundle shapes shared by the benchmark harnesses
+PRESETS = {
+    'small': {'missing': 3, 'pages_per_file': 3, 'rows_per_table': 20},
+    'medium': {'missing': 3, 'extra_files': 20, 'pages_per_file': 10, 'rows_per_table': 30},
+    'large': {'missing': 3, 'extra_files': 200, 'pages_per_file': 20, 'rows_per_table': 30, 'tables_per_page': 2},
+    'wide': {'missing': 0, 'pages_per_file': 5, 'rows_per_table': 40, 'columns': 8, 'noisy_numbers': True},
+}
+
+
+class BundleSpec:
+    """Shape of a synthetic bundle; the same spec and seed always produce the same bytes"""
+
+    def __init__(self, schedules: int = 22, annexures: int = 12, missing: int = 0,
+                 trial_balance_files: int = 2, extra_files: int = 0, pages_per_file: int = 3,
+                 tables_per_page: int = 1, rows_per_table: int = 20, columns: int = 5,
+                 blank_page_ratio: float = 0.1, noisy_numbers: bool = False, balanced: bool = True,
+                 trial_balance_consistent: bool = True, seed: int = 0):
+        """
+        schedules / annexures: how many of Schedule 1..N and Annexure 1..N the client sent
+        missing: how many of those to leave out (chosen from the seed)
+        extra_files: supporting PDFs that are neither schedules nor annexures
+        columns: table width, from 2 (particulars and opening balance) to 8
+        blank_page_ratio: share of each file's pages (never the last) left blank
+        noisy_numbers: mix in bracketed negatives, currency prefixes, Dr/Cr suffixes and dashes
+        balanced: debit and credit totals agree on the last page of the first file
+        trial_balance_consistent: trial balance files balance and each one opens with the previous one's closing figures
+        """
+        self.schedules = schedules
+        self.annexures = annexures
+        self.missing = missing
+        self.trial_balance_files = trial_balance_files
+        self.extra_files = extra_files
+        self.pages_per_file = pages_per_file
+        self.tables_per_page = tables_per_page
+        self.rows_per_table = rows_per_table
+        self.columns = columns
+        self.blank_page_ratio = blank_page_ratio
+        self.noisy_numbers = noisy_numbers
+        self.balanced = balanced
+        self.trial_balance_consistent = trial_balance_consistent
+        self.seed = seed
+        self.validate()
+
+    @classmethod
+    def preset(cls, name: str, **overrides) -> 'BundleSpec':
+        return cls(**{**PRESETS[name], **overrides})
+
+    def validate(self):
+        if not 2 <= self.columns <= len(COLUMN_HEADERS):
+            raise ValueError(f"columns must be between 2 and {len(COLUMN_HEADERS)}")
+        if self.missing > self.schedules + self.annexures:
+            raise ValueError("cannot leave out more files than there are schedules and annexures")
+        if self.pages_per_file < 1:
+            raise ValueError("pages_per_file must be at least 1")
+        if not 0 <= self.blank_page_ratio <= 1:
+            raise ValueError("blank_page_ratio must be between 0 and 1")
+        height = self.tables_per_page * ((self.rows_per_table + 1) * ROW_HEIGHT + TABLE_GAP)
+        if height > PAGE_HEIGHT - 2 * MARGIN - TITLE_HEIGHT:
+            raise ValueError(f"{self.tables_per_page} table(s) of {self.rows_per_table} rows do not fit on a page")
+
+    def to_dict(self) -> Dict:
+        return dict(vars(self))
+
+
+def _pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_document(pages: List[Tuple[List[str], List[List[List[str]]]]]) -> bytes:
+    """Minimal PDF with Helvetica text lines and ruled tables (which pdfplumber detects by their lines)
+
+    pages: (text lines, tables) per page; each table is a list of rows of cell strings.
+    """
+    objects: List[bytes] = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>", b""]
+    font_id, pages_id = 1, 2
+    kids = []
+    for lines, tables in pages:
+        ops = []
+        y = PAGE_HEIGHT - MARGIN
+        for line in lines:
+            ops.append(f"BT /F1 10 Tf {MARGIN} {y} Td ({_pdf_string(line)}) Tj ET")
+            y -= 14
+        top = PAGE_HEIGHT - MARGIN - TITLE_HEIGHT
+        for table in tables:
+            column_count = len(table[0])
+            column_width = (PAGE_WIDTH - 2 * MARGIN) / column_count
+            right = MARGIN + column_count * column_width
+            bottom = top - len(table) * ROW_HEIGHT
+            for row_index in range(len(table) + 1):
+                line_y = top - row_index * ROW_HEIGHT
+                ops.append(f"{MARGIN} {line_y} m {right:.2f} {line_y} l S")
+            for column_index in range(column_count + 1):
+                line_x = MARGIN + column_index * column_width
+                ops.append(f"{line_x:.2f} {top} m {line_x:.2f} {bottom} l S")
+            for row_index, row in enumerate(table):
+                text_y = top - (row_index + 1) * ROW_HEIGHT + 3
+                for column_index, cell in enumerate(row):
+                    if cell:
+                        text_x = MARGIN + column_index * column_width + 2
+                        ops.append(f"BT /F1 7 Tf {text_x:.2f} {text_y} Td ({_pdf_string(cell)}) Tj ET")
+            top = bottom - TABLE_GAP
+        content = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 %d 0 R >> >> >>"
+                       % (pages_id, PAGE_WIDTH, PAGE_HEIGHT, len(objects), font_id))
+        kids.append(len(objects))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref))
+    return out.getvalue()
+
+
+def format_amount(rng: random.Random, value: float, noisy: bool) -> str:
+    """Render an amount the way statements do; the analyzer reads every form back as `value`"""
+    if not noisy:
+        return f"{value:,.2f}"
+    style = rng.random()
+    if value == 0 and style < 0.3:
+        return "-"
+    if value < 0:
+        return f"({-value:,.2f})"
+    if style < 0.15:
+        return f"Rs. {value:,.2f}"
+    if style < 0.3:
+        return f"{value:,.2f} Dr"
+    if style < 0.4:
+        return f"{value:,.0f}"
+    return f"{value:,.2f}"
+
+
+def financial_table(rng: random.Random, rows: int, columns: int, noisy: bool, balance: bool = False,
+                    openings: Optional[Iterator[float]] = None,
+                    closings: Optional[List[float]] = None) -> Tuple[List[List[str]], Dict[str, float]]:
+    """Header plus `rows` ledger lines, and the column totals the analyzer should compute
+
+    openings, when given, supplies the opening balances line by line; closings collects the lines'
+    closing balances.
+    """
+    headers = COLUMN_HEADERS[:columns]
+    totals = {FINANCIAL_KEYS[header]: 0.0 for header in headers if header in FINANCIAL_KEYS}
+    values = []
+    for index in range(rows):
+        opening = float(rng.randint(-2000, 50000) if noisy else rng.randint(0, 50000))
+        if openings is not None:
+            opening = next(openings)
+        debit = float(rng.randint(0, 9999))
+        credit = float(rng.randint(0, 9999))
+        values.append([opening, debit, credit])
+    if balance and values:
+        # Move the difference onto the last line so debits and credits agree
+        difference = sum(v[1] for v in values) - sum(v[2] for v in values)
+        if difference > 0:
+            values[-1][2] += difference
+        else:
+            values[-1][1] -= difference
+
+    table = [headers]
+    for index, (opening, debit, credit) in enumerate(values):
+        amounts = {'opening_balance': opening, 'debit': debit, 'credit': credit,
+                   'closing_balance': opening + debit - credit}
+        if closings is not None:
+            closings.append(amounts['closing_balance'])
+        row = [f"Ledger {index + 1:04d}"]
+        for header in headers[1:]:
+            key = FINANCIAL_KEYS.get(header)
+            if key is None:
+                row.append(f"{header[:3].upper()}-{rng.randint(100, 999)}")
+                continue
+            value = amounts[key]
+            cell = format_amount(rng, value, noisy)
+            row.append(cell)
+            totals[key] += 0.0 if cell == "-" else value
+        table.append(row)
+    return table, totals
+
+
+def bundle_members(spec: BundleSpec) -> List[Tuple[str, str]]:
+    """(archive name, kind) for every PDF in the bundle, in archive order"""
+    rng = random.Random(spec.seed)
+    required = [f"Schedule {i}" for i in range(1, spec.schedules + 1)] + \
+               [f"Annexure {i}" for i in range(1, spec.annexures + 1)]
+    left_out = set(rng.sample(required, spec.missing))
+    members = [(f"bundle/{name} Accounts.pdf", 'required') for name in required if name not in left_out]
+    members += [(f"bundle/Trial Balance {2024 + i}.pdf", 'trial_balance') for i in range(spec.trial_balance_files)]
+    members += [(f"bundle/supporting/Supporting Document {i + 1:04d}.pdf", 'extra') for i in range(spec.extra_files)]
+    return members
+
+
+def _file_layout(rng: random.Random, spec: BundleSpec, balance_last_page: bool, balance_all_pages: bool = False,
+                 openings: Optional[Iterator[float]] = None,
+                 closings: Optional[List[float]] = None) -> Tuple[List, Dict[str, float]]:
+    """Tables for each page of one file (None for blank pages) and the file's column totals"""
+    blank_count = min(int(round(spec.blank_page_ratio * spec.pages_per_file)), spec.pages_per_file - 1)
+    blank_pages = set(rng.sample(range(1, spec.pages_per_file), blank_count)) if blank_count else set()
+    page_tables = []
+    totals: Dict[str, float] = {}
+    for page_num in range(1, spec.pages_per_file + 1):
+        if page_num in blank_pages:
+            page_tables.append(None)
+            continue
+        balance = balance_all_pages or (balance_last_page and page_num == spec.pages_per_file)
+        tables = []
+        for _ in range(spec.tables_per_page):
+            table, table_totals = financial_table(rng, spec.rows_per_table, spec.columns, spec.noisy_numbers, balance,
+                                                  openings, closings)
+            tables.append(table)
+            for key, value in table_totals.items():
+                totals[key] = totals.get(key, 0.0) + value
+        page_tables.append(tables)
+    return page_tables, totals
+
+
+def build_bundle(path: str, spec: Optional[BundleSpec] = None) -> Dict:
+    """Write the bundle ZIP to `path` and return its manifest (spec, files and expected findings)"""
+    spec = spec or BundleSpec()
+    rng = random.Random(spec.seed)
+    members = bundle_members(spec)
+    files = []
+    trial_balance_closings = None
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        for index, (name, kind) in enumerate(members):
+            if kind == 'trial_balance':
+                # Trial balances of consecutive years: each balances and opens with the last one's closing lines
+                consistent = spec.trial_balance_consistent
+                openings = iter(trial_balance_closings) if consistent and trial_balance_closings else None
+                trial_balance_closings = []
+                page_tables, totals = _file_layout(rng, spec, False, consistent, openings, trial_balance_closings)
+            else:
+                page_tables, totals = _file_layout(rng, spec, spec.balanced and index == 0)
+
+            title = name.split("/")[-1][:-4]
+            pages = [([], []) if tables is None else
+                     ([f"{title} - Page {page_num}", "Statement of accounts for the year ended 31 March 2024"], tables)
+                     for page_num, tables in enumerate(page_tables, 1)]
+            data = pdf_document(pages)
+            # A fixed timestamp keeps the archive byte-for-byte reproducible
+            info = zipfile.ZipInfo(name, date_time=(2024, 3, 31, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zip_ref.writestr(info, data)
+            files.append({
+                'name': name,
+                'kind': kind,
+                'pages': len(pages),
+                'blank_pages': [page_num for page_num, tables in enumerate(page_tables, 1) if tables is None],
+                'financial_tables': sum(len(tables) for tables in page_tables if tables),
+                'totals': totals,
+                'bytes': len(data)
+            })
+
+    present = [name.split("/")[-1].lower() for name, _ in members]
+    required = [f"schedule {i}" for i in range(1, 23)] + [f"annexure {i}" for i in range(1, 13)]
+    return {
+        'spec': spec.to_dict(),
+        'path': path,
+        'files': files,
+        'total_pages': sum(f['pages'] for f in files),
+        # Same matching rule as FinancialDocumentAnalyzer.check_missing_files
+        'expected_missing': [name.title() for name in required if not any(name in filename for filename in present)]
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic bundle of financial PDFs")
+    parser.add_argument("output", help="ZIP file to write")
+    parser.add_argument("--preset", choices=sorted(PRESETS), help="Start from a named bundle shape")
+    parser.add_argument("--schedules", type=int)
+    parser.add_argument("--annexures", type=int)
+    parser.add_argument("--missing", type=int, help="Schedules/annexures to leave out")
+    parser.add_argument("--trial-balance-files", type=int)
+    parser.add_argument("--extra-files", type=int, help="Supporting PDFs beyond schedules and annexures")
+    parser.add_argument("--pages", dest="pages_per_file", type=int, help="Pages per PDF")
+    parser.add_argument("--tables-per-page", type=int)
+    parser.add_argument("--rows", dest="rows_per_table", type=int, help="Rows per table")
+    parser.add_argument("--columns", type=int, help="Columns per table (2-8)")
+    parser.add_argument("--blank-ratio", dest="blank_page_ratio", type=float, help="Share of pages left blank")
+    parser.add_argument("--noisy", dest="noisy_numbers", action="store_true", default=None,
+                        help="Mix number formats (brackets, Rs., Dr, dashes)")
+    parser.add_argument("--unbalanced", dest="balanced", action="store_false", default=None,
+                        help="Let debits and credits differ on the receipt/payment page")
+    parser.add_argument("--inconsistent-tb", dest="trial_balance_consistent", action="store_false", default=None,
+                        help="Give the trial balance files different totals")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--manifest", help="Also write the manifest JSON here")
+    args = vars(parser.parse_args(argv))
+
+    output, preset, manifest_path = args.pop("output"), args.pop("preset"), args.pop("manifest")
+    overrides = {key: value for key, value in args.items() if value is not None}
+    spec = BundleSpec.preset(preset, **overrides) if preset else BundleSpec(**overrides)
+    manifest = build_bundle(output, spec)
+    print(f"Wrote {output}: {len(manifest['files'])} PDFs, {manifest['total_pages']} pages, "
+          f"{len(manifest['expected_missing'])} missing schedules/annexures")
+    if manifest_path:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
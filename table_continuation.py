@@ -0,0 +1,104 @@
+# Financial Document Analyzer - Table Continuation
+# Purpose: Stitch ledgers that run over several pages back into one logical table. A table that
+#          repeats the previous page's header continues it, and its "b/f" row only repeats the
+#          earlier pages' totals, so it is left out of the page totals; the tracker follows a PDF
+#          page by page and keeps just the open table's running totals, never revisiting a page
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Carry rows: the first data row of a continued page and the last data row of a page that continues
+BROUGHT_FORWARD = re.compile(r'\bb\s*/\s*f(?:wd)?\b|\bbrought\s+(?:forward|fwd|over)\b', re.IGNORECASE)
+CARRIED_FORWARD = re.compile(r'\bc\s*/\s*f(?:wd)?\b|\bcarried\s+(?:forward|fwd|over)\b', re.IGNORECASE)
+# A b/f row and the previous page's c/f row further apart than this is a broken carry
+CARRY_TOLERANCE = 0.01
+
+
+def header_signature(headers: Sequence[str]) -> str:
+    """Normalized header row; pages of one ledger repeat the same signature"""
+    return '|'.join(' '.join(header.split()) for header in headers)
+
+
+def is_carry_row(row: Sequence, pattern: re.Pattern) -> bool:
+    return pattern.search(' '.join(str(cell) for cell in row if cell)) is not None
+
+
+class TableContinuationTracker:
+    """Follows the financial tables of one PDF page by page, in page order
+
+    A table continues the open logical table when it is the first financial table on the next
+    page and repeats its header signature; a skipped or timed-out page, a page without financial
+    tables or a different header closes it. Only the open table (signature, running totals, last
+    c/f row) is kept, so memory does not grow with the number of pages. Logical tables spanning
+    more than one page are listed in stitched_tables once closed.
+    """
+
+    def __init__(self):
+        self.signature: Optional[str] = None
+        self.first_page = 0
+        self.last_page = 0
+        self.pages = 0
+        self.running_totals: Dict[str, float] = {}
+        self.carried_forward: Optional[Dict[str, float]] = None
+        self.carry_mismatches = 0
+        self.stitched_tables: List[Dict] = []
+        self.total_carry_mismatches = 0
+
+    def add_page(self, page: Dict) -> List[Tuple[Dict[str, float], Dict[str, float]]]:
+        """(page totals, running totals of its logical table) for each financial table on the page
+
+        Page totals leave out carry rows, except a b/f row that opens a new table: that is its
+        opening figure. The running totals are final once the page is the table's last.
+        """
+        if page.get('timed_out') or not page['tables'] or page['page'] != self.last_page + 1:
+            self.close()
+        self.last_page = page['page']
+
+        contributions = []
+        for position, table in enumerate(page['tables']):
+            financial_data = table.get('financial_data', {})
+            totals = dict(financial_data.get('totals', {}))
+            brought_forward = financial_data.get('brought_forward')
+            signature = financial_data.get('header_signature')
+            if position == 0 and signature is not None and signature == self.signature:
+                self.pages += 1
+                if brought_forward and self.carried_forward:
+                    self._check_carry(brought_forward)
+            else:
+                self.close()
+                for column, amount in (brought_forward or {}).items():
+                    totals[column] = totals.get(column, 0) + amount
+                self.signature = signature
+                self.first_page = page['page']
+                self.pages = 1
+                self.running_totals = {}
+            for column, amount in totals.items():
+                self.running_totals[column] = self.running_totals.get(column, 0) + amount
+            self.carried_forward = financial_data.get('carried_forward')
+            contributions.append((totals, self.running_totals))
+        return contributions
+
+    def _check_carry(self, brought_forward: Dict[str, float]):
+        """A b/f row should repeat the previous page's c/f row"""
+        for column, amount in brought_forward.items():
+            carried = self.carried_forward.get(column)
+            if carried is not None and abs(amount - carried) > CARRY_TOLERANCE:
+                self.carry_mismatches += 1
+                self.total_carry_mismatches += 1
+                return
+
+    def close(self):
+        """End the open logical table, recording it if it ran over several pages"""
+        if self.signature is not None and self.pages > 1:
+            self.stitched_tables.append({
+                'first_page': self.first_page,
+                'last_page': self.first_page + self.pages - 1,
+                'pages': self.pages,
+                'totals': self.running_totals,
+                'carry_mismatches': self.carry_mismatches
+            })
+        self.signature = None
+        self.pages = 0
+        self.running_totals = {}
+        self.carried_forward = None
+        self.carry_mismatches = 0
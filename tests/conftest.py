@@ -0,0 +1,5 @@
+# The modules live at the repository root, which plain `pytest` does not put on sys.path
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
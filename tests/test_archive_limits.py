@@ -0,0 +1,105 @@
+import io
+import os
+import stat
+import struct
+import zipfile
+
+import pytest
+
+from archive_limits import ArchiveLimits, ArchiveRejected, check_archive, safe_extract
+
+
+def make_zip(*members, compression=zipfile.ZIP_DEFLATED) -> io.BytesIO:
+    """An in-memory ZIP of (name or ZipInfo, data) members"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as zip_ref:
+        for name, data in members:
+            zip_ref.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def declare_size(buffer: io.BytesIO, name: str, size: int) -> io.BytesIO:
+    """Rewrite the central directory's uncompressed size of one member, as a forged archive would"""
+    data = bytearray(buffer.getvalue())
+    position = data.find(b'PK\x01\x02')
+    while position != -1:
+        name_length = struct.unpack_from('<H', data, position + 28)[0]
+        if data[position + 46:position + 46 + name_length] == name.encode():
+            struct.pack_into('<I', data, position + 24, size)
+        position = data.find(b'PK\x01\x02', position + 46)
+    return io.BytesIO(bytes(data))
+
+
+def rejection(buffer: io.BytesIO, limits: ArchiveLimits = None) -> str:
+    with pytest.raises(ArchiveRejected) as excinfo:
+        check_archive(buffer, limits or ArchiveLimits())
+    return excinfo.value.reason
+
+
+def test_plain_archive_passes():
+    members = check_archive(make_zip(('bundle/Schedule 1.pdf', b'%PDF-1.4'), ('bundle/Notes.pdf', b'%PDF-1.4')),
+                            ArchiveLimits())
+    assert [info.filename for info in members] == ['bundle/Schedule 1.pdf', 'bundle/Notes.pdf']
+
+
+@pytest.mark.parametrize('name', ['../evil.pdf', 'bundle/../../evil.pdf', '/etc/evil.pdf', 'C:/evil.pdf',
+                                  '..\\evil.pdf'])
+def test_path_leaving_the_folder_is_rejected(name):
+    assert rejection(make_zip((name, b'%PDF-1.4'))) == 'path'
+
+
+def test_symlink_is_rejected():
+    info = zipfile.ZipInfo('bundle/link.pdf')
+    info.create_system = 3
+    info.external_attr = (stat.S_IFLNK | 0o777) << 16
+    assert rejection(make_zip((info, '/etc/passwd'))) == 'symlink'
+
+
+def test_deflate_bomb_is_rejected():
+    buffer = make_zip(('bundle/bomb.pdf', bytes(10 * 1024 * 1024)))
+    info = zipfile.ZipFile(buffer).getinfo('bundle/bomb.pdf')
+    assert info.file_size >= 1000 * info.compress_size
+    buffer.seek(0)
+    assert rejection(buffer) == 'ratio'
+
+
+def test_small_compressible_member_is_not_held_to_the_ratio():
+    check_archive(make_zip(('bundle/blank.pdf', bytes(512 * 1024))), ArchiveLimits())
+
+
+def test_member_count_limit():
+    buffer = make_zip(*((f'bundle/{i}.pdf', b'%PDF-1.4') for i in range(6)))
+    check_archive(buffer, ArchiveLimits(max_members=6))
+    assert rejection(buffer, ArchiveLimits(max_members=5)) == 'members'
+
+
+def test_total_size_limit():
+    buffer = make_zip(*((f'bundle/{i}.pdf', os.urandom(400 * 1024)) for i in range(3)),
+                      compression=zipfile.ZIP_STORED)
+    check_archive(buffer, ArchiveLimits(max_bytes=2 * 1024 ** 2))
+    assert rejection(buffer, ArchiveLimits(max_bytes=1024 ** 2)) == 'size'
+
+
+def test_limits_can_be_turned_off():
+    buffer = make_zip(*((f'bundle/{i}.pdf', b'%PDF-1.4') for i in range(6)))
+    check_archive(buffer, ArchiveLimits(max_members=None, max_bytes=None, max_ratio=None))
+
+
+def test_safe_extract_writes_nothing_for_a_rejected_directory(tmp_path):
+    buffer = make_zip(('bundle/Schedule 1.pdf', b'%PDF-1.4'), ('../evil.pdf', b'%PDF-1.4'))
+    with pytest.raises(ArchiveRejected):
+        safe_extract(buffer, str(tmp_path / 'out'), ArchiveLimits())
+    assert not (tmp_path / 'out').exists()
+    assert not (tmp_path / 'evil.pdf').exists()
+
+
+def test_safe_extract_removes_a_member_that_outgrows_its_declared_size(tmp_path):
+    buffer = declare_size(make_zip(('bundle/Schedule 1.pdf', b'%PDF-1.4'),
+                                   ('bundle/liar.pdf', bytes(256 * 1024))), 'bundle/liar.pdf', 1024)
+    assert zipfile.ZipFile(buffer).getinfo('bundle/liar.pdf').file_size == 1024
+    with pytest.raises(ArchiveRejected) as excinfo:
+        safe_extract(buffer, str(tmp_path), ArchiveLimits())
+    assert excinfo.value.reason in ('size', 'corrupt')
+    assert (tmp_path / 'bundle' / 'Schedule 1.pdf').read_bytes() == b'%PDF-1.4'
+    assert not (tmp_path / 'bundle' / 'liar.pdf').exists()
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+
+import pytest
+
+from checkpoint_store import CHECKPOINT_FILE, CheckpointStore
+from financial_document_analyzer import FinancialDocumentAnalyzer
+from synthetic_bundles import BundleSpec, build_bundle
+from text_index import TextIndex
+
+
+@pytest.fixture(scope='module')
+def bundle(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('bundle') / 'bundle.zip')
+    build_bundle(path, BundleSpec(schedules=2, annexures=1, trial_balance_files=0, pages_per_file=2,
+                                  rows_per_table=5, blank_page_ratio=0))
+    return path
+
+
+def analyze(bundle, checkpoint_dir, text_index=None):
+    analyzer = FinancialDocumentAnalyzer(max_workers=1, checkpoint_dir=str(checkpoint_dir),
+                                         text_index=text_index and str(text_index))
+    return analyzer.analyze_zip_file(bundle)
+
+
+def saved_terms(checkpoint_dir):
+    conn = sqlite3.connect(str(checkpoint_dir / CHECKPOINT_FILE))
+    try:
+        return [any('terms' in page for page in json.loads(result)['pages'])
+                for result, in conn.execute("SELECT result FROM file_results")]
+    finally:
+        conn.close()
+
+
+def indexed_pages(text_index):
+    index = TextIndex(str(text_index))
+    try:
+        return index.bundles()[0]['pages']
+    finally:
+        index.close()
+
+
+def test_same_settings_resume(bundle, tmp_path):
+    first = analyze(bundle, tmp_path)
+    assert first['perf']['restored_files'] == 0
+    again = analyze(bundle, tmp_path)
+    assert again['perf']['restored_files'] == len(first['file_analysis'])
+
+
+def test_indexed_run_does_not_resume_from_an_unindexed_checkpoint(bundle, tmp_path):
+    first = analyze(bundle, tmp_path)
+    assert not any(saved_terms(tmp_path))
+    indexed = analyze(bundle, tmp_path, tmp_path / 'text.sqlite3')
+    assert indexed['perf']['restored_files'] == 0
+    assert indexed_pages(tmp_path / 'text.sqlite3') == sum(f['pages'] for f in first['file_analysis'])
+    index = TextIndex(str(tmp_path / 'text.sqlite3'))
+    hits, _ = index.search('schedule')
+    index.close()
+    assert {hit['filename'] for hit in hits} >= {f['filename'] for f in first['file_analysis']
+                                                   if 'Schedule' in f['filename']}
+
+
+def test_unindexed_run_does_not_resume_from_an_indexed_checkpoint(bundle, tmp_path):
+    first = analyze(bundle, tmp_path, tmp_path / 'text.sqlite3')
+    again = analyze(bundle, tmp_path)
+    assert again['perf']['restored_files'] == 0
+    # The indexed run's rows are kept apart and used again by the next indexed run
+    assert saved_terms(tmp_path).count(True) == len(first['file_analysis'])
+    indexed = analyze(bundle, tmp_path, tmp_path / 'text.sqlite3')
+    assert indexed['perf']['restored_files'] == len(first['file_analysis'])
+    assert indexed_pages(tmp_path / 'text.sqlite3') == sum(f['pages'] for f in first['file_analysis'])
+
+
+def test_other_rules_or_page_limit_use_other_rows(tmp_path):
+    store = CheckpointStore(str(tmp_path / CHECKPOINT_FILE), {'index_text': False, 'max_pages': 100, 'rules': []})
+    store.save('bundle', 0, 'a.pdf', {'status': 'analyzed', 'pages': []})
+    assert store.load('bundle', ['a.pdf'])
+    for settings in ({'index_text': False, 'max_pages': 50, 'rules': []},
+                     {'index_text': False, 'max_pages': 100, 'rules': [{'name': 'r', 'left': 'debit'}]}):
+        assert not CheckpointStore(store.path, settings).load('bundle', ['a.pdf'])
+    assert store.bundles()[0]['bundle'] == 'bundle'
+    assert CheckpointStore(store.path).forget('bundle') == 1
+    store.close()
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from financial_document_analyzer import FinancialDocumentAnalyzer
+from page_columns import FIELD_NAMES, FilePages, PageColumns, PageRow, results_to_dict
+
+PAGES = [
+    (1, False, False, 100.0, 250.5, 50.25, 300.25, 2, 0),
+    (2, True, False, 0.0, 0.0, 0.0, 0.0, 0, 0),
+    (3, False, True, 300.25, 10.0, 0.0, 310.25, 1, 3),
+]
+
+
+def build(pages=PAGES):
+    """A PageColumns holding one file of the given pages, an empty file and a one-page file"""
+    columns = PageColumns()
+    ledger = columns.add_file('Ledger.pdf')
+    for page in pages:
+        columns.append(ledger, page)
+    columns.add_file('Empty.pdf')
+    other = columns.add_file('Other.pdf')
+    columns.append(other, (1, False, False, 1.0, 2.0, 3.0, 4.0, 1, 0))
+    return columns
+
+
+def test_rows_read_back_every_field():
+    columns = build()
+    ledger = FilePages(columns, 0, len(PAGES))
+
+    assert len(ledger) == len(PAGES)
+    for row, page in zip(ledger, PAGES):
+        assert isinstance(row, PageRow)
+        assert list(row) == list(FIELD_NAMES)
+        assert row.to_dict() == dict(zip(FIELD_NAMES, page))
+    assert ledger[-1].page_number == 3
+    assert [row['page_number'] for row in ledger[1:]] == [2, 3]
+    assert ledger.to_list() == [dict(zip(FIELD_NAMES, page)) for page in PAGES]
+    assert list(ledger.rows()) == PAGES
+    assert list(ledger.rows('page_number', 'is_blank')) == [(1, False), (2, True), (3, False)]
+    assert ledger.totals() == {'opening_balance_total': 400.25, 'debit_total': 260.5,
+                               'credit_total': 50.25, 'closing_balance_total': 610.5}
+    with pytest.raises(IndexError):
+        ledger[len(PAGES)]
+    with pytest.raises(KeyError):
+        ledger[0]['tables']
+
+
+def test_flags_come_back_as_booleans():
+    ledger = FilePages(build(), 0, len(PAGES))
+
+    for row in ledger.to_list():
+        assert type(row['is_blank']) is bool and type(row['timed_out']) is bool
+        assert type(row['page_number']) is int and type(row['debit_total']) is float
+    assert ledger.column('is_blank').tolist() == [False, True, False]
+    assert ledger.column('timed_out').tolist() == [False, False, True]
+
+
+def test_results_to_dict_exports_every_file():
+    columns = build()
+    results = {
+        'total_pdf_files': 4,
+        'page_columns': columns,
+        'file_analysis': [
+            {'filename': 'Ledger.pdf', 'pages': 3, 'last_page_totals': {'debit': 10.0},
+             'page_details': FilePages(columns, 0, 3)},
+            {'filename': 'Empty.pdf', 'pages': 0, 'last_page_totals': None, 'page_details': FilePages(columns, 3, 3)},
+            {'filename': 'Other.pdf', 'pages': 1, 'last_page_totals': {},
+             'page_details': FilePages(columns, 3, 4)},
+            # Already plain, e.g. results loaded back from JSON
+            {'filename': 'Plain.pdf', 'pages': 1, 'last_page_totals': None,
+             'page_details': [{'page_number': 1, 'is_blank': True}]},
+        ],
+    }
+
+    exported = results_to_dict(results)
+
+    assert 'page_columns' not in exported and 'page_columns' in results
+    assert exported['total_pdf_files'] == 4
+    ledger, empty, other, plain = exported['file_analysis']
+    assert ledger['page_details'] == [dict(zip(FIELD_NAMES, page)) for page in PAGES]
+    assert ledger['last_page_totals'] == {'debit': 10.0}
+    assert empty['page_details'] == [] and empty['last_page_totals'] is None
+    assert other['page_details'] == [dict(zip(FIELD_NAMES, (1, False, False, 1.0, 2.0, 3.0, 4.0, 1, 0)))]
+    assert other['last_page_totals'] == {}
+    assert plain['page_details'] == [{'page_number': 1, 'is_blank': True}]
+    # The original results keep their views
+    assert isinstance(results['file_analysis'][0]['page_details'], FilePages)
+    assert json.loads(json.dumps(exported)) == exported
+
+
+def test_summarized_file_round_trips_blank_and_empty_files():
+    analyzer = FinancialDocumentAnalyzer(max_workers=1)
+    columns = PageColumns()
+    blank = {'page': 1, 'is_blank': True, 'tables': []}
+    text = {'page': 2, 'is_blank': False, 'timed_out': True, 'tables': []}
+
+    summary = analyzer.summarize_file('bundle/Ledger.pdf', [blank, text], columns)
+    empty = analyzer.summarize_file('bundle/Empty.pdf', [], columns)
+    exported = results_to_dict({'file_analysis': [summary, empty], 'page_columns': columns})
+
+    ledger, nothing = exported['file_analysis']
+    assert ledger['blank_pages'] == 1
+    assert ledger['last_page_totals'] == {}
+    assert ledger['page_details'] == [
+        {'page_number': 1, 'is_blank': True, 'timed_out': False, 'opening_balance_total': 0.0, 'debit_total': 0.0,
+         'credit_total': 0.0, 'closing_balance_total': 0.0, 'financial_tables': 0, 'unreconciled_rows': 0},
+        {'page_number': 2, 'is_blank': False, 'timed_out': True, 'opening_balance_total': 0.0, 'debit_total': 0.0,
+         'credit_total': 0.0, 'closing_balance_total': 0.0, 'financial_tables': 0, 'unreconciled_rows': 0},
+    ]
+    assert nothing['pages'] == 0 and nothing['page_details'] == []
+    assert nothing['last_page_totals'] is None
+    assert columns.filenames == ['Ledger.pdf', 'Empty.pdf']
+    assert json.loads(json.dumps(exported)) == exported
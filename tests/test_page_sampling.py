@@ -0,0 +1,102 @@
+import pytest
+
+from archive_limits import ArchiveLimits
+from financial_document_analyzer import FinancialDocumentAnalyzer, _parse_pdf_worker
+from page_sampling import mean_bounds, proportion_bounds, stratified_sample, triage_bundle
+from synthetic_bundles import BundleSpec, build_bundle
+
+Z = 1.96
+
+
+@pytest.mark.parametrize('page_count', [0, 1, 2, 12])
+def test_short_file_is_read_in_full(page_count):
+    assert stratified_sample(page_count, 12) == list(range(1, page_count + 1))
+
+
+@pytest.mark.parametrize('page_count, sample_pages', [(13, 12), (100, 12), (1000, 5), (50, 3)])
+def test_sample_has_the_boundary_pages_and_one_page_per_stratum(page_count, sample_pages):
+    sample = stratified_sample(page_count, sample_pages, seed=7)
+    assert len(sample) == sample_pages
+    assert sample[0] == 1 and sample[-1] == page_count
+    assert sample == sorted(set(sample))
+    interior = page_count - 2
+    strata = sample_pages - 2
+    for i, page in enumerate(sample[1:-1]):
+        assert 2 + i * interior // strata <= page <= 1 + (i + 1) * interior // strata
+
+
+def test_two_page_sample_is_the_boundary_pages():
+    assert stratified_sample(100, 2) == [1, 100]
+
+
+def test_sample_depends_only_on_the_seed():
+    assert stratified_sample(500, 12, seed=3) == stratified_sample(500, 12, seed=3)
+    assert stratified_sample(500, 12, seed=3) != stratified_sample(500, 12, seed=4)
+
+
+def test_full_count_has_no_uncertainty():
+    assert proportion_bounds(3, 10, 10, Z) == (0.3, 0.3)
+    assert proportion_bounds(0, 0, 0, Z) == (0.0, 0.0)
+
+
+def test_nothing_sampled_could_be_anything():
+    assert proportion_bounds(0, 0, 100, Z) == (0.0, 1.0)
+
+
+def test_bounds_contain_the_sample_share():
+    low, high = proportion_bounds(2, 10, 1000, Z)
+    assert 0.0 < low < 0.2 < high < 1.0
+    low, high = proportion_bounds(0, 10, 1000, Z)
+    assert low == 0.0 and 0.0 < high < 1.0
+    low, high = proportion_bounds(10, 10, 1000, Z)
+    assert 0.0 < low < 1.0 and high == 1.0
+
+
+def test_bounds_narrow_with_the_sample_and_the_sampled_share_of_the_population():
+    def width(successes, sampled, population):
+        low, high = proportion_bounds(successes, sampled, population, Z)
+        return high - low
+    assert width(20, 100, 10000) < width(2, 10, 10000)
+    assert width(2, 10, 12) < width(2, 10, 10000)
+    assert width(2, 10, 1000) < proportion_bounds(2, 10, 1000, 3.0)[1] - proportion_bounds(2, 10, 1000, 3.0)[0]
+
+
+def test_mean_bounds_edges():
+    assert mean_bounds([], 0, Z) == (0.0, 0.0, 0.0)
+    assert mean_bounds([], 10, Z) == (0.0, 0.0, None)
+    assert mean_bounds([2, 2, 2], 3, Z) == (2.0, 2.0, 2.0)
+    mean, low, high = mean_bounds([1, 3], 100, Z)
+    assert low < mean == 2.0 < high
+
+
+@pytest.fixture(scope='module')
+def bundle(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('triage') / 'bundle.zip')
+    build_bundle(path, BundleSpec(schedules=2, annexures=0, trial_balance_files=0, pages_per_file=4,
+                                  rows_per_table=5, blank_page_ratio=0))
+    return path
+
+
+def failing_worker(pdf_path, *args, pages=None, **kwargs):
+    """_parse_pdf_worker, except that page 2 of every file raises"""
+    if pages == [2]:
+        raise ValueError("unreadable content stream")
+    return _parse_pdf_worker(pdf_path, *args, pages=pages, **kwargs)
+
+
+def test_triage_keeps_the_other_pages_when_a_page_fails(bundle):
+    analyzer = FinancialDocumentAnalyzer(max_workers=1)
+    triage = triage_bundle(analyzer, bundle, failing_worker, sample_pages=4, time_budget=60)
+    for f in triage['files']:
+        assert f['sampled'] == [1, 3, 4]
+        assert f['errors'] == ["page 2: ValueError: unreadable content stream"]
+    assert triage['needs_full_analysis']
+    assert any(reason.startswith("unreadable files") for reason in triage['reasons'])
+
+
+def test_triage_does_not_sample_files_over_the_page_limit(bundle):
+    analyzer = FinancialDocumentAnalyzer(max_workers=1, archive_limits=ArchiveLimits(max_pages=3))
+    triage = triage_bundle(analyzer, bundle, _parse_pdf_worker, sample_pages=4, time_budget=60)
+    assert triage['sampled_pages'] == 0
+    assert all(f['over_page_limit'] and f['pages'] == 4 and not f['errors'] for f in triage['files'])
+    assert any(reason.startswith("over the 3-page limit") for reason in triage['reasons'])
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from financial_document_analyzer import FinancialDocumentAnalyzer
+
+HEADER = ['Particulars', 'Opening Balance', 'Debit', 'Credit', 'Closing Balance']
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return FinancialDocumentAnalyzer(max_workers=1)
+
+
+def reconciliation(analyzer, *rows, header=HEADER):
+    return analyzer.analyze_financial_table([header, *rows]).get('reconciliation')
+
+
+def test_agreeing_rows_pass(analyzer):
+    result = reconciliation(analyzer, ['Cash', '1,000.00', '500.00', '200.00', '1,300.00'],
+                            ['Bank', '(100.00)', '50', '0', '-50'])
+    assert result == {'checked_rows': 2, 'failed_count': 0, 'failed_rows': []}
+
+
+def test_difference_within_the_tolerance_passes(analyzer):
+    result = reconciliation(analyzer, ['Cash', '100.00', '0.005', '0', '100.00'])
+    assert result['failed_count'] == 0
+
+
+def test_off_by_cents_row_is_reported_with_its_row_number(analyzer):
+    result = reconciliation(analyzer, ['Cash', '100.00', '50.00', '25.00', '125.00'],
+                            ['Bank', '200.00', '10.00', '0.00', '210.05'])
+    assert (result['checked_rows'], result['failed_count']) == (2, 1)
+    failed, = result['failed_rows']
+    assert failed['row'] == 2
+    assert (failed['opening_balance'], failed['debit'], failed['credit'], failed['closing_balance']) == \
+        (200.0, 10.0, 0.0, 210.05)
+    assert failed['difference'] == pytest.approx(-0.05)
+
+
+def test_blank_or_unreadable_movements_count_as_zero(analyzer):
+    result = reconciliation(analyzer, ['Cash', '100.00', '', None, '100.00'],
+                            ['Bank', '100.00', 'n/a', '-', '90.00'])
+    assert result['checked_rows'] == 2
+    assert [row['row'] for row in result['failed_rows']] == [2]
+    assert result['failed_rows'][0]['difference'] == pytest.approx(10.0)
+
+
+def test_rows_without_both_balances_are_not_checked(analyzer):
+    result = reconciliation(analyzer, ['Narration continued', '', '', '', ''],
+                            ['Heading', 'Opening', '', '', ''],
+                            ['Cash', '100.00', '5.00', '', 'carried'],
+                            ['Bank', '100.00', '5.00', '0.00', '105.00'],
+                            ['Short row', '1.00'])
+    assert result == {'checked_rows': 1, 'failed_count': 0, 'failed_rows': []}
+
+
+def test_row_numbers_skip_a_brought_forward_row(analyzer):
+    result = reconciliation(analyzer, ['Balance b/f', '100.00', '', '', '50.00'],
+                            ['Cash', '100.00', '10.00', '0.00', '100.00'])
+    assert [row['row'] for row in result['failed_rows']] == [2]
+
+
+def test_narrow_table_without_a_closing_column_is_not_reconciled(analyzer):
+    financial_data = analyzer.analyze_financial_table([['Particulars', 'Opening Balance', 'Debit', 'Credit'],
+                                                       ['Cash', '100.00', '10.00', '5.00']])
+    assert financial_data['totals'] == {'opening_balance': 100.0, 'debit': 10.0, 'credit': 5.0}
+    assert 'reconciliation' not in financial_data
+
+
+def test_failed_rows_are_listed_up_to_the_limit(analyzer, monkeypatch):
+    monkeypatch.setattr('financial_document_analyzer.MAX_LISTED_UNRECONCILED_ROWS', 3)
+    amounts = np.array([[100.0, 0.0, 0.0, 99.0]] * 5)
+    result = analyzer.reconcile_rows(amounts, np.ones_like(amounts, dtype=bool), first_row=1)
+    assert result['failed_count'] == 5
+    assert [row['row'] for row in result['failed_rows']] == [1, 2, 3]
+
+
+def test_table_amounts_marks_cells_without_a_number(analyzer):
+    amounts = analyzer.table_amounts([HEADER, ['Cash', '1,234.50', '(10)', 'Nil', None]], [1, 2, 3, 4, 7])
+    assert amounts.shape == (1, 5)
+    assert amounts[0, :2].tolist() == [1234.5, -10.0]
+    assert np.isnan(amounts[0, 2:]).all()
@@ -0,0 +1,106 @@
+import pytest
+
+from page_columns import FilePages, PageColumns
+from period_comparison import compare_in_store
+from results_store import ResultsStore, bundle_identity, infer_period, period_order
+
+
+def results(fingerprint, files=(('Schedule 1.pdf', 100.0),), rp_equal=True, tb_consistent=True):
+    """A minimal analyze_zip_file result: one page per file with the given debit total"""
+    columns = PageColumns()
+    file_analysis = []
+    for filename, debit in files:
+        file_id = columns.add_file(filename)
+        columns.append(file_id, (1, 0, 0, 0.0, debit, debit, 0.0, 1, 0))
+        file_analysis.append({'filename': filename, 'status': 'analyzed', 'pages': 1, 'blank_pages': 0,
+                              'financial_tables': 1, 'page_details': FilePages(columns, file_id, file_id + 1)})
+    return {
+        'bundle_fingerprint': fingerprint, 'total_pdf_files': len(file_analysis), 'missing_files': [],
+        'partial': False, 'file_analysis': file_analysis,
+        'perf': {'total_pages': len(file_analysis), 'wall_seconds': 1.0},
+        'receipt_payment_verification': {'equal': rp_equal, 'receipt_total': 1.0, 'payment_total': 1.0,
+                                         'difference': 0.0},
+        'trial_balance_verification': {'consistent': tb_consistent, 'status': 'checked'},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite3'))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize('name, period', [
+    ('acme_FY2023-24.zip', 'FY2023-24'), ('Acme FY 2023-2024.zip', 'FY2023-24'), ('acme_2024_Q1.zip', '2024-Q1'),
+    ('acme Q3 2023.zip', '2023-Q3'), ('acme_2024-03.zip', '2024-03'), ('acme.zip', None),
+])
+def test_infer_period(name, period):
+    assert infer_period(name) == period
+
+
+def test_bundle_identity_defaults_from_the_source_name():
+    assert bundle_identity('/uploads/acme_2024-Q2.zip') == ('acme_2024-Q2', '2024-Q2')
+    assert bundle_identity('/uploads/acme_2024-Q2.zip', 'Acme', '2024-Q3') == ('Acme', '2024-Q3')
+
+
+def test_save_and_query(store):
+    store.save(results('a'), 'acme', '2024-Q1', 'acme_2024-Q1.zip')
+    store.save(results('b', rp_equal=False), 'acme', '2024-Q2', 'acme_2024-Q2.zip')
+    store.save(results('c', files=(('Trial Balance.pdf', 5.0),)), 'beta', '2024-Q1', 'beta.zip')
+    assert [b['period'] for b in store.find_bundles(client='acme')] == ['2024-Q2', '2024-Q1']
+    assert [b['client'] for b in store.failed_checks('receipt_payment')] == ['acme']
+    files = store.find_files(document='trial balance')
+    assert [(f['client'], f['filename'], f['debit_total']) for f in files] == [('beta', 'Trial Balance.pdf', 5.0)]
+    assert [f['filename'] for f in store.find_files(status='analyzed', client='acme', period='2024-Q1')] == \
+        ['Schedule 1.pdf']
+    with pytest.raises(ValueError):
+        store.failed_checks('unknown')
+
+
+def test_saving_a_bundle_again_replaces_it(store):
+    store.save(results('a'), 'acme', '2024-Q1')
+    store.save(results('a'), 'acme', '2024-Q2')
+    second = store.save(results('a', files=(('Schedule 1.pdf', 200.0),)), 'acme', '2024-Q1')
+    assert sorted(b['period'] for b in store.find_bundles()) == ['2024-Q1', '2024-Q2']
+    assert store.query("SELECT COUNT(*) AS files FROM files") == [{'files': 2}]
+    assert [p['debit_total'] for p in store.page_details(second)] == [200.0]
+
+
+def test_period_order():
+    assert period_order('2024-Q1') == ('quarter', (2024, 1))
+    assert period_order('FY2023-24') == ('fiscal year', (2023,))
+    assert period_order('2024-12') == ('month', (2024, 12))
+    assert period_order('March') == ('March', ())
+
+
+def test_previous_bundle_is_the_closest_earlier_period_of_the_same_granularity(store):
+    for fingerprint, period in (('dec', '2024-12'), ('q4', '2023-Q4'), ('q2', '2023-Q2'), ('fy', 'FY2023-24'),
+                                ('q2-2024', '2024-Q2')):
+        store.save(results(fingerprint), 'acme', period)
+    # As text, '2024-12' < '2024-Q1' and 'FY2023-24' sorts after every calendar period
+    assert store.previous_bundle('acme', '2024-Q1')['period'] == '2023-Q4'
+    assert store.previous_bundle('acme', '2025-01')['period'] == '2024-12'
+    assert store.previous_bundle('acme', 'FY2024-25')['period'] == 'FY2023-24'
+    assert store.previous_bundle('acme', '2023-Q2') is None
+    assert store.previous_bundle('acme', '2024-Q1', prior_period='2024-12')['period'] == '2024-12'
+    assert store.previous_bundle('acme')['period'] == '2024-Q2'
+    assert store.previous_bundle('other', '2024-Q1') is None
+
+
+def test_previous_bundle_prefers_the_latest_analysis_of_the_period(store):
+    first = store.save(results('one'), 'acme', '2023-Q4')
+    second = store.save(results('two'), 'acme', '2023-Q4')
+    assert store.previous_bundle('acme', '2024-Q1')['id'] == second != first
+    assert store.previous_bundle('acme', '2024-Q1', exclude_fingerprint='two')['id'] == first
+
+
+def test_compare_in_store_uses_the_prior_of_the_same_granularity(store):
+    store.save(results('q4', files=(('Schedule 1.pdf', 100.0),)), 'acme', '2023-Q4')
+    store.save(results('dec', files=(('Schedule 1.pdf', 900.0),)), 'acme', '2024-12')
+    comparison = compare_in_store(store.path, results('q1', files=(('Schedule 1.pdf', 150.0),)),
+                                  '/uploads/acme_2024-Q1.zip', client='acme')
+    assert comparison['prior']['period'] == '2023-Q4'
+    file_row, = comparison['files']
+    assert file_row['totals']['debit_total']['prior'] == 100.0
+    assert file_row['flagged']
@@ -0,0 +1,115 @@
+import pytest
+
+from financial_document_analyzer import FinancialDocumentAnalyzer
+from table_continuation import BROUGHT_FORWARD, CARRIED_FORWARD, TableContinuationTracker, header_signature, \
+    is_carry_row
+
+LEDGER = ['Particulars', 'Debit', 'Credit']
+RECEIPTS = ['Receipts', 'Debit']
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return FinancialDocumentAnalyzer(max_workers=1)
+
+
+def page(analyzer, number, *tables, timed_out=False):
+    """A parsed page of tables given as rows (the first row the header)"""
+    return {'page': number, 'is_blank': False, 'timed_out': timed_out,
+            'tables': [{'table_index': index, 'financial_data': analyzer.analyze_financial_table(table)}
+                       for index, table in enumerate(tables)]}
+
+
+def two_page_ledger(analyzer, brought_forward='100.00'):
+    return [page(analyzer, 1, [LEDGER, ['Sales', '60.00', '10.00'], ['Rent', '40.00', '0.00'],
+                               ['Carried forward', '100.00', '10.00']]),
+            page(analyzer, 2, [LEDGER, ['Brought forward', brought_forward, '10.00'], ['Wages', '25.00', '5.00']])]
+
+
+@pytest.mark.parametrize('text', ['b/f', 'B / F', 'Balance b/fwd', 'Brought forward', 'brought over'])
+def test_brought_forward_rows(text):
+    assert is_carry_row(['', text, '100.00'], BROUGHT_FORWARD)
+    assert not is_carry_row(['', text, '100.00'], CARRIED_FORWARD)
+
+
+def test_ordinary_rows_are_not_carry_rows():
+    assert not is_carry_row(['Buffer stock', '100.00'], BROUGHT_FORWARD)
+    assert not is_carry_row(['Carriage inwards', None, '5'], CARRIED_FORWARD)
+
+
+def test_header_signature_ignores_spacing():
+    assert header_signature(['particulars', 'debit  amount']) == header_signature(['particulars', 'debit\namount'])
+    assert header_signature(['particulars', 'debit']) != header_signature(['particulars', 'credit'])
+
+
+def test_carry_rows_are_kept_out_of_the_table_totals(analyzer):
+    first, second = two_page_ledger(analyzer)
+    first_data = first['tables'][0]['financial_data']
+    second_data = second['tables'][0]['financial_data']
+    assert first_data['totals'] == {'debit': 100.0, 'credit': 10.0}
+    assert first_data['carried_forward'] == {'debit': 100.0, 'credit': 10.0}
+    assert second_data['totals'] == {'debit': 25.0, 'credit': 5.0}
+    assert second_data['brought_forward'] == {'debit': 100.0, 'credit': 10.0}
+
+
+def test_ledger_is_stitched_across_two_pages(analyzer):
+    tracker = TableContinuationTracker()
+    pages = two_page_ledger(analyzer)
+    (first_totals, _), = tracker.add_page(pages[0])
+    (second_totals, running), = tracker.add_page(pages[1])
+    assert first_totals == {'debit': 100.0, 'credit': 10.0}
+    assert second_totals == {'debit': 25.0, 'credit': 5.0}
+    assert running == {'debit': 125.0, 'credit': 15.0}
+    tracker.close()
+    assert tracker.stitched_tables == [{'first_page': 1, 'last_page': 2, 'pages': 2,
+                                        'totals': {'debit': 125.0, 'credit': 15.0}, 'carry_mismatches': 0}]
+
+
+def test_file_totals_count_carried_amounts_once(analyzer):
+    summary = analyzer.summarize_file('Schedule 1.pdf', two_page_ledger(analyzer))
+    assert summary['page_details'].column('debit_total').tolist() == [100.0, 25.0]
+    assert summary['page_details'].totals()['debit_total'] == 125.0
+    assert summary['continued_tables'][0]['pages'] == 2
+    # The receipt-payment check reads the last page as printed, its b/f row included
+    assert summary['last_page_totals'] == {'debit': 125.0, 'credit': 15.0}
+
+
+def test_brought_forward_that_disagrees_with_carried_forward_is_a_mismatch(analyzer):
+    summary = analyzer.summarize_file('Schedule 1.pdf', two_page_ledger(analyzer, brought_forward='90.00'))
+    assert summary['carry_mismatches'] == 1
+    assert summary['continued_tables'][0]['carry_mismatches'] == 1
+
+
+def test_different_header_starts_a_new_table(analyzer):
+    tracker = TableContinuationTracker()
+    tracker.add_page(page(analyzer, 1, [LEDGER, ['Sales', '60.00', '10.00']]))
+    (totals, running), = tracker.add_page(page(analyzer, 2, [RECEIPTS, ['Brought forward', '60.00'],
+                                                             ['Interest', '5.00']]))
+    # A b/f row opening a new table is its opening figure
+    assert totals == {'debit': 65.0}
+    assert running == {'debit': 65.0}
+    tracker.close()
+    assert tracker.stitched_tables == []
+
+
+@pytest.mark.parametrize('gap', ['timed_out', 'skipped_page'])
+def test_a_gap_closes_the_table(analyzer, gap):
+    tracker = TableContinuationTracker()
+    tracker.add_page(page(analyzer, 1, [LEDGER, ['Sales', '60.00', '10.00']]))
+    second = page(analyzer, 2 if gap == 'timed_out' else 3, [LEDGER, ['Wages', '25.00', '5.00']],
+                  timed_out=gap == 'timed_out')
+    (_, running), = tracker.add_page(second)
+    assert running == {'debit': 25.0, 'credit': 5.0}
+    tracker.close()
+    assert tracker.stitched_tables == []
+
+
+def test_only_the_first_table_on_a_page_continues(analyzer):
+    tracker = TableContinuationTracker()
+    tracker.add_page(page(analyzer, 1, [LEDGER, ['Sales', '60.00', '10.00']]))
+    contributions = tracker.add_page(page(analyzer, 2, [LEDGER, ['Wages', '25.00', '5.00']],
+                                          [LEDGER, ['Other', '1.00', '1.00']]))
+    assert [running for _, running in contributions] == [{'debit': 85.0, 'credit': 15.0}, {'debit': 1.0, 'credit': 1.0}]
+    tracker.close()
+    assert [(t['first_page'], t['pages'], t['totals']) for t in tracker.stitched_tables] == \
+        [(1, 2, {'debit': 85.0, 'credit': 15.0})]
@@ -0,0 +1,81 @@
+import pytest
+
+from text_index import BundleTextIndex, TextIndex, page_terms, parse_query
+
+
+def bundle_index(files):
+    """A BundleTextIndex of {filename: [page text, ...]}, pages numbered from 1"""
+    index = BundleTextIndex()
+    for filename, texts in files.items():
+        index.add_file(filename, [{'page': number, 'terms': page_terms(text)}
+                                  for number, text in enumerate(texts, 1)])
+    return index
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = TextIndex(str(tmp_path / 'text.sqlite'))
+    index.add_bundle('first', 'first.zip', bundle_index({
+        'Notes.pdf': ['Provision for gratuity 1,200.00', 'Gratuity paid during the year'],
+        'Schedule 1.pdf': ['Provision made for leave encashment and gratuity',
+                           'provision for gratuity, provision for gratuity'],
+    }))
+    index.add_bundle('second', 'second.zip', bundle_index({
+        'Notes.pdf': ['Opening balance', 'Provision for gratuity written back'],
+    }))
+    yield index
+    index.close()
+
+
+def pages(hits):
+    return [(hit['fingerprint'], hit['filename'], hit['page_number'], hit['matches']) for hit in hits]
+
+
+def test_query_clauses():
+    assert parse_query('"Provision for  Gratuity" paid 1,200') == [
+        ['provision', 'for', 'gratuity'], ['paid'], ['1', '200']]
+    assert parse_query('"" ,') == []
+
+
+def test_phrase_matches_adjacent_words(index):
+    hits, total = index.search('"provision for gratuity"')
+
+    assert total == 3
+    assert pages(hits) == [('first', 'Notes.pdf', 1, 1), ('first', 'Schedule 1.pdf', 2, 2),
+                           ('second', 'Notes.pdf', 2, 1)]
+    assert hits[0]['source'] == 'first.zip'
+
+
+def test_phrase_needs_the_words_next_to_each_other(index):
+    # 'Provision made for leave encashment and gratuity' has every word, not the phrase
+    phrase_hits, _ = index.search('"provision for gratuity"')
+    word_hits, _ = index.search('provision for gratuity')
+
+    assert ('Schedule 1.pdf', 1) not in [(hit['filename'], hit['page_number']) for hit in phrase_hits]
+    assert ('first', 'Schedule 1.pdf', 1, 3) in pages(word_hits)
+    assert index.search('"gratuity for provision"') == ([], 0)
+
+
+def test_search_scoped_to_one_bundle(index):
+    hits, total = index.search('"provision for gratuity"', bundle='second')
+
+    assert total == 1
+    assert pages(hits) == [('second', 'Notes.pdf', 2, 1)]
+    assert index.search('encashment', bundle='second') == ([], 0)
+    assert index.search('gratuity', bundle='unknown') == ([], 0)
+
+
+def test_limit_keeps_the_total(index):
+    hits, total = index.search('gratuity', limit=2)
+
+    assert len(hits) == 2 and total == 5
+
+
+def test_reindexing_a_bundle_replaces_it(index):
+    index.add_bundle('second', 'second.zip', bundle_index({'Notes.pdf': ['Closing balance']}))
+
+    assert index.search('gratuity', bundle='second') == ([], 0)
+    assert pages(index.search('closing')[0]) == [('second', 'Notes.pdf', 1, 1)]
+    assert {bundle['fingerprint']: bundle['pages'] for bundle in index.bundles()} == {'first': 4, 'second': 1}
+    assert index.forget('second') and not index.forget('second')
+    assert index.search('closing') == ([], 0)
@@ -0,0 +1,105 @@
+import pytest
+
+from financial_document_analyzer import FILE_ANALYZED, FinancialDocumentAnalyzer, period_order, trial_balance_group
+from page_columns import FilePages, PageColumns
+
+
+@pytest.mark.parametrize('filename, group', [
+    ('bundle/Trial Balance - Branch A FY2023-24.pdf', ('branch a', 'FY2023-24')),
+    ('Trial_Balance_Branch_A_FY_2023-2024 (copy).pdf', ('branch a', 'FY2023-24')),
+    ('Trial Balance Q1 2024.pdf', ('', '2024-Q1')),
+    ('Trial Balance 2024-03.pdf', ('', '2024-03')),
+    ('Trial Balance 2024 (2).pdf', ('', '2024')),
+    ('Trial Balance Head Office.pdf', ('head office', None)),
+])
+def test_files_are_grouped_by_entity_and_period(filename, group):
+    assert trial_balance_group(filename) == group
+
+
+def test_periods_order_within_their_granularity():
+    assert sorted(['2024-12', '2024-03', '2023-11'], key=period_order) == ['2023-11', '2024-03', '2024-12']
+    assert sorted(['2024-Q3', '2023-Q4', '2024-Q1'], key=period_order) == ['2023-Q4', '2024-Q1', '2024-Q3']
+    assert period_order('FY2023-24') == ('fiscal year', (2023,))
+    assert period_order('2024-Q1')[0] != period_order('2024-12')[0]
+    assert period_order('2024')[0] == 'year'
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return FinancialDocumentAnalyzer(max_workers=1)
+
+
+def trial_balances(*files):
+    """file_pages for trial balances given as (name, opening, debit, credit, closing), one page each"""
+    columns = PageColumns()
+    pages = {}
+    for name, opening, debit, credit, closing in files:
+        file_id = columns.add_file(name)
+        columns.append(file_id, (1, 0, 0, opening, debit, credit, closing, 1, 0))
+        pages[name] = FilePages(columns, len(columns) - 1, len(columns))
+    return pages
+
+
+def check(analyzer, pages, status=None):
+    return analyzer.check_trial_balance_consistency(list(pages), pages, status)
+
+
+def comparisons(result, kind):
+    return [(c['files'], c['agrees']) for c in result['comparisons'] if c['check'] == kind]
+
+
+def test_copies_of_one_period_are_compared(analyzer):
+    pages = trial_balances(('Trial Balance Branch A FY2023-24.pdf', 10, 50, 50, 10),
+                           ('Trial Balance Branch A FY2023-24 (copy).pdf', 10, 50, 50, 12),
+                           ('Trial Balance Branch B FY2023-24.pdf', 0, 5, 5, 0))
+    result = check(analyzer, pages)
+    same_period = [c for c in result['comparisons'] if c['check'].startswith('Same period')]
+    assert len(same_period) == 4
+    assert {c['files'] for c in same_period} == {'Trial Balance Branch A FY2023-24.pdf / '
+                                                 'Trial Balance Branch A FY2023-24 (copy).pdf'}
+    assert [c['check'] for c in same_period if not c['agrees']] == ['Same period closing balance']
+    assert not result['consistent']
+
+
+def test_periods_chain_in_date_order_per_entity(analyzer):
+    pages = trial_balances(('Trial Balance 2024-12.pdf', 300, 10, 10, 400),
+                           ('Trial Balance 2024-03.pdf', 100, 10, 10, 200),
+                           ('Trial Balance 2024-11.pdf', 200, 10, 10, 300),
+                           ('Trial Balance Branch B 2024-01.pdf', 0, 1, 1, 0))
+    result = check(analyzer, pages)
+    assert comparisons(result, 'Closing vs next opening') == [
+        ('Trial Balance 2024-03.pdf -> Trial Balance 2024-11.pdf', True),
+        ('Trial Balance 2024-11.pdf -> Trial Balance 2024-12.pdf', True)]
+    assert result['consistent']
+
+
+def test_periods_of_different_granularity_never_chain(analyzer):
+    pages = trial_balances(('Trial Balance 2024-Q1.pdf', 0, 10, 10, 100),
+                           ('Trial Balance 2024-12.pdf', 999, 10, 10, 50),
+                           ('Trial Balance FY2024-25.pdf', 7, 10, 10, 8),
+                           ('Trial Balance 2024.pdf', 5, 10, 10, 6))
+    result = check(analyzer, pages)
+    assert comparisons(result, 'Closing vs next opening') == []
+    assert result['consistent']
+
+
+def test_incomplete_files_are_left_out_and_listed(analyzer):
+    pages = trial_balances(('Trial Balance 2024-01.pdf', 0, 10, 10, 100),
+                           ('Trial Balance 2024-02.pdf', 0, 3, 9, 1),
+                           ('Trial Balance 2024-03.pdf', 100, 10, 10, 150))
+    status = {name: FILE_ANALYZED for name in pages}
+    status['Trial Balance 2024-02.pdf'] = 'skipped: page timeout'
+    result = check(analyzer, pages, status)
+    assert result['not_comparable'] == [{'filename': 'Trial Balance 2024-02.pdf', 'status': 'skipped: page timeout'}]
+    assert [tb['filename'] for tb in result['files']] == ['Trial Balance 2024-01.pdf', 'Trial Balance 2024-03.pdf']
+    assert comparisons(result, 'Closing vs next opening') == [
+        ('Trial Balance 2024-01.pdf -> Trial Balance 2024-03.pdf', True)]
+    assert result['consistent']
+    assert result['status'].endswith('1 not comparable')
+
+
+def test_nothing_comparable_is_not_consistent(analyzer):
+    pages = trial_balances(('Trial Balance 2024-01.pdf', 0, 10, 10, 100))
+    result = check(analyzer, pages, {'Trial Balance 2024-01.pdf': 'skipped: page limit'})
+    assert not result['consistent'] and result['files'] == []
+    assert check(analyzer, {})['status'] == 'No trial balance files found'
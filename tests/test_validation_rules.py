@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from page_columns import FilePages, PageColumns
+from validation_rules import RULE_FIELDS, RuleError, RulePlan, load_rules, parse_expression, rules_failed
+
+
+def weight(weights: np.ndarray, field: str) -> float:
+    return weights[RULE_FIELDS.index(field)]
+
+
+def test_parse_expression_aliases_factors_and_constants():
+    weights, constant = parse_expression("opening + 2 * debit - credit - 1.5", "r")
+    assert weight(weights, 'opening_balance_total') == 1
+    assert weight(weights, 'debit_total') == 2
+    assert weight(weights, 'credit_total') == -1
+    assert weight(weights, 'closing_balance_total') == 0
+    assert constant == -1.5
+
+
+def test_parse_expression_number():
+    weights, constant = parse_expression(0.5, "r")
+    assert not weights.any() and constant == 0.5
+
+
+@pytest.mark.parametrize('text', ['', 'debit credit', 'debit +', 'balance', 'debit * 2'])
+def test_parse_expression_rejects(text):
+    with pytest.raises(RuleError):
+        parse_expression(text, "r")
+
+
+def test_load_rules_rejects_duplicates_and_bad_choices():
+    with pytest.raises(RuleError, match='duplicate'):
+        load_rules([{'name': 'a', 'left': 'debit'}, {'name': 'a', 'left': 'credit'}])
+    with pytest.raises(RuleError, match='scope'):
+        load_rules([{'name': 'a', 'left': 'debit', 'scope': 'sheet'}])
+    with pytest.raises(RuleError, match="'left' is required"):
+        load_rules([{'name': 'a'}])
+
+
+def bundle(*files):
+    """PageColumns holding files of (name, [(debit, credit), ...]) and their FilePages"""
+    columns = PageColumns()
+    views = []
+    for name, pages in files:
+        file_id = columns.add_file(name)
+        start = len(columns)
+        for number, (debit, credit) in enumerate(pages, 1):
+            columns.append(file_id, (number, 0, 0, 0.0, debit, credit, 0.0, 1, 0))
+        views.append((name, FilePages(columns, start, len(columns))))
+    return views
+
+
+def run(rules, files):
+    plan = RulePlan(load_rules(rules))
+    for index, (name, pages) in enumerate(bundle(*files)):
+        plan.add_file(index, name, pages)
+    return {outcome['name']: outcome for outcome in plan.finish()}
+
+
+FILES = [('Receipt and Payment.pdf', [(100.0, 0.0), (50.0, 150.0)]),
+         ('Schedule 1.pdf', [(10.0, 10.0), (5.0, 4.0)]),
+         ('Schedule 2.pdf', [(7.0, 7.0)])]
+
+
+def test_scopes_and_windows():
+    outcomes = run([
+        {'name': 'page', 'scope': 'page', 'files': 'schedule', 'left': 'debit', 'right': 'credit'},
+        {'name': 'file', 'files': 'schedule', 'left': 'debit', 'right': 'credit'},
+        {'name': 'bundle', 'scope': 'bundle', 'left': 'debit', 'right': 'credit'},
+        {'name': 'first last page', 'files': 'first', 'pages': 'last', 'left': 'credit', 'right': 150},
+        {'name': 'last file', 'files': 'last', 'left': 'debit', 'right': 'credit'},
+    ], FILES)
+    assert (outcomes['page']['evaluated'], outcomes['page']['failed']) == (3, 1)
+    assert outcomes['page']['failures'] == [{'filename': 'Schedule 1.pdf', 'page': 2, 'left': 5.0, 'right': 4.0,
+                                             'difference': 1.0}]
+    assert (outcomes['file']['evaluated'], outcomes['file']['failed']) == (2, 1)
+    assert (outcomes['bundle']['evaluated'], outcomes['bundle']['passed']) == (1, False)
+    assert (outcomes['first last page']['evaluated'], outcomes['first last page']['passed']) == (1, True)
+    assert (outcomes['last file']['evaluated'], outcomes['last file']['passed']) == (1, True)
+
+
+def test_comparisons_and_tolerances():
+    outcomes = run([
+        {'name': 'within tolerance', 'files': 'schedule 1', 'left': 'debit', 'right': 'credit', 'tolerance': 1},
+        {'name': 'relative', 'files': 'schedule 1', 'left': 'debit', 'right': 'credit',
+         'relative_tolerance': 0.1},
+        {'name': 'relative too tight', 'files': 'schedule 1', 'left': 'debit', 'right': 'credit',
+         'relative_tolerance': 0.05},
+        {'name': 'at most', 'files': 'schedule 1', 'left': 'credit', 'right': 'debit', 'compare': 'at_most'},
+        {'name': 'at least', 'files': 'schedule 1', 'left': 'credit', 'right': 'debit', 'compare': 'at_least'},
+    ], FILES)
+    assert {name: outcome['passed'] for name, outcome in outcomes.items()} == {
+        'within tolerance': True, 'relative': True, 'relative too tight': False, 'at most': True, 'at least': False}
+
+
+def test_rule_selecting_nothing_is_not_applicable():
+    outcomes = run([
+        {'name': 'trial balance', 'files': 'trial balance', 'left': 'debit', 'right': 'credit'},
+        {'name': 'schedules', 'files': 'schedule', 'left': 'debit', 'right': 'credit'},
+        {'name': 'warning', 'files': 'schedule', 'left': 'debit', 'right': 'credit', 'severity': 'warning'},
+    ], FILES)
+    assert outcomes['trial balance']['evaluated'] == 0
+    assert outcomes['trial balance']['passed'] is None
+    assert rules_failed(list(outcomes.values())) == 1
+    assert rules_failed(list(outcomes.values()), 'warning') == 1
+
+
+def test_empty_plan():
+    plan = RulePlan([])
+    plan.add_file(0, 'Schedule 1.pdf', bundle(*FILES)[1][1])
+    assert plan.finish() == []
@@ -0,0 +1,314 @@
+# Financial Document Analyzer - Text Index
+# Purpose: Inverted index over the text of every parsed page. The parse workers send back each
+#          page's terms with their positions, the analysis collects them per bundle and writes one
+#          posting list per term to SQLite, so term and phrase searches ("provision for gratuity")
+#          return file and page hits in milliseconds instead of re-reading PDFs
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from checkpoint_store import zip_fingerprint
+from metrics import REGISTRY
+
+TOKEN = re.compile(r"[0-9a-z]+")
+# A query is "quoted phrases" and bare words
+QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+DEFAULT_LIMIT = 50
+
+# Posting lists are 32-bit unsigned integers in native byte order, deflated; the high bytes of
+# small page indexes and word positions are mostly zero, so this about halves the index
+POSTING_TYPE = 'I'
+COMPRESSION_LEVEL = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS text_bundles (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    source TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS text_pages (
+    bundle_id INTEGER NOT NULL REFERENCES text_bundles(id) ON DELETE CASCADE,
+    page_index INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    PRIMARY KEY (bundle_id, page_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS text_terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS text_postings (
+    term_id INTEGER NOT NULL,
+    bundle_id INTEGER NOT NULL REFERENCES text_bundles(id) ON DELETE CASCADE,
+    postings BLOB NOT NULL,
+    PRIMARY KEY (term_id, bundle_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS text_postings_bundle ON text_postings (bundle_id);
+"""
+
+INDEXED_PAGES = REGISTRY.counter('fda_text_index_pages_total', 'Pages written to the text index')
+SEARCH_SECONDS = REGISTRY.histogram('fda_text_search_seconds', 'Time to answer a text index search',
+                                    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words and digit groups; '1,234.00' becomes '1', '234', '00' in text and queries alike"""
+    return TOKEN.findall(text.lower())
+
+
+def page_terms(text: str) -> Dict[str, List[int]]:
+    """Word positions of each term on one page"""
+    terms: Dict[str, List[int]] = {}
+    for position, term in enumerate(tokenize(text)):
+        terms.setdefault(term, []).append(position)
+    return terms
+
+
+def parse_query(query: str) -> List[List[str]]:
+    """Clauses of a query, each a phrase of one or more terms; a page must match every clause"""
+    clauses = []
+    for phrase, word in QUERY_PART.findall(query):
+        terms = tokenize(phrase or word)
+        if terms:
+            clauses.append(terms)
+    return clauses
+
+
+class BundleTextIndex:
+    """
+    Posting lists of one bundle, collected in memory as its files are aggregated.
+    Per term: the pages it is on, and its positions on each of them.
+    """
+
+    def __init__(self):
+        self.pages: List[Tuple[str, int]] = []
+        self.postings: Dict[str, Tuple[array, array, array]] = {}
+
+    def add_file(self, filename: str, page_results: List[Dict]):
+        """Index the pages of one parsed file, taking their 'terms' out of the page results"""
+        for page in page_results:
+            page_index = len(self.pages)
+            self.pages.append((filename, page['page']))
+            for term, positions in (page.pop('terms', None) or {}).items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = (array(POSTING_TYPE), array(POSTING_TYPE), array(POSTING_TYPE))
+                pages, ends, all_positions = posting
+                pages.append(page_index)
+                all_positions.extend(positions)
+                ends.append(len(all_positions))
+
+    def encoded(self):
+        """(term, blob) per term: page count, page indexes, end offsets into the positions, then positions"""
+        for term, (pages, ends, positions) in self.postings.items():
+            blob = array(POSTING_TYPE, [len(pages)])
+            blob.extend(pages)
+            blob.extend(ends)
+            blob.extend(positions)
+            yield term, zlib.compress(blob.tobytes(), COMPRESSION_LEVEL)
+
+
+class _Postings:
+    """Decoded posting list of one term in one bundle"""
+
+    def __init__(self, blob: bytes):
+        self.data = array(POSTING_TYPE)
+        self.data.frombytes(zlib.decompress(blob))
+        count = self.data[0]
+        self.pages = self.data[1:count + 1]
+        self.ends = self.data[count + 1:2 * count + 1]
+        self.base = 2 * count + 1
+        self.slots = {page: slot for slot, page in enumerate(self.pages)}
+
+    def count(self, page: int) -> int:
+        slot = self.slots[page]
+        return self.ends[slot] - (self.ends[slot - 1] if slot else 0)
+
+    def positions(self, page: int) -> Sequence[int]:
+        slot = self.slots[page]
+        start = self.ends[slot - 1] if slot else 0
+        return self.data[self.base + start:self.base + self.ends[slot]]
+
+
+def _clause_matches(clause: List[str], postings: Dict[str, _Postings]) -> Dict[int, int]:
+    """Pages matching one clause with the number of matches on each"""
+    if len(clause) == 1:
+        posting = postings[clause[0]]
+        return {page: posting.count(page) for page in posting.pages}
+
+    candidates = set(postings[clause[0]].pages)
+    for term in clause[1:]:
+        candidates.intersection_update(postings[term].slots)
+    matches = {}
+    for page in candidates:
+        following = [set(postings[term].positions(page)) for term in clause[1:]]
+        count = sum(1 for start in postings[clause[0]].positions(page)
+                    if all(start + offset in positions for offset, positions in enumerate(following, 1)))
+        if count:
+            matches[page] = count
+    return matches
+
+
+class TextIndex:
+    """
+    SQLite file of per-bundle posting lists. It can be its own file (one bundle or many) or
+    share the results history database, in which case hits also carry client and period.
+    A connection belongs to the thread that opened it.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def add_bundle(self, fingerprint: str, source: Optional[str], bundle_index: BundleTextIndex) -> int:
+        """Store one bundle's postings, replacing an earlier index of the same bundle; returns its id"""
+        with self.conn:
+            self.conn.execute("DELETE FROM text_bundles WHERE fingerprint = ?", (fingerprint,))
+            bundle_id = self.conn.execute("INSERT INTO text_bundles (fingerprint, source, indexed_at) VALUES (?, ?, ?)",
+                                          (fingerprint, source, time.time())).lastrowid
+            self.conn.executemany("INSERT INTO text_pages VALUES (?, ?, ?, ?)", (
+                (bundle_id, page_index, filename, page_number)
+                for page_index, (filename, page_number) in enumerate(bundle_index.pages)))
+
+            # Resolve term ids in bulk: new terms are added, known ones reused
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS new_terms (term TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM new_terms")
+            self.conn.executemany("INSERT INTO new_terms VALUES (?)", ((term,) for term in bundle_index.postings))
+            self.conn.execute("INSERT OR IGNORE INTO text_terms (term) SELECT term FROM new_terms")
+            term_ids = dict(self.conn.execute(
+                "SELECT t.term, t.id FROM text_terms t JOIN new_terms n ON n.term = t.term"))
+            self.conn.executemany("INSERT INTO text_postings VALUES (?, ?, ?)", (
+                (term_ids[term], bundle_id, blob) for term, blob in bundle_index.encoded()))
+        INDEXED_PAGES.inc(len(bundle_index.pages))
+        return bundle_id
+
+    def search(self, query: str, bundle: Optional[str] = None, limit: int = DEFAULT_LIMIT) -> Tuple[List[Dict], int]:
+        """Pages matching every term and "quoted phrase" of the query, in bundle and page order
+
+        bundle restricts the search to one bundle fingerprint. Returns up to limit hits
+        (source, file, page, matches; client and period when sharing the results history)
+        and the total number of matching pages.
+        """
+        started = time.perf_counter()
+        clauses = parse_query(query)
+        if not clauses:
+            return [], 0
+        terms = sorted({term for clause in clauses for term in clause})
+        sql = f"""
+            SELECT t.term, p.bundle_id, p.postings FROM text_terms t JOIN text_postings p ON p.term_id = t.id
+            WHERE t.term IN ({', '.join('?' * len(terms))})"""
+        params: List = list(terms)
+        if bundle is not None:
+            sql += " AND p.bundle_id = (SELECT id FROM text_bundles WHERE fingerprint = ?)"
+            params.append(bundle)
+
+        by_bundle: Dict[int, Dict[str, bytes]] = {}
+        for term, bundle_id, blob in self.conn.execute(sql, params):
+            by_bundle.setdefault(bundle_id, {})[term] = blob
+
+        matched = []
+        for bundle_id in sorted(by_bundle):
+            blobs = by_bundle[bundle_id]
+            if len(blobs) < len(terms):
+                continue
+            postings = {term: _Postings(blob) for term, blob in blobs.items()}
+            pages = None
+            for clause in sorted(clauses, key=lambda clause: min(len(postings[term].pages) for term in clause)):
+                clause_matches = _clause_matches(clause, postings)
+                if pages is None:
+                    pages = clause_matches
+                else:
+                    pages = {page: count + clause_matches[page] for page, count in pages.items()
+                             if page in clause_matches}
+                if not pages:
+                    break
+            matched.extend((bundle_id, page, count) for page, count in sorted(pages.items()))
+
+        hits = [self._hit(bundle_id, page, count) for bundle_id, page, count in matched[:limit]]
+        SEARCH_SECONDS.observe(time.perf_counter() - started)
+        return hits, len(matched)
+
+    def _hit(self, bundle_id: int, page_index: int, matches: int) -> Dict:
+        fingerprint, source, filename, page_number = self.conn.execute("""
+            SELECT b.fingerprint, b.source, p.filename, p.page_number
+            FROM text_pages p JOIN text_bundles b ON b.id = p.bundle_id
+            WHERE p.bundle_id = ? AND p.page_index = ?""", (bundle_id, page_index)).fetchone()
+        hit = {'source': source, 'filename': filename, 'page_number': page_number, 'matches': matches,
+               'fingerprint': fingerprint}
+        if self._shares_history():
+            row = self.conn.execute("""
+                SELECT client, period FROM bundles WHERE fingerprint = ?
+                ORDER BY analyzed_at DESC LIMIT 1""", (fingerprint,)).fetchone()
+            hit['client'], hit['period'] = row or (None, None)
+        return hit
+
+    def _shares_history(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bundles'").fetchone() is not None
+
+    def bundles(self) -> List[Dict]:
+        """Indexed bundles with their page and term counts, newest first"""
+        rows = self.conn.execute("""
+            SELECT b.fingerprint, b.source, b.indexed_at,
+                   (SELECT COUNT(*) FROM text_pages p WHERE p.bundle_id = b.id),
+                   (SELECT COUNT(*) FROM text_postings p WHERE p.bundle_id = b.id)
+            FROM text_bundles b ORDER BY b.indexed_at DESC""")
+        return [{'fingerprint': fingerprint, 'source': source, 'indexed_at': indexed_at, 'pages': pages,
+                 'terms': terms} for fingerprint, source, indexed_at, pages, terms in rows]
+
+    def forget(self, fingerprint: str) -> bool:
+        with self.conn:
+            return self.conn.execute("DELETE FROM text_bundles WHERE fingerprint = ?", (fingerprint,)).rowcount > 0
+
+    def close(self):
+        self.conn.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Search the text of analyzed PDFs")
+    parser.add_argument("--index", default=os.environ.get('FDA_TEXT_INDEX'),
+                        help="Text index file (or set FDA_TEXT_INDEX)")
+    parser.add_argument("query", nargs="?", help='Words and "quoted phrases" that must all appear on a page')
+    parser.add_argument("--bundle", metavar="ZIP", help="Only search this bundle")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="Hits to show (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if not args.index:
+        parser.error("--index (or FDA_TEXT_INDEX) is required")
+
+    index = TextIndex(args.index)
+    try:
+        if args.query is None:
+            for bundle in index.bundles():
+                indexed = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(bundle['indexed_at']))
+                print(f"{bundle['fingerprint'][:16]}  {bundle['source']}  {bundle['pages']:>7} pages  "
+                      f"{bundle['terms']:>7} terms  indexed {indexed}")
+            return
+        bundle = None
+        if args.bundle:
+            bundle = zip_fingerprint(args.bundle)
+        started = time.perf_counter()
+        hits, total = index.search(args.query, bundle, args.limit)
+        elapsed = time.perf_counter() - started
+        for hit in hits:
+            owner = " ".join(part for part in (hit.get('client'), hit.get('period')) if part)
+            print(f"{owner + '  ' if owner else ''}{hit['source']}  {hit['filename']}  page {hit['page_number']}  ({hit['matches']} matches)")
+        shown = f", showing {len(hits)}" if total > len(hits) else ""
+        print(f"{total} matching pages{shown} ({elapsed * 1000:.1f} ms)", file=sys.stderr)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
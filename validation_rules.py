@@ -0,0 +1,284 @@
+# Financial Document Analyzer - Validation Rules
+# Purpose: Declarative checks over page, file and bundle totals. Rules are read from a YAML or
+#          JSON file (or given as a list of dicts) and compiled into one plan; the analysis feeds the
+#          plan each file's page summaries as it aggregates them, so every rule is evaluated in the
+#          same single pass and a new rule costs a few array operations instead of another pass
+
+import argparse
+import json
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from page_columns import FIELD_NAMES, FilePages
+
+SCOPES = ('page', 'file', 'bundle')
+SEVERITIES = ('error', 'warning', 'info')
+# Which files a rule reads: every file, the first or last in the archive, or a regex on the file name
+FILE_SELECTORS = ('all', 'first', 'last')
+# Which pages of a file a rule reads
+PAGE_WINDOWS = {'all': slice(None), 'first': slice(None, 1), 'last': slice(-1, None)}
+COMPARISONS = ('equal', 'at_most', 'at_least')
+DEFAULT_TOLERANCE = 0.01
+MAX_LISTED_FAILURES = 50
+
+# Page summary fields a rule can use; page_number identifies a page and is not summed
+RULE_FIELDS = tuple(name for name in FIELD_NAMES if name != 'page_number')
+FIELD_ALIASES = {'opening': 'opening_balance_total', 'debit': 'debit_total', 'credit': 'credit_total',
+                 'closing': 'closing_balance_total'}
+# "opening + debit - credit", "2 * debit", "0.5"
+TERM = re.compile(r'\s*([+-])?\s*(?:(\d+(?:\.\d*)?)\s*\*\s*)?([a-z_]+|\d+(?:\.\d*)?)\s*', re.IGNORECASE)
+
+
+class RuleError(ValueError):
+    """A rule definition that cannot be compiled"""
+
+
+def parse_expression(text: Union[str, int, float], rule: str) -> Tuple[np.ndarray, float]:
+    """Weights over RULE_FIELDS and a constant for a sum like "opening + debit - credit" """
+    weights = np.zeros(len(RULE_FIELDS))
+    if isinstance(text, (int, float)):
+        return weights, float(text)
+    text = str(text)
+    if not text.strip():
+        raise RuleError(f"{rule}: empty expression")
+    constant = 0.0
+    position = 0
+    while position < len(text):
+        match = TERM.match(text, position)
+        if not match or match.end() == position or (position and not match.group(1)):
+            raise RuleError(f"{rule}: cannot read expression {text!r}")
+        sign = -1.0 if match.group(1) == '-' else 1.0
+        factor = sign * float(match.group(2) or 1)
+        operand = match.group(3).lower()
+        if operand[0].isdigit():
+            constant += factor * float(operand)
+        else:
+            field = FIELD_ALIASES.get(operand, operand)
+            if field not in RULE_FIELDS:
+                raise RuleError(f"{rule}: unknown field {operand!r} (use {', '.join(RULE_FIELDS)})")
+            weights[RULE_FIELDS.index(field)] += factor
+        position = match.end()
+    return weights, constant
+
+
+class Rule:
+    """One compiled rule: left and right sides as weights over the page fields, and how they compare"""
+
+    def __init__(self, spec: Dict):
+        if not isinstance(spec, dict) or not spec.get('name'):
+            raise RuleError(f"every rule needs a name: {spec!r}")
+        self.name = str(spec['name'])
+        # The definition as given, which identifies the rule set a checkpoint was made under
+        self.spec = dict(spec)
+        self.description = spec.get('description', '')
+        self.scope = self._choice(spec, 'scope', SCOPES, 'file')
+        self.pages = self._choice(spec, 'pages', tuple(PAGE_WINDOWS), 'all')
+        self.severity = self._choice(spec, 'severity', SEVERITIES, 'error')
+        self.compare = self._choice(spec, 'compare', COMPARISONS, 'equal')
+        files = str(spec.get('files', 'all'))
+        self.files = files if files in FILE_SELECTORS else None
+        try:
+            self.file_pattern = None if self.files else re.compile(files, re.IGNORECASE)
+        except re.error as e:
+            raise RuleError(f"{self.name}: bad files pattern {files!r}: {e}") from None
+        if 'left' not in spec:
+            raise RuleError(f"{self.name}: 'left' is required")
+        self.left, self.left_constant = parse_expression(spec['left'], self.name)
+        self.right, self.right_constant = parse_expression(spec.get('right', 0), self.name)
+        self.tolerance = float(spec.get('tolerance', DEFAULT_TOLERANCE))
+        # Added to the tolerance as a fraction of the right side (0.01 allows 1% more)
+        self.relative_tolerance = float(spec.get('relative_tolerance', 0))
+
+    def _choice(self, spec: Dict, key: str, choices: Sequence[str], default: str) -> str:
+        value = str(spec.get(key, default)).lower()
+        if value not in choices:
+            raise RuleError(f"{self.name}: {key} must be one of {', '.join(choices)}, not {value!r}")
+        return value
+
+    def to_dict(self) -> Dict:
+        return {'name': self.name, 'description': self.description, 'scope': self.scope,
+                'severity': self.severity}
+
+
+def load_rules(source: Union[None, str, Iterable]) -> List[Rule]:
+    """Compile rules from a .yaml/.yml/.json file, a list of rule dicts (or Rules), or None for no rules
+
+    A file holds either a list of rules or a mapping with a 'rules' list.
+    """
+    if source is None:
+        return []
+    if isinstance(source, str):
+        with open(source) as f:
+            if os.path.splitext(source)[1].lower() in ('.yaml', '.yml'):
+                try:
+                    import yaml
+                except ImportError:
+                    raise RuleError("YAML rule files need PyYAML (pip install pyyaml); JSON works without it") from None
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+        source = data.get('rules', []) if isinstance(data, dict) else data
+        if not isinstance(source, list):
+            raise RuleError("a rules file holds a list of rules or a mapping with a 'rules' list")
+    rules = [spec if isinstance(spec, Rule) else Rule(spec) for spec in source]
+    names = [rule.name for rule in rules]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise RuleError(f"duplicate rule names: {', '.join(duplicates)}")
+    return rules
+
+
+class RulePlan:
+    """Evaluation of a rule set over one bundle, fed file by file in archive order
+
+    The rules are compiled into arrays: weights of both sides, constants, tolerances and
+    comparison codes. Each file's page fields are read once into a (pages x fields) matrix, and
+    all rules reading the same pages of it are evaluated together with one matrix product, so a
+    rule costs a column of that product rather than a pass of its own. Page and file rules are
+    settled as each file arrives and bundle rules keep one running sum each; rules on the last
+    file keep only the latest file's matrix until finish().
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        left = np.array([rule.left for rule in rules]).reshape(len(rules), len(RULE_FIELDS))
+        right = np.array([rule.right for rule in rules]).reshape(len(rules), len(RULE_FIELDS))
+        # Only the fields some rule uses are read from the pages
+        used = np.flatnonzero((left != 0).any(axis=0) | (right != 0).any(axis=0))
+        self._fields = [RULE_FIELDS[i] for i in used.tolist()]
+        self._left = left[:, used]
+        self._right = right[:, used]
+        self._left_constant = np.array([rule.left_constant for rule in rules])
+        self._right_constant = np.array([rule.right_constant for rule in rules])
+        self._tolerance = np.array([rule.tolerance for rule in rules])
+        self._relative_tolerance = np.array([rule.relative_tolerance for rule in rules])
+        self._compare = np.array([COMPARISONS.index(rule.compare) for rule in rules], dtype=np.int8)
+        self._scope = np.array([SCOPES.index(rule.scope) for rule in rules], dtype=np.int8)
+        self._windows = {pages: np.array([rule.pages == pages for rule in rules], dtype=bool)
+                         for pages in PAGE_WINDOWS}
+        self._files = {selector: np.array([rule.files == selector for rule in rules], dtype=bool)
+                       for selector in FILE_SELECTORS}
+        self._patterns = {}
+        for i, rule in enumerate(rules):
+            if rule.file_pattern is not None:
+                self._patterns.setdefault(rule.file_pattern.pattern, [rule.file_pattern, []])[1].append(i)
+
+        self._evaluated = np.zeros(len(rules), dtype=np.int64)
+        self._failed = np.zeros(len(rules), dtype=np.int64)
+        self._failures: List[List[Dict]] = [[] for _ in rules]
+        self._bundle_sums = np.zeros((len(rules), len(self._fields)))
+        self._bundle_read = np.zeros(len(rules), dtype=bool)
+        self._last_file: Optional[Tuple[str, np.ndarray, np.ndarray]] = None
+
+    def add_file(self, index: int, filename: str, pages: FilePages):
+        if not self.rules or not len(pages):
+            return
+        values = np.column_stack([pages.column(field).astype(np.float64) for field in self._fields]) \
+            if self._fields else np.zeros((len(pages), 0))
+        page_numbers = pages.column('page_number')
+        selected = self._files['all'] | (self._files['first'] if index == 0 else False)
+        for pattern, indexes in self._patterns.values():
+            if pattern.search(filename):
+                selected[indexes] = True
+        if selected.any():
+            self._evaluate(filename, values, page_numbers, selected)
+        if self._files['last'].any():
+            self._last_file = (filename, values, page_numbers)
+
+    def _passed(self, left: np.ndarray, right: np.ndarray, rules: np.ndarray) -> np.ndarray:
+        """Whether each left value stands in its rule's comparison to the right one (rules along the last axis)"""
+        allowed = self._tolerance[rules] + self._relative_tolerance[rules] * np.abs(right)
+        difference = left - right
+        compare = self._compare[rules]
+        return np.where(compare == COMPARISONS.index('at_most'), difference <= allowed,
+                        np.where(compare == COMPARISONS.index('at_least'), difference >= -allowed,
+                                 np.abs(difference) <= allowed))
+
+    def _evaluate(self, filename: str, values: np.ndarray, page_numbers: np.ndarray, selected: np.ndarray):
+        for pages, window in self._windows.items():
+            rules = np.flatnonzero(window & selected)
+            if not rules.size:
+                continue
+            rows = values[PAGE_WINDOWS[pages]]
+            numbers = page_numbers[PAGE_WINDOWS[pages]]
+            scopes = self._scope[rules]
+
+            page_rules = rules[scopes == SCOPES.index('page')]
+            if page_rules.size:
+                left = rows @ self._left[page_rules].T + self._left_constant[page_rules]
+                right = rows @ self._right[page_rules].T + self._right_constant[page_rules]
+                failed = ~self._passed(left, right, page_rules)
+                self._evaluated[page_rules] += len(rows)
+                failed_counts = failed.sum(axis=0)
+                self._failed[page_rules] += failed_counts
+                for column in np.flatnonzero(failed_counts).tolist():
+                    listed = np.flatnonzero(failed[:, column])[:MAX_LISTED_FAILURES]
+                    self._list_failures(page_rules[column], [
+                        (filename, page, left[row, column], right[row, column])
+                        for row, page in zip(listed.tolist(), numbers[listed].tolist())])
+
+            sums = rows.sum(axis=0)
+            file_rules = rules[scopes == SCOPES.index('file')]
+            if file_rules.size:
+                self._settle(file_rules, sums, filename)
+            bundle_rules = rules[scopes == SCOPES.index('bundle')]
+            self._bundle_sums[bundle_rules] += sums
+            self._bundle_read[bundle_rules] = True
+
+    def _settle(self, rules: np.ndarray, sums: np.ndarray, filename: Optional[str]):
+        """Evaluate rules on one set of summed fields"""
+        left = self._left[rules] @ sums + self._left_constant[rules]
+        right = self._right[rules] @ sums + self._right_constant[rules]
+        failed = ~self._passed(left, right, rules)
+        self._evaluated[rules] += 1
+        self._failed[rules] += failed
+        for column in np.flatnonzero(failed).tolist():
+            self._list_failures(rules[column], [(filename, None, left[column], right[column])])
+
+    def _list_failures(self, rule: int, failures: List[Tuple]):
+        listed = self._failures[rule]
+        listed.extend({'filename': filename, 'page': page, 'left': float(left), 'right': float(right),
+                       'difference': float(left - right)}
+                      for filename, page, left, right in failures[:MAX_LISTED_FAILURES - len(listed)])
+
+    def finish(self) -> List[Dict]:
+        """Settle the rules on the last file and the bundle rules; one outcome per rule, in rule order.
+        A rule that was never evaluated (no page or file it selects) has passed None: not applicable"""
+        if self._last_file is not None:
+            self._evaluate(*self._last_file, self._files['last'])
+            self._last_file = None
+        for i in np.flatnonzero(self._bundle_read).tolist():
+            self._settle(np.array([i]), self._bundle_sums[i], None)
+        return [{**rule.to_dict(), 'evaluated': int(evaluated), 'failed': int(failed),
+                 'passed': (not failed) if evaluated else None,
+                 'failures': failures}
+                for rule, evaluated, failed, failures in zip(self.rules, self._evaluated.tolist(),
+                                                             self._failed.tolist(), self._failures)]
+
+
+def rules_failed(outcomes: List[Dict], severity: str = 'error') -> int:
+    """Rules of the given severity that failed at least once; rules that were not applicable do not count"""
+    return sum(1 for outcome in outcomes if outcome['severity'] == severity and outcome['passed'] is False)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Check a validation rules file and list its rules")
+    parser.add_argument("rules", help="Rules file (.yaml, .yml or .json)")
+    args = parser.parse_args(argv)
+    try:
+        rules = load_rules(args.rules)
+    except (OSError, ValueError) as e:
+        print(f"{args.rules}: {e}", file=sys.stderr)
+        sys.exit(1)
+    for rule in rules:
+        files = rule.files or f"/{rule.file_pattern.pattern}/"
+        print(f"{rule.severity:8s} {rule.scope:7s} files={files} pages={rule.pages}  {rule.name}")
+    print(f"{len(rules)} rules")
+
+
+if __name__ == "__main__":
+    main()
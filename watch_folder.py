@@ -0,0 +1,389 @@
+# Financial Document Analyzer - Watch Folder Ingestion
+# Purpose: Watch an intake directory for client ZIP bundles, analyze each new or changed
+#          bundle once it has stopped growing, and write the Excel report next to it
+
+import argparse
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import signal
+import sqlite3
+import struct
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from financial_document_analyzer import (ExcelReportWriter, FinancialDocumentAnalyzer, record_file_metrics,
+                                         record_run_metrics)
+from metrics import REGISTRY, start_http_server
+from results_store import save_results
+
+logger = logging.getLogger("financial_analyzer.watch")
+
+LEDGER_FILENAME = ".financial_analyzer_ledger.sqlite3"
+REPORT_SUFFIX = "_analysis_report.xlsx"
+# A failed bundle is tried again after RETRY_BACKOFF seconds, doubling each time, up to MAX_ATTEMPTS tries
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 60.0
+
+BUNDLES_PROCESSED = REGISTRY.counter('fda_watch_bundles_total', 'Bundles processed by the watcher', ['status'])
+BUNDLES_IN_FLIGHT = REGISTRY.gauge('fda_watch_bundles_in_flight', 'Bundles handed to the worker pool')
+BUNDLE_BACKLOG = REGISTRY.gauge('fda_watch_backlog', 'Stable bundles waiting for pool capacity')
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+
+class InotifyWaker:
+    """Wake the watch loop early on directory changes using Linux inotify via libc"""
+
+    def __init__(self, directory: str):
+        self.fd = -1
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            return
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            os.close(fd)
+            return
+        self.fd = fd
+
+    @property
+    def available(self) -> bool:
+        return self.fd >= 0
+
+    def wait(self, timeout: float) -> bool:
+        """Block until a change event arrives or timeout elapses; return True on events"""
+        if not self.available:
+            time.sleep(timeout)
+            return False
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+
+        # Drain pending events; the scan that follows decides what actually changed
+        try:
+            while True:
+                data = os.read(self.fd, 64 * 1024)
+                if not data:
+                    break
+                offset = 0
+                while offset < len(data):
+                    _, _, _, name_len = struct.unpack_from("iIII", data, offset)
+                    offset += 16 + name_len
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self.available:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class ProcessedLedger:
+    """Durable record of analyzed bundles so restarts do not redo finished work
+
+    A failure is kept with its attempt count and the time it may be retried (none once the
+    attempts are used up), so a transient failure is tried again without touching the file.
+    """
+
+    def __init__(self, ledger_path: str):
+        self.conn = sqlite3.connect(ledger_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                report_path TEXT,
+                error TEXT,
+                processed_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                retry_at REAL
+            )
+            """
+        )
+        # Ledgers written before failures were retried
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(processed)")}
+        if 'attempts' not in columns:
+            self.conn.execute("ALTER TABLE processed ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("ALTER TABLE processed ADD COLUMN retry_at REAL")
+        self.conn.commit()
+
+    def is_current(self, path: str, fingerprint: Tuple[int, int]) -> bool:
+        """Check whether this exact version of the file has been analyzed, or failed and is not due a retry"""
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, status, retry_at FROM processed WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or (row[0], row[1]) != fingerprint:
+            return False
+        return row[2] == 'done' or row[3] is None or time.time() < row[3]
+
+    def attempts(self, path: str, fingerprint: Tuple[int, int]) -> int:
+        """Failed attempts recorded for this version of the file"""
+        row = self.conn.execute(
+            "SELECT attempts FROM processed WHERE path = ? AND size = ? AND mtime_ns = ? AND status = 'failed'",
+            (path, fingerprint[0], fingerprint[1])
+        ).fetchone()
+        return row[0] if row else 0
+
+    def record(self, path: str, fingerprint: Tuple[int, int], status: str,
+               report_path: Optional[str] = None, error: Optional[str] = None,
+               attempts: int = 0, retry_at: Optional[float] = None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO processed (path, size, mtime_ns, status, report_path, error, processed_at, "
+            "attempts, retry_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, fingerprint[0], fingerprint[1], status, report_path, error, time.time(), attempts, retry_at)
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def _ignore_sigint():
+    """Pool initializer: let the parent handle Ctrl+C and drain running work"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def report_path_for(zip_path: str) -> str:
+    """Report location for a bundle: alongside the input ZIP"""
+    stem, _ = os.path.splitext(zip_path)
+    return stem + REPORT_SUFFIX
+
+
+def process_bundle(zip_path: str, memory_budget_mb: Optional[int] = None,
+                   max_files_per_worker: Optional[int] = None, results_db: Optional[str] = None) -> Dict:
+    """Analyze one ZIP bundle and write its report next to it (runs in a worker process)
+
+    With results_db, the results are also stored there (client from the ZIP name, period inferred from it).
+    """
+    # Bundles are already spread over the watcher's pool, so parse each one serially
+    # (in a supervised child process when a memory budget is set)
+    analyzer = FinancialDocumentAnalyzer(max_workers=1, memory_budget_mb=memory_budget_mb,
+                                         max_files_per_worker=max_files_per_worker)
+    report_writer = ExcelReportWriter()
+    results = analyzer.analyze_zip_file(zip_path, report_writer=report_writer)
+    report_path = report_path_for(zip_path)
+
+    # Write to a temporary name first so readers never see a half-written report
+    tmp_path = report_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(report_writer.finalize(results))
+    os.replace(tmp_path, report_path)
+    if results_db:
+        save_results(results_db, results, None, None, zip_path)
+
+    # FDA_PROFILE=1 profiles each bundle; keep the profile next to its report
+    if analyzer.profiler is not None:
+        analyzer.profiler.save(os.path.splitext(report_path)[0])
+
+    return {
+        'report_path': report_path,
+        'total_pdf_files': results['total_pdf_files'],
+        'missing_files': len(results['missing_files']),
+        'incomplete_files': [f"{f['filename']} ({f['status']})" for f in results['incomplete_files']],
+        'perf': results['perf']
+    }
+
+
+class FolderWatcher:
+    """Pick up stable ZIP bundles from a directory and analyze them through a worker pool"""
+
+    def __init__(self, directory: str, workers: int = 2, poll_interval: float = 5.0,
+                 settle_seconds: float = 10.0, max_pending: Optional[int] = None,
+                 ledger_path: Optional[str] = None, metrics_file: Optional[str] = None,
+                 memory_budget_mb: Optional[int] = None, max_files_per_worker: Optional[int] = None,
+                 results_db: Optional[str] = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retry_backoff: float = DEFAULT_RETRY_BACKOFF):
+        self.directory = os.path.abspath(directory)
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        # Never hand the pool more than this many bundles at once
+        self.max_pending = max_pending or workers * 2
+        self.metrics_file = metrics_file
+        self.memory_budget_mb = memory_budget_mb
+        self.max_files_per_worker = max_files_per_worker
+        self.results_db = results_db
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.ledger = ProcessedLedger(ledger_path or os.path.join(self.directory, LEDGER_FILENAME))
+        self.waker = InotifyWaker(self.directory)
+        # path -> (fingerprint, first time this fingerprint was seen)
+        self.candidates: Dict[str, Tuple[Tuple[int, int], float]] = {}
+        self.in_flight: Dict[Future, Tuple[str, Tuple[int, int]]] = {}
+        self._stopping = False
+
+    def scan(self) -> List[Tuple[str, Tuple[int, int]]]:
+        """Return bundles whose size and mtime have been unchanged for the settle period"""
+        now = time.monotonic()
+        busy = {path for path, _ in self.in_flight.values()}
+        seen = set()
+        stable = []
+
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith('.zip'):
+                    continue
+                path = entry.path
+                seen.add(path)
+                if path in busy:
+                    continue
+
+                stat = entry.stat()
+                fingerprint = (stat.st_size, stat.st_mtime_ns)
+                if self.ledger.is_current(path, fingerprint):
+                    self.candidates.pop(path, None)
+                    continue
+
+                previous = self.candidates.get(path)
+                if previous is None or previous[0] != fingerprint:
+                    # New or still being written: restart the settle clock
+                    self.candidates[path] = (fingerprint, now)
+                elif now - previous[1] >= self.settle_seconds:
+                    stable.append((path, fingerprint))
+
+        # Forget files that disappeared before they settled
+        for path in list(self.candidates):
+            if path not in seen:
+                del self.candidates[path]
+
+        stable.sort(key=lambda item: self.candidates[item[0]][1])
+        return stable
+
+    def _collect(self, done):
+        for future in done:
+            path, fingerprint = self.in_flight.pop(future)
+            self.candidates.pop(path, None)
+            try:
+                summary = future.result()
+            except Exception as e:
+                attempts = self.ledger.attempts(path, fingerprint) + 1
+                if attempts < self.max_attempts:
+                    delay = self.retry_backoff * 2 ** (attempts - 1)
+                    logger.error("Failed to analyze %s (attempt %d of %d, retrying in %.0fs): %s", path, attempts,
+                                 self.max_attempts, delay, e)
+                    retry_at = time.time() + delay
+                else:
+                    logger.error("Failed to analyze %s (giving up after %d attempts): %s", path, attempts, e)
+                    retry_at = None
+                self.ledger.record(path, fingerprint, 'failed', error=str(e), attempts=attempts, retry_at=retry_at)
+                BUNDLES_PROCESSED.labels(status='failed').inc()
+            else:
+                logger.info("Analyzed %s: %d PDFs, %d missing files -> %s", path,
+                            summary['total_pdf_files'], summary['missing_files'], summary['report_path'])
+                if summary['incomplete_files']:
+                    logger.warning("Not fully analyzed in %s: %s", path, ", ".join(summary['incomplete_files']))
+                self.ledger.record(path, fingerprint, 'done', report_path=summary['report_path'])
+                BUNDLES_PROCESSED.labels(status='done').inc()
+                # The analysis ran in a pool process; fold its figures into this process's metrics
+                for file_perf in summary['perf']['files']:
+                    record_file_metrics(file_perf)
+                record_run_metrics(summary['perf'])
+        BUNDLES_IN_FLIGHT.set(len(self.in_flight))
+        if done and self.metrics_file:
+            REGISTRY.write_to_file(self.metrics_file)
+
+    def run(self):
+        """Main loop: scan, submit within the pending limit, and collect finished bundles"""
+        logger.info("Watching %s with %d workers (%s)", self.directory, self.workers,
+                    "inotify" if self.waker.available else "polling")
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_sigint) as pool:
+            try:
+                while not self._stopping:
+                    stable = self.scan()
+
+                    # Backpressure: leave the rest on disk until capacity frees up
+                    capacity = max(self.max_pending - len(self.in_flight), 0)
+                    for path, fingerprint in stable[:capacity]:
+                        logger.info("Queued %s", path)
+                        future = pool.submit(process_bundle, path, self.memory_budget_mb, self.max_files_per_worker,
+                                             self.results_db)
+                        self.in_flight[future] = (path, fingerprint)
+                    BUNDLES_IN_FLIGHT.set(len(self.in_flight))
+                    BUNDLE_BACKLOG.set(max(len(stable) - capacity, 0))
+                    if len(stable) > capacity:
+                        logger.warning("Backlog of %d stable bundles waiting for capacity",
+                                       len(stable) - capacity)
+
+                    if self.in_flight:
+                        done, _ = wait(list(self.in_flight), timeout=self.poll_interval,
+                                       return_when=FIRST_COMPLETED)
+                        self._collect(done)
+                    else:
+                        # Recheck sooner while candidates are settling
+                        timeout = min(self.poll_interval, self.settle_seconds) if self.candidates else self.poll_interval
+                        self.waker.wait(timeout)
+            except KeyboardInterrupt:
+                logger.info("Stopping; waiting for %d running analyses", len(self.in_flight))
+                self._collect(wait(list(self.in_flight)).done)
+            finally:
+                self.waker.close()
+                self.ledger.close()
+
+    def stop(self):
+        self._stopping = True
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Watch a folder and analyze incoming financial ZIP bundles")
+    parser.add_argument("directory", help="Intake directory to watch for ZIP files")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Number of bundles analyzed in parallel")
+    parser.add_argument("--poll-interval", type=float, default=5.0,
+                        help="Seconds between directory scans")
+    parser.add_argument("--settle", type=float, default=10.0,
+                        help="Seconds a ZIP must stay unchanged before it is analyzed")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Maximum bundles queued in the pool (default: 2 x workers)")
+    parser.add_argument("--ledger", default=None,
+                        help=f"Ledger database path (default: <directory>/{LEDGER_FILENAME})")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this local port")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Rewrite metrics in Prometheus text format to this file after each bundle")
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help="Skip a PDF whose parse grows past this RSS (default: FDA_MEMORY_BUDGET_MB)")
+    parser.add_argument("--max-files-per-worker", type=int, default=None,
+                        help="Replace each parse worker after this many PDFs (default: FDA_MAX_FILES_PER_WORKER)")
+    parser.add_argument("--results-db", default=os.environ.get('FDA_RESULTS_DB'),
+                        help="Also store every analysis in this results database (default: FDA_RESULTS_DB)")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="Tries per bundle before a failure is left until the file changes")
+    parser.add_argument("--retry-backoff", type=float, default=DEFAULT_RETRY_BACKOFF,
+                        help="Seconds before the first retry of a failed bundle, doubled for each further one")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    FolderWatcher(args.directory, workers=args.workers, poll_interval=args.poll_interval,
+                  settle_seconds=args.settle, max_pending=args.max_pending,
+                  ledger_path=args.ledger, metrics_file=args.metrics_file,
+                  memory_budget_mb=args.memory_budget_mb, max_files_per_worker=args.max_files_per_worker,
+                  results_db=args.results_db, max_attempts=args.max_attempts,
+                  retry_backoff=args.retry_backoff).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+# Financial Document Analyzer - Supervised Worker Pool
+# Purpose: Process pool for PDF parsing that watches each worker's memory and deadlines and can
+#          kill and replace a single worker, so one pathological PDF fails on its own instead of
+#          stalling or taking the whole run (or the Streamlit process) down with it
+
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from multiprocessing.connection import wait
+from typing import Any, Deque, List, Optional
+
+from metrics import REGISTRY
+
+WORKERS_RECYCLED = REGISTRY.counter('fda_worker_recycles_total', 'Parse workers retired or killed by the pool', ['reason'])
+
+DEFAULT_POLL_INTERVAL = 0.1
+# Seconds an interrupted task gets to stop at a heartbeat before its worker is killed
+DEFAULT_CANCEL_GRACE = 5.0
+
+
+# Set in child processes: the pipe back to the pool, used by heartbeat()
+_worker_conn = None
+
+
+class WorkerLost(Exception):
+    """The worker process running a task exited before returning a result"""
+
+    def __init__(self, message: str, pid: int = 0):
+        super().__init__(message)
+        self.pid = pid
+        # Heartbeat payloads the task sent before it was lost, in order
+        self.progress: List[Any] = []
+
+
+class MemoryBudgetExceeded(WorkerLost):
+    """The worker running a task grew past the pool's memory budget and was killed"""
+
+    def __init__(self, pid: int, rss_bytes: int, budget_bytes: int):
+        super().__init__(f"worker {pid} used {rss_bytes / 1024 ** 2:.0f} MB "
+                         f"(budget {budget_bytes / 1024 ** 2:.0f} MB)", pid)
+        self.rss_bytes = rss_bytes
+        self.budget_bytes = budget_bytes
+
+    def __reduce__(self):
+        return type(self), (self.pid, self.rss_bytes, self.budget_bytes)
+
+
+class TaskTimeout(WorkerLost):
+    """The task ran past its deadline, or went too long without a heartbeat, and its worker was killed"""
+
+    def __init__(self, pid: int, seconds: float, heartbeat: bool):
+        what = "no heartbeat" if heartbeat else "running"
+        super().__init__(f"worker {pid} killed after {seconds:.1f}s {what}", pid)
+        self.seconds = seconds
+        self.heartbeat = heartbeat
+
+    def __reduce__(self):
+        return type(self), (self.pid, self.seconds, self.heartbeat)
+
+
+class TaskCancelled(Exception):
+    """The task was interrupted (WorkerPool.interrupt) while it was running"""
+
+
+def heartbeat(payload: Any = None):
+    """Report progress from inside a pool task; this restarts the task's heartbeat timeout
+
+    Payloads are kept by the pool and attached to the exception if the task is lost.
+    Raises TaskCancelled if the pool has been asked to interrupt the task.
+    Outside a WorkerPool worker this does nothing.
+    """
+    if _worker_conn is not None:
+        _worker_conn.send(('progress', payload))
+        if _worker_conn.poll() and _worker_conn.recv() == 'cancel':
+            raise TaskCancelled("task interrupted")
+
+
+def process_rss(pid: int) -> int:
+    """Resident set size of a process in bytes (0 where /proc is unavailable)"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        return 0
+
+
+def _worker_main(conn, initializer):
+    """Child process loop: run tasks from the pipe until told to stop"""
+    global _worker_conn
+    _worker_conn = conn
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer()
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        if task == 'cancel':
+            # The interrupted task finished before it reached a heartbeat
+            continue
+        fn, args, kwargs = task
+        try:
+            message = ('ok', fn(*args, **kwargs))
+        except BaseException as e:
+            message = ('error', e)
+        try:
+            conn.send(message)
+        except Exception as e:
+            # The result or exception could not be pickled
+            conn.send(('error', RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Task:
+    """A queued call with its future and optional limits"""
+
+    __slots__ = ('future', 'fn', 'args', 'kwargs', 'timeout', 'heartbeat_timeout')
+
+    def __init__(self, future: Future, fn, args: tuple, kwargs: dict,
+                 timeout: Optional[float] = None, heartbeat_timeout: Optional[float] = None):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self.heartbeat_timeout = heartbeat_timeout
+
+
+class _Worker:
+    """Parent-side handle for one child process and the task it is running"""
+
+    def __init__(self, context, initializer):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, initializer), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task: Optional[_Task] = None
+        self.tasks_done = 0
+        self.started = 0.0
+        self.last_beat = 0.0
+        self.cancel_requested: Optional[float] = None
+        self.progress: List[Any] = []
+
+    def assign(self, task: _Task):
+        self.conn.send((task.fn, task.args, task.kwargs))
+        self.task = task
+        self.started = self.last_beat = time.monotonic()
+        self.cancel_requested = None
+        self.progress = []
+
+    def overdue(self, now: float) -> Optional[Exception]:
+        """The timeout error for the running task if it has passed a deadline"""
+        task = self.task
+        if task.timeout and now - self.started > task.timeout:
+            return TaskTimeout(self.pid, now - self.started, heartbeat=False)
+        if task.heartbeat_timeout and now - self.last_beat > task.heartbeat_timeout:
+            return TaskTimeout(self.pid, now - self.last_beat, heartbeat=True)
+        return None
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def stop(self, timeout: float = 1.0):
+        """Ask the child to exit, killing it if it does not"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool(Executor):
+    """
+    Executor running each task in a supervised child process.
+    A supervisor thread samples the RSS of busy workers; a worker that crosses memory_budget_bytes
+    is killed, its task fails with MemoryBudgetExceeded and a fresh worker takes over the queue.
+    Tasks submitted with submit_with_timeout() are killed the same way (TaskTimeout) once they run
+    too long or stop sending heartbeats.
+    interrupt() stops a single task: a queued one is cancelled, a running one raises TaskCancelled
+    at its next heartbeat (its worker is killed if it does not get there within cancel_grace).
+    Workers are also replaced after max_tasks_per_worker tasks to limit heap fragmentation growth.
+    Memory enforcement needs /proc (Linux); elsewhere only timeouts and recycling apply.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, memory_budget_bytes: Optional[int] = None,
+                 max_tasks_per_worker: Optional[int] = None, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 initializer=None, mp_context=None, cancel_grace: float = DEFAULT_CANCEL_GRACE):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.memory_budget_bytes = memory_budget_bytes or None
+        self.max_tasks_per_worker = max_tasks_per_worker or None
+        self.poll_interval = poll_interval
+        self.cancel_grace = cancel_grace
+        self._initializer = initializer
+        self._context = mp_context or multiprocessing.get_context()
+        self._queue: Deque[_Task] = deque()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._wake_reader, self._wake_writer = multiprocessing.Pipe(duplex=False)
+        self._supervisor: Optional[threading.Thread] = None
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.submit_with_timeout(None, None, fn, *args, **kwargs)
+
+    def submit_with_timeout(self, timeout: Optional[float], heartbeat_timeout: Optional[float],
+                            fn, /, *args, **kwargs) -> Future:
+        """Schedule fn(*args, **kwargs), killing its worker after `timeout` seconds of running
+        or `heartbeat_timeout` seconds without a heartbeat() (None for no limit)"""
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new tasks after shutdown")
+            self._queue.append(_Task(future, fn, args, kwargs, timeout, heartbeat_timeout))
+            if self._supervisor is None:
+                self._supervisor = threading.Thread(target=self._supervise, name="worker-pool", daemon=True)
+                self._supervisor.start()
+        self._wake()
+        return future
+
+    def interrupt(self, future: Future) -> bool:
+        """Stop the task behind future, freeing its worker for the queue
+
+        Returns False if the task has already finished.
+        """
+        if future.cancel():
+            return True
+        with self._lock:
+            worker = next((worker for worker in self._workers
+                           if worker.task is not None and worker.task.future is future), None)
+            if worker is None:
+                return False
+            if worker.cancel_requested is None:
+                worker.cancel_requested = time.monotonic()
+                try:
+                    worker.conn.send('cancel')
+                except (OSError, ValueError):
+                    pass
+        self._wake()
+        return True
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while self._queue:
+                    self._queue.popleft().future.cancel()
+            supervisor = self._supervisor
+        self._wake()
+        if wait and supervisor is not None:
+            supervisor.join()
+
+    def _wake(self):
+        try:
+            self._wake_writer.send_bytes(b'')
+        except OSError:
+            pass
+
+    def _supervise(self):
+        while True:
+            with self._lock:
+                busy = [worker for worker in self._workers if worker.task is not None]
+                if self._shutdown and not self._queue and not busy:
+                    break
+                self._dispatch()
+                busy = [worker for worker in self._workers if worker.task is not None]
+
+            waitables = [self._wake_reader] + [worker.conn for worker in busy] + [worker.process.sentinel for worker in busy]
+            ready = wait(waitables, timeout=self.poll_interval if busy else None)
+            if self._wake_reader in ready:
+                while self._wake_reader.poll():
+                    self._wake_reader.recv_bytes()
+
+            now = time.monotonic()
+            for worker in busy:
+                if worker.conn in ready or worker.process.sentinel in ready:
+                    self._collect(worker)
+                    continue
+                timeout = worker.overdue(now)
+                if timeout is not None:
+                    self._retire(worker, 'timeout', timeout)
+                elif worker.cancel_requested is not None and now - worker.cancel_requested > self.cancel_grace:
+                    self._retire(worker, 'cancelled', TaskCancelled(
+                        f"worker {worker.pid} killed {self.cancel_grace:.0f}s after the task was interrupted"))
+                elif self.memory_budget_bytes:
+                    rss = process_rss(worker.pid)
+                    if rss > self.memory_budget_bytes:
+                        self._retire(worker, 'memory_budget',
+                                     MemoryBudgetExceeded(worker.pid, rss, self.memory_budget_bytes))
+
+        for worker in list(self._workers):
+            worker.stop()
+        self._workers.clear()
+
+    def _dispatch(self):
+        """Hand queued tasks to idle workers, starting new ones up to max_workers (lock held)"""
+        for worker in [worker for worker in self._workers if worker.task is None and not worker.process.is_alive()]:
+            self._workers.remove(worker)
+            WORKERS_RECYCLED.labels(reason='exited').inc()
+
+        while self._queue:
+            idle = next((worker for worker in self._workers if worker.task is None), None)
+            if idle is None:
+                if len(self._workers) >= self.max_workers:
+                    return
+                idle = _Worker(self._context, self._initializer)
+                self._workers.append(idle)
+
+            task = self._queue.popleft()
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            try:
+                idle.assign(task)
+            except Exception as e:
+                task.future.set_exception(e)
+
+    def _collect(self, worker: _Worker):
+        """Record a heartbeat or deliver a finished task's result, or fail the task if the worker died"""
+        future = worker.task.future
+        try:
+            status, value = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join()
+            self._retire(worker, 'exited', WorkerLost(
+                f"worker {worker.pid} exited with code {worker.process.exitcode}", worker.pid))
+            return
+
+        if status == 'progress':
+            worker.progress.append(value)
+            worker.last_beat = time.monotonic()
+            return
+
+        worker.task = None
+        worker.progress = []
+        worker.tasks_done += 1
+        if status == 'ok':
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+        if self.max_tasks_per_worker and worker.tasks_done >= self.max_tasks_per_worker:
+            self._retire(worker, 'max_tasks')
+        elif self.memory_budget_bytes and process_rss(worker.pid) > self.memory_budget_bytes:
+            # The task finished between samples, but the worker kept the memory
+            self._retire(worker, 'memory_budget')
+
+    def _retire(self, worker: _Worker, reason: str, error: Optional[Exception] = None):
+        """Remove a worker from the pool, failing its current task with error"""
+        with self._lock:
+            self._workers.remove(worker)
+        if error is not None:
+            worker.kill()
+            error.progress = worker.progress
+            worker.task.future.set_exception(error)
+            worker.task = None
+        else:
+            worker.stop()
+        WORKERS_RECYCLED.labels(reason=reason).inc()